@@ -26,21 +26,57 @@
 
 # Jan 2015
 """
+import time
+IMPORT_START = time.time()  # to measure how long the imports take
 import smbus
 import sys
+import os
+import socket
 #import getopt
 import pigpio
-import time
 from datetime import datetime
-from webcolors import name_to_rgb
-import pygame
-from pygame.locals import Rect, QUIT, KEYDOWN, K_q, K_ESCAPE
+# pygame and webcolors are only imported when the display or the music
+# player is brought up; see import_pygame()
 import random
-from omron_src import omron_init    # contains omron functions
-from omron_src import omron_read    # contains omron functions
+import json
+from collections import deque
+from raspbot_watchdog import SensorWatchdog  # reads the omron sensor
+from raspbot_output import PigpioOutput  # servo and LEDs through pigpio
+from raspbot_leds import LedAnimator, blink, alternate, PRIORITY_STATUS, \
+                         PRIORITY_REMINDER, PRIORITY_WARNING, PRIORITY_PANIC
 #import urllib, pycurl, os           # needed for text to speech
 from pid import PID
-from raspbot_functions import getCPUtemperature, fahrenheit_to_rgb, speakSpeechFromText
+from raspbot_functions import fahrenheit_to_rgb
+from raspbot_state import PersonContext, DetectionParams, RobotActions, \
+                          resolve_new_position, STATE_NAMES
+from raspbot_record import FrameRecorder
+from raspbot_sensors import ThermalSensor, SensorArray, fuse, \
+                            warmest_bearing
+from raspbot_boot import BootSequencer, IMPORT_TIMES, timed_import
+from raspbot_runtime import Runtime
+from raspbot_realtime import monotonic, sleep_until, set_fifo, isolate
+from raspbot_thermal import CPUThermometer, ThermalGovernor
+from raspbot_search import SearchPlanner
+from raspbot_panorama import Panorama
+from raspbot_tracker import Tracker
+from raspbot_presence import PresenceEstimator, frame_evidence, HELLO, \
+                             GOODBYE
+from raspbot_tts import PhraseCache, make_backend, phrase_parts, \
+                        template_fragments
+from raspbot_calibration import Calibration, load_calibration, \
+     save_calibration, pixel_calibration, find_center
+from raspbot_config import Config, ConfigWatcher, load_config, \
+                           SETTINGS_BY_NAME
+from raspbot_control import ControlServer
+from raspbot_journal import JournalWriter, EVENT_START, EVENT_STOP, \
+                            EVENT_HELLO, EVENT_GOODBYE, EVENT_BURN, \
+                            EVENT_CPU, EVENT_SENSOR_ERROR
+from raspbot_occupancy import OccupancyStats, load_occupancy
+from raspbot_export import Exporter
+from raspbot_frame import FramePool
+IMPORT_TIME = time.time() - IMPORT_START
+pygame = None           # see import_pygame()
+name_to_rgb = None
 
 # GPIO assignments for the hit LEDs (three colors, red, yellow, green)
 #   red = burn hazard (hit_array[x] > 4
@@ -90,6 +126,25 @@ def debug_print(message):
         print now_string+': '+message
     LOGFILE_HANDLE.write('\r\n'+now_string+': '+message)
     
+def set_led(pin, state):
+    """
+    Turn an LED on or off (LED pins are header pin numbers)
+    """
+    if OUTPUT is not None:
+        OUTPUT.write(pin, state)
+
+def show_hits(hit_array):
+    """
+    Light each column's LED: yellow for a possible person (one hit),
+    green for a probable person (2 to 4) and red for a burn hazard
+    """
+    for (hits, (red, yellow, green)) in \
+            zip(hit_array, (LED0_COLOR_SET, LED1_COLOR_SET, \
+                            LED2_COLOR_SET, LED3_COLOR_SET)):
+        set_led(red, LED_ON if hits > 4 else LED_OFF)
+        set_led(yellow, LED_ON if hits == 1 else LED_OFF)
+        set_led(green, LED_ON if 2 <= hits <= 4 else LED_OFF)
+
 def print_temps(temp_list):
     """
     Display each element's temperature in F
@@ -105,40 +160,55 @@ def print_temps(temp_list):
 
 def set_servo_to_position (new_position):
     """
-    Moves the servo to a new position
+    Moves the servo to a new position; returns the position it was sent
+    to, which is also returned when the servo is disabled
     """
+    global SERVO_STOP
 
-    if SERVO_ENABLED:
+# a move cancels a pending stop
+    if SERVO_ENABLED and SERVO_STOP is not None:
+        SERVO_STOP.cancel()
+        SERVO_STOP = None
     # make sure we don't go out of bounds
-        if SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE:
-            if new_position == 0:
-                new_position = CTR_SERVO_POSITION
-            elif new_position < MAX_SERVO_POSITION:
-                new_position = MAX_SERVO_POSITION
-            elif new_position > MIN_SERVO_POSITION:
-                new_position = MIN_SERVO_POSITION
-        else:
-            if new_position == 0:
-                new_position = CTR_SERVO_POSITION
-            elif new_position < MIN_SERVO_POSITION:
-                new_position = MIN_SERVO_POSITION
-            elif new_position > MAX_SERVO_POSITION:
-                new_position = MAX_SERVO_POSITION
-
-        # if there is a remainder, make 10us increments
-        if (new_position%MINIMUM_SERVO_GRANULARITY < 5):
-            final_position = \
-            (new_position//MINIMUM_SERVO_GRANULARITY) \
-            *MINIMUM_SERVO_GRANULARITY
-        else:
-            final_position = \
-            ((new_position//MINIMUM_SERVO_GRANULARITY)+1) \
-            *MINIMUM_SERVO_GRANULARITY
+    if SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE:
+        if new_position == 0:
+            new_position = CTR_SERVO_POSITION
+        elif new_position < MAX_SERVO_POSITION:
+            new_position = MAX_SERVO_POSITION
+        elif new_position > MIN_SERVO_POSITION:
+            new_position = MIN_SERVO_POSITION
+    else:
+        if new_position == 0:
+            new_position = CTR_SERVO_POSITION
+        elif new_position < MIN_SERVO_POSITION:
+            new_position = MIN_SERVO_POSITION
+        elif new_position > MAX_SERVO_POSITION:
+            new_position = MAX_SERVO_POSITION
+
+    # if there is a remainder, make 10us increments
+    if (new_position%MINIMUM_SERVO_GRANULARITY < 5):
+        final_position = \
+        (new_position//MINIMUM_SERVO_GRANULARITY) \
+        *MINIMUM_SERVO_GRANULARITY
+    else:
+        final_position = \
+        ((new_position//MINIMUM_SERVO_GRANULARITY)+1) \
+        *MINIMUM_SERVO_GRANULARITY
 
+# without a servo the robot carries on as if the head had moved, so the
+# positions it keeps stay numbers
+    if SERVO_ENABLED:
         debug_print('SERVO_MOVE: '+str(final_position))
         SERVO_HANDLE.set_servo(SERVO_GPIO_PIN, final_position)
-           
-        return final_position
+
+    return final_position
+
+def stop_servo():
+    """
+    Stop sending servo pulses
+    """
+    if SERVO_ENABLED and SERVO_HANDLE is not None:
+        SERVO_HANDLE.stop_servo(SERVO_GPIO_PIN)
 
 # all the servo constants
 LOW_TO_HIGH_IS_COUNTERCLOCKWISE = 0
@@ -150,6 +220,9 @@ MINIMUM_SERVO_GRANULARITY = 10  # microseconds
 SERVO_CUR_DIR_CW = 1            # Direction to move the servo next
 SERVO_CUR_DIR_CCW = 2
 ROAMING_GRANULARTY = 50
+DEGREES_PER_US = 180.0/1700     # 600us to 2300us is about 180 degrees
+SENSOR_VIEW = 44.2              # degrees the D6T-44L sees across
+WARM_MEMORY = 10.0              # seconds heat seen elsewhere is looked for
 # Strange things happen: Some servos move CW and others move CCW for the
 # same number. # it is possible that the "front" of the servo might be
 # treated differently and it seams that the colors of the wires on the
@@ -174,129 +247,6 @@ MOVE_DIST_SHORT = 100
 MOVE_DIST_MEDIUM = 170       
 MOVE_DIST_FAR = 240       
 
-def resolve_new_position(move_cw, servo_pos, move_distance):
-        if (move_cw):
-            if SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE:
-                new_position = servo_pos + move_distance
-            else:
-                new_position = servo_pos - move_distance
-        else:
-            if SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE:
-                new_position = servo_pos - move_distance
-            else:
-                new_position = servo_pos + move_distance
-
-        return new_position
-    
-def person_position_1_hit(hit_array_1, s_position):
-    """
-    Detect a persons presence using "greater than one algorithm"
-    returns (TRUE if person detected, approximate person position)
-    """
-    person_det_1 = True
-    person_pos_1 = s_position
-    move_dist_1 = 0
-    move_cw_1 = True
-
-    if (hit_array_1[1] >= 1 and hit_array_1[2] >= 1):
-        # person is centered
-        move_dist_1 = 0
-    elif (hit_array_1[0] == 0 and hit_array_1[1] == 0 and \
-          hit_array_1[2] == 0 and hit_array_1[3] >= 1):
-        move_dist_1 = MOVE_DIST_FAR
-        move_cw_1 = False
-    elif (hit_array_1[0] == 0 and hit_array_1[1] == 0 and \
-          hit_array_1[2] >= 1 and hit_array_1[3] == 0):
-        move_dist_1 = MOVE_DIST_SHORT
-        move_cw_1 = False
-    elif (hit_array_1[0] == 0 and hit_array_1[1] >= 1 and \
-          hit_array_1[2] == 0 and hit_array_1[3] == 0):
-        move_dist_1 = MOVE_DIST_SHORT
-        move_cw_1 = True
-    elif (hit_array_1[0] >= 1 and hit_array_1[1] == 0 and \
-          hit_array_1[2] == 0 and hit_array_1[3] == 0):
-        move_dist_1 = MOVE_DIST_FAR
-        move_cw_1 = True
-    elif (hit_array_1[0] == 0 and hit_array_1[1] == 0 and \
-          hit_array_1[2] >= 1 and hit_array_1[3] >= 1):
-        move_dist_1 = MOVE_DIST_MEDIUM
-        move_cw_1 = False
-    elif (hit_array_1[0] >= 1 and hit_array_1[1] >= 1 and \
-          hit_array_1[2] == 0 and hit_array_1[3] == 0):
-        move_dist_1 = MOVE_DIST_MEDIUM
-        move_cw_1 = True
-    elif (hit_array_1[0] == 0 and hit_array_1[1] >= 1 and \
-          hit_array_1[2] >= 1 and hit_array_1[3] >= 1):
-        move_dist_1 = MOVE_DIST_CLOSE
-        move_cw_1 = False
-    elif (hit_array_1[0] >= 1 and hit_array_1[1] >= 1 and \
-          hit_array_1[2] >= 1 and hit_array_1[3] == 0):
-        move_dist_1 = MOVE_DIST_CLOSE
-        move_cw_1 = True
-    else:
-        # no person detected
-        person_det_1 = False
-
-    if (move_dist_1 > 0):
-        person_pos_1 = resolve_new_position(move_cw_1, s_position, move_dist_1)
-
-    debug_print('person_position_1: Pos: '+str(person_pos_1)+ \
-                ' Det: '+str(person_det_1))
-
-    return (person_det_1, person_pos_1)
-
-def person_position_2_hit(hit_array_2, s_position):
-    """
-    Detect a persons presence using the "greater than two algorithm"
-    returns (TRUE if person detected, approximate person position)
-    """
-    person_det_2 = True
-    person_pos_2 = s_position
-    move_dist_2 = 0
-    move_cw_2 = True
-
-# First, look for > two hits in a single column
-    if (hit_array_2[1] >= 2 and hit_array_2[2] >= 2):
-        # person already in center
-        move_dist_2 = 0
-    elif (hit_array_2[0] >= 2 and hit_array_2[1] <= 1 and \
-          hit_array_2[2] <= 1 and hit_array_2[3] <= 1):
-        move_dist_2 = MOVE_DIST_FAR
-        move_cw_2 = True
-# Sometimes a stationary person can show up 0200 and 0020 alternatively
-# without moving causing the robot to oscillate
-##    elif (hit_array_2[0] <= 1 and hit_array_2[1] >= 2 and \
-##          hit_array_2[2] <= 1 and hit_array_2[3] <= 1):
-##        move_dist_2 = MOVE_DIST_SHORT
-##        move_cw_2 = True
-##    elif (hit_array_2[0] <= 1 and hit_array_2[1] <= 1 and \
-##          hit_array_2[2] >= 2 and hit_array_2[3] <= 1):
-##        move_dist_2 = MOVE_DIST_SHORT
-##        move_cw_2 = False
-    elif (hit_array_2[0] <= 1 and hit_array_2[1] <= 1 and \
-          hit_array_2[2] <= 1 and hit_array_2[3] >= 2):
-        move_dist_2 = MOVE_DIST_FAR
-        move_cw_2 = False
-    elif (hit_array_2[0] >= 2 and hit_array_2[1] >= 2 and \
-          hit_array_2[2] <= 1 and hit_array_2[3] <= 1):
-        move_dist_2 = MOVE_DIST_CLOSE
-        move_cw_2 = True
-    elif (hit_array_2[0] <= 1 and hit_array_2[1] <= 1 and \
-          hit_array_2[2] >= 2 and hit_array_2[3] >= 2):
-        move_dist_2 = MOVE_DIST_CLOSE
-        move_cw_2 = False
-    else:
-        # no person detected
-        person_det_2 = False
-
-    if (move_dist_2 > 0):
-        person_pos_2 = resolve_new_position(move_cw_2, s_position, move_dist_2)
-
-    debug_print('person_position_2: Pos: '+str(person_pos_2)+ \
-                ' Det: '+str(person_det_2))
-
-    return (person_det_2, person_pos_2)
-
 def move_head(position, servo_pos):
     """
     Move the robot head to a specific position
@@ -322,10 +272,12 @@ def move_head(position, servo_pos):
                            
         new_servo_pos = set_servo_to_position(servo_pos)
 
-        #let the temp's settle
-        time.sleep(MEASUREMENT_WAIT_PERIOD*SETTLE_TIME)
+        #let the temp's settle before the next measurement
+        if SENSE_TASK is not None:
+            RUNTIME.defer(SENSE_TASK, MEASUREMENT_WAIT_PERIOD*(1+SETTLE_TIME))
 
         return new_servo_pos
+    return servo_pos
 
 LAST_KNOWN_LED_POS = 0  # counter keeps track of which LED to light
 LED_POS_MAX = 4
@@ -338,8 +290,9 @@ def servo_roam(roam_cnt, servo_pos, servo_dir, last_led, lit):
     """
     Puts the servo in roaming (person searching) mode
     """
+    global SERVO_STOP
     roam_cnt += 1
-    GPIO.output(lit, LED_OFF)
+    set_led(lit, LED_OFF)
     debug_print('Roam count = '+str(roam_cnt))
 
     if roam_cnt <= ROAM_MAX:
@@ -374,20 +327,16 @@ def servo_roam(roam_cnt, servo_pos, servo_dir, last_led, lit):
                                MIN_SERVO_POSITION)
 
         elif ROAM:
-            if servo_dir == SERVO_CUR_DIR_CCW:
-                debug_print('SERVO_ROAM Pos: '+ \
-                    str(servo_pos)+' Direction: CCW')
-                if SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE:
-                    servo_pos -= ROAMING_GRANULARTY
-                else:
-                    servo_pos += ROAMING_GRANULARTY
-            if servo_dir == SERVO_CUR_DIR_CW:
-                debug_print('SERVO_ROAM Pos: '+ \
-                    str(servo_pos)+' Direction: CW')
-                if SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE:
-                    servo_pos += ROAMING_GRANULARTY
-                else:
-                    servo_pos -= ROAMING_GRANULARTY
+# look where a person is most likely to be (see raspbot_search.py)
+            new_pos = SEARCH.next_position(servo_pos, time.time())
+            if (new_pos > servo_pos) == \
+               (SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE):
+                servo_dir = SERVO_CUR_DIR_CW
+            else:
+                servo_dir = SERVO_CUR_DIR_CCW
+            debug_print('SERVO_ROAM Pos: '+str(servo_pos)+' -> '+ \
+                        str(new_pos))
+            servo_pos = new_pos
 
         servo_pos = \
             set_servo_to_position(servo_pos)
@@ -402,7 +351,7 @@ def servo_roam(roam_cnt, servo_pos, servo_dir, last_led, lit):
         else:
             lit = LED3_YEL
 
-        GPIO.output(lit, LED_ON)
+        set_led(lit, LED_ON)
 
         if (servo_dir == SERVO_CUR_DIR_CW):
             last_led -= 1
@@ -416,34 +365,32 @@ def servo_roam(roam_cnt, servo_pos, servo_dir, last_led, lit):
         debug_print('last LED = '+str(last_led)+' lit LED = '+str(lit))
 
     else:
-# center the servo when roam max is hit
-        servo_pos = \
-            set_servo_to_position(CTR_SERVO_POSITION)
-
-        time.sleep(0.3)
-        if SERVO_ENABLED:
-            SERVO_HANDLE.stop_servo(SERVO_GPIO_PIN)
-
-        GPIO.output(LED0_RED, LED_OFF)
-        GPIO.output(LED1_RED, LED_OFF)
-        GPIO.output(LED2_RED, LED_OFF)
-        GPIO.output(LED3_RED, LED_OFF)
-        GPIO.output(LED0_YEL, LED_OFF)
-        GPIO.output(LED1_YEL, LED_OFF)
-        GPIO.output(LED2_YEL, LED_OFF)
-        GPIO.output(LED3_YEL, LED_OFF)
-        GPIO.output(LED0_GRN, LED_OFF)
-        GPIO.output(LED1_GRN, LED_OFF)
-        GPIO.output(LED2_GRN, LED_OFF)
-        GPIO.output(LED3_GRN, LED_OFF)
+# center the servo when roam max is hit and stop it once it is there
+        if SERVO_STOP is None:
+            servo_pos = \
+                set_servo_to_position(CTR_SERVO_POSITION)
+            SERVO_STOP = RUNTIME.call_later(0.3, stop_servo, 'servo-stop')
+
+        set_led(LED0_RED, LED_OFF)
+        set_led(LED1_RED, LED_OFF)
+        set_led(LED2_RED, LED_OFF)
+        set_led(LED3_RED, LED_OFF)
+        set_led(LED0_YEL, LED_OFF)
+        set_led(LED1_YEL, LED_OFF)
+        set_led(LED2_YEL, LED_OFF)
+        set_led(LED3_YEL, LED_OFF)
+        set_led(LED0_GRN, LED_OFF)
+        set_led(LED1_GRN, LED_OFF)
+        set_led(LED2_GRN, LED_OFF)
+        set_led(LED3_GRN, LED_OFF)
 
 # Start roaming again if no action
         if roam_cnt >= ROAM_MAX*20:
             roam_cnt = 0
-            GPIO.output(LED0_GRN, LED_OFF)
-            GPIO.output(LED1_GRN, LED_OFF)
-            GPIO.output(LED2_GRN, LED_OFF)
-            GPIO.output(LED3_GRN, LED_OFF)
+            set_led(LED0_GRN, LED_OFF)
+            set_led(LED1_GRN, LED_OFF)
+            set_led(LED2_GRN, LED_OFF)
+            set_led(LED3_GRN, LED_OFF)
 
     return roam_cnt, servo_pos, servo_dir, last_led, lit
 
@@ -495,110 +442,911 @@ def say_goodbye():
 
 def play_sound(volume, message):
     """
-    Play an mp3 file
+    Queue an mp3 file; the audio task plays it after the ones before it
     """
 # commented next line thinking that it might be causing the garbling
     # pygame.mixer.music.set_volume(volume)         
-    pygame.mixer.music.load(message)
-    pygame.mixer.music.play()
+    if MUTED:
+        return
+    if message not in AUDIO_QUEUE:      # already waiting to be played
+        AUDIO_QUEUE.append(message)
+
+def play_queued_sound():
+    """
+    Start the next queued sound once the mixer is free
+    """
+    if not AUDIO_QUEUE or not BOOT.started('audio'):
+        return
+    BOOT.require('audio')
 # this is not causing the garbling
-    while pygame.mixer.music.get_busy() == True:
-        continue
+    if pygame.mixer.music.get_busy():
+        return
+    pygame.mixer.music.load(AUDIO_QUEUE.popleft())
+    pygame.mixer.music.play()
+
+def say(phrase):
+    """
+    Speak a phrase from the TTS cache
+    A phrase that isn't cached yet is fetched in the background (when
+    connected) so it can be spoken next time; returns True if spoken
+    """
+    path = TTS_CACHE.get(phrase)
+    if path is None:
+        if CONNECTED or TTS_CACHE.backend.offline:
+            TTS_CACHE.prefetch([phrase])
+        return False
+    play_sound(MAX_VOLUME, path)
+    return True
+
+def say_number(template, number):
+    """
+    Speak a phrase with a number in it (template has a %d) by joining
+    cached fragments; returns True if spoken
+    """
+    path = TTS_CACHE.compose(phrase_parts(template, number))
+    if path is None:
+        return say(template % number)
+    play_sound(MAX_VOLUME, path)
+    return True
 
 def crash_and_burn(msg, py_game, servo_in, log_file):
     """
     Something bad happend; quit the program
     """
+    shut_down(msg, py_game, servo_in, log_file)
+    sys.exit()
+
+def shut_down(msg, py_game, servo_in, log_file):
+    """
+    Stop the servo, LEDs, display and control socket and close the log
+    """
 # doing a print here makes sure that the stdout gets a message
     print(msg)
     debug_print(msg)
-    if SERVO_ENABLED:
+    if CONTROL is not None:
+        CONTROL.close()
+    if JOURNAL is not None:
+        journal(EVENT_STOP)
+        JOURNAL.close()
+    save_occupancy()
+    if SERVO_ENABLED and servo_in is not None:
         servo_in.stop_servo(SERVO_GPIO_PIN)
-    GPIO.output(LED_GPIO_PIN, LED_OFF)
-    GPIO.output(LED0_RED, LED_OFF)
-    GPIO.output(LED0_YEL, LED_OFF)
-    GPIO.output(LED0_GRN, LED_OFF)
-    GPIO.output(LED1_RED, LED_OFF)
-    GPIO.output(LED1_YEL, LED_OFF)
-    GPIO.output(LED1_GRN, LED_OFF)
-    GPIO.output(LED2_RED, LED_OFF)
-    GPIO.output(LED2_YEL, LED_OFF)
-    GPIO.output(LED2_GRN, LED_OFF)
-    GPIO.output(LED3_RED, LED_OFF)
-    GPIO.output(LED3_YEL, LED_OFF)
-    GPIO.output(LED3_GRN, LED_OFF)
-    py_game.quit()
-    PWM.cleanup()
+    LEDS.stop()
+    for led in [LED_GPIO_PIN]+ALL_RED_LEDS+ALL_YEL_LEDS+ALL_GRN_LEDS:
+        set_led(led, LED_OFF)
+    if py_game is not None:
+        py_game.quit()
+    if OUTPUT is not None:
+        OUTPUT.close()      # sends what is queued and stops the servo
+    if RECORDER is not None:
+        RECORDER.close()
+    if EXPORTER is not None:
+        EXPORTER.stop()     # a segment cut short is packed next run
     log_file.write(msg+' @ '+str(datetime.now()))
-    log_file.close
-    sys.exit()
+    log_file.close()
 
 def panic():
 # doing a print here makes sure that the stdout gets a message
     print('panic!')
     debug_print('Panic!')
-    GPIO.output(LED0_GRN, LED_OFF)
-    GPIO.output(LED1_GRN, LED_OFF)
-    GPIO.output(LED2_GRN, LED_OFF)
-    GPIO.output(LED3_GRN, LED_OFF)
-    GPIO.output(LED0_YEL, LED_OFF)
-    GPIO.output(LED1_YEL, LED_OFF)
-    GPIO.output(LED2_YEL, LED_OFF)
-    GPIO.output(LED3_YEL, LED_OFF)
-    if SERVO_ENABLED:
+    set_led(LED0_GRN, LED_OFF)
+    set_led(LED1_GRN, LED_OFF)
+    set_led(LED2_GRN, LED_OFF)
+    set_led(LED3_GRN, LED_OFF)
+    set_led(LED0_YEL, LED_OFF)
+    set_led(LED1_YEL, LED_OFF)
+    set_led(LED2_YEL, LED_OFF)
+    set_led(LED3_YEL, LED_OFF)
+    if SERVO_ENABLED and SERVO_HANDLE is not None:
         SERVO_HANDLE.stop_servo(SERVO_GPIO_PIN)
+# the red LEDs blink until the robot is restarted
+    LEDS.play(PANIC_PATTERN)
     while True:
-        GPIO.output(LED0_RED, LED_ON)
-        GPIO.output(LED1_RED, LED_ON)
-        GPIO.output(LED2_RED, LED_ON)
-        GPIO.output(LED3_RED, LED_ON)
-        time.sleep(0.3)
-        GPIO.output(LED0_RED, LED_OFF)
-        GPIO.output(LED1_RED, LED_OFF)
-        GPIO.output(LED2_RED, LED_OFF)
-        GPIO.output(LED3_RED, LED_OFF)
         time.sleep(0.3)
+        if not MONITOR:
+            continue
         for event in pygame.event.get():
-            if event.type == QUIT:
+            if event.type == pygame.QUIT:
                 CRASH_MSG = '\r\npygame event QUIT'
                 crash_and_burn(CRASH_MSG, pygame, SERVO_HANDLE, \
                                LOGFILE_HANDLE)
-            if event.type == KEYDOWN:
-                if event.key == K_q or event.key == K_ESCAPE:
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_q or event.key == pygame.K_ESCAPE:
                     CRASH_MSG = \
                     '\r\npygame event: keyboard q or esc pressed'
                     crash_and_burn(CRASH_MSG, pygame, \
                                    SERVO_HANDLE, LOGFILE_HANDLE)
 
+def boot_i2c():
+    """
+    Open the i2c bus
+    """
+    i2c_bus = smbus.SMBus(1)
+    time.sleep(0.1)                # Wait
+    return i2c_bus
+
+def boot_output():
+    """
+    Servo and LED output through the pigpio daemon
+    """
+    global OUTPUT
+    OUTPUT = PigpioOutput(BOOT.require('pigpio'))
+    return OUTPUT
+
+def boot_servo():
+    """
+    Start the servo and face directly forward
+    The output backend has RPIO.PWM.Servo's set_servo and stop_servo
+    """
+    servo = BOOT.require('output')
+    servo.set_servo(SERVO_GPIO_PIN, CTR_SERVO_POSITION)
+    return servo
+
+def boot_leds():
+    """
+    Heartbeat LED on, the hit LEDs off except green 0 (booting)
+    """
+    output = BOOT.require('output')
+    output.setup(LED_GPIO_PIN)
+    set_led(LED_GPIO_PIN, True)
+    for led in ALL_RED_LEDS+ALL_YEL_LEDS+ALL_GRN_LEDS:
+        output.setup(led)
+        set_led(led, LED_OFF)
+    set_led(LED0_GRN, LED_ON)
+
+def boot_sensor():
+    """
+    Initialize the Omron sensor(s)
+    returns (head handle, head result, failed sensors, SensorArray or None,
+             head sensor watchdog)
+    """
+    i2c_bus = BOOT.require('i2c')
+    pigpio_handle = BOOT.require('pigpio')
+    if not OMRON_SIDE_SENSORS:
+        watchdog = SensorWatchdog(pigpio_handle, RASPI_I2C_CHANNEL, i2c_bus, \
+                                  OMRON_1, DEGREE_UNIT, pigpio.pi, \
+                                  smbus.SMBus)
+        (handle, result) = watchdog.init()
+        return (handle, result, [], None, watchdog)
+    i2c_buses = {RASPI_I2C_CHANNEL: i2c_bus}
+    for sensor in OMRON_SIDE_SENSORS:
+        if sensor.bus not in i2c_buses:
+            i2c_buses[sensor.bus] = smbus.SMBus(sensor.bus)
+    head_sensor = ThermalSensor('head', RASPI_I2C_CHANNEL, 0.0, \
+                                OMRON_1_MUX_CHANNEL, address=OMRON_1)
+    sensor_array = SensorArray([head_sensor]+OMRON_SIDE_SENSORS, \
+                               pigpio_handle, i2c_buses, DEGREE_UNIT, \
+                               connect=pigpio.pi)
+    failed = sensor_array.init()
+    return (head_sensor.handle, head_sensor.result, failed, sensor_array, \
+            head_sensor.watchdog)
+
+def import_pygame():
+    """
+    pygame is only needed for the display and the music player
+    """
+    global pygame
+    pygame = timed_import('pygame')
+    return pygame
+
+def boot_audio():
+    """
+    Start the music player
+    """
+    import_pygame()
+    pygame.mixer.init()
+
+def boot_display():
+    """
+    Open the IR color window; SDL wants this on the main thread
+    """
+    global name_to_rgb
+    name_to_rgb = timed_import('webcolors').name_to_rgb
+    import_pygame()
+    pygame.display.init()
+    pygame.font.init()
+    font = pygame.font.Font(None, 36)
+    screen = pygame.display.set_mode(SCREEN_DIMENSIONS)
+    pygame.display.set_caption('IR temp array')
+    return (screen, font)
+
+def use_calibration(calibration):
+    """
+    Take the servo end points and center from a calibration
+    """
+    global MIN_SERVO_POSITION, MAX_SERVO_POSITION, CTR_SERVO_POSITION
+    global SERVO_LIMIT_CW, SERVO_LIMIT_CCW
+    MIN_SERVO_POSITION = calibration.min_servo
+    MAX_SERVO_POSITION = calibration.max_servo
+    CTR_SERVO_POSITION = calibration.ctr_servo
+    if SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE:
+        SERVO_LIMIT_CW = MIN_SERVO_POSITION
+        SERVO_LIMIT_CCW = MAX_SERVO_POSITION
+    else:
+        SERVO_LIMIT_CW = MAX_SERVO_POSITION
+        SERVO_LIMIT_CCW = MIN_SERVO_POSITION
+
+def use_config(config):
+    """
+    Take the switches, thresholds, timings, sound clips and PID gains
+    from a configuration (see raspbot_config.py)
+    """
+    global CONFIG, DEBUG, ROAM, RAND, SERVO_ENABLED, MONITOR, RECORD
+    global CALIBRATE, REALTIME, MEASUREMENT_WAIT_PERIOD, SETTLE_TIME
+    global ROAM_MAX, LOG_MAX, PERSON_TEMP_THRESHOLD, BURN_HAZARD_TEMP
+    global MAX_VOLUME, CPU_105_ON, HELLO_FILE_NAME, AFTER_HELLO_FILE_NAME
+    global GOODBYE_FILE_NAME, BADGE_FILE_NAME, BURN_FILE_NAME
+    global STRETCH_FILE_NAME, CPU_FILE_NAMES
+    CONFIG = config
+    DEBUG = config.debug
+    ROAM = config.roam
+    RAND = config.rand
+    SERVO_ENABLED = config.servo_enabled
+    MONITOR = config.monitor
+    RECORD = config.record
+    CALIBRATE = config.calibrate
+    REALTIME = config.realtime
+    MEASUREMENT_WAIT_PERIOD = config.measurement_wait_period
+    SETTLE_TIME = config.settle_time
+    ROAM_MAX = config.roam_max
+    LOG_MAX = config.log_max
+    PERSON_TEMP_THRESHOLD = config.person_temp_threshold
+    BURN_HAZARD_TEMP = config.burn_hazard_temp
+    MAX_VOLUME = config.max_volume
+    CPU_105_ON = config.cpu_105_on
+    HELLO_FILE_NAME = config.sound('hello_sound')
+    AFTER_HELLO_FILE_NAME = config.sound('after_hello_sound')
+    GOODBYE_FILE_NAME = config.sound('goodbye_sound')
+    BADGE_FILE_NAME = config.sound('badge_sound')
+    BURN_FILE_NAME = config.sound('burn_sound')
+    STRETCH_FILE_NAME = config.sound('stretch_sound')
+# the clip played on reaching each thermal level (see raspbot_thermal.py)
+    CPU_FILE_NAMES = {'warm': config.sound('cpu_105_sound'), \
+                      'render': config.sound('cpu_110_sound'), \
+                      'sample': config.sound('cpu_115_sound'), \
+                      'quiet': config.sound('cpu_120_sound'), \
+                      'roam': config.sound('cpu_125_sound')}
+
+# the running loop's objects, once they exist
+    if DETECTION_PARAMS is not None:
+        DETECTION_PARAMS.person_temp_threshold = PERSON_TEMP_THRESHOLD
+        DETECTION_PARAMS.burn_hazard_temp = BURN_HAZARD_TEMP
+    if TRACKER is not None:
+        TRACKER.threshold = PERSON_TEMP_THRESHOLD
+    if PID_CONTROLLER is not None:
+        PID_CONTROLLER.Kp = config.kp
+        PID_CONTROLLER.Ki = config.ki
+        PID_CONTROLLER.Kd = config.kd
+    if SENSE_TASK is not None:
+        SENSE_TASK.period = \
+            MEASUREMENT_WAIT_PERIOD*GOVERNOR.level.sense_scale
+        SENSE_TASK.deadline = SENSE_TASK.period
+    if HEARTBEAT_TASK is not None:
+        HEARTBEAT_TASK.period = MEASUREMENT_WAIT_PERIOD
+
+def reload_config(config, changed):
+    """
+    Apply a changed config file to the running robot; the watcher calls
+    this between two tasks so no frame sees half of it
+    """
+    use_config(config)
+    debug_print('Config changed: '+', '.join(changed))
+    LOGFILE_HANDLE.write('\r\nConfig changed: '+', '.join(changed))
+
+def calibration_frames(count):
+    """
+    Read count good frames from the head sensor
+    """
+    frames = []
+    while len(frames) < count:
+        time.sleep(MEASUREMENT_WAIT_PERIOD)
+        (bytes_read, temps, room_temp) = OMRON_WATCHDOG.read()
+        if bytes_read == OMRON_BUFFER_LENGTH:
+            frames.append(temps)
+    return frames
+
+def calibrate_robot():
+    """
+    Measure this robot's calibration (-calibrate) and save it
+    """
+    debug_print('CALIBRATE: keep anything warm out of view')
+    if SERVO_ENABLED:
+        set_servo_to_position(CTR_SERVO_POSITION)
+    for led in LED0_COLOR_SET+LED1_COLOR_SET+LED2_COLOR_SET+LED3_COLOR_SET:
+        set_led(led, LED_OFF)
+    for led in (LED0_YEL, LED1_YEL, LED2_YEL, LED3_YEL):
+        set_led(led, LED_ON)
+    time.sleep(5.0)
+    (gains, offsets) = pixel_calibration(calibration_frames(20))
+    calibration = Calibration(SERVO_TYPE, MIN_SERVO_POSITION, \
+                              MAX_SERVO_POSITION, CTR_SERVO_POSITION, \
+                              gains, offsets)
+    debug_print('CALIBRATE: element offsets = '+ \
+                ' '.join(["%.1f"%o for o in offsets]))
+
+    if SERVO_ENABLED:
+        debug_print('CALIBRATE: hold something warm in front of the robot')
+        for led in (LED0_YEL, LED1_YEL, LED2_YEL, LED3_YEL):
+            set_led(led, LED_OFF)
+        for led in (LED0_GRN, LED1_GRN, LED2_GRN, LED3_GRN):
+            set_led(led, LED_ON)
+        time.sleep(5.0)
+        samples = []
+        for position in range(CTR_SERVO_POSITION-300, \
+                              CTR_SERVO_POSITION+301, 20):
+            samples.append((set_servo_to_position(position), \
+                            calibration.apply(calibration_frames(1)[0])))
+        center = find_center(samples)
+        if center is None:
+            debug_print('CALIBRATE: no heat found, center not changed')
+        else:
+            calibration.ctr_servo = center
+            debug_print('CALIBRATE: servo center = '+str(center))
+        set_servo_to_position(calibration.ctr_servo)
+
+    for led in (LED0_GRN, LED1_GRN, LED2_GRN, LED3_GRN):
+        set_led(led, LED_OFF)
+    problems = calibration.problems(SERVO_TYPE)
+    if problems:
+        debug_print('CALIBRATE: not saved: '+'; '.join(problems))
+        return None
+    save_calibration(calibration, CALIBRATION_FILE)
+    debug_print('CALIBRATE: saved to '+CALIBRATION_FILE)
+    return calibration
+
+class Robot(RobotActions):
+    """
+    What the person detection state machine does to the real robot
+    """
+    def log(self, message):
+        debug_print(message)
+
+    def uptime(self):
+        return get_uptime()
+
+# hello and goodbye are only said once the presence estimator agrees
+# (see greet_or_goodbye())
+    def greet(self, ctx):
+        debug_print('State machine: hello')
+
+    def goodbye(self, ctx):
+        debug_print('State machine: goodbye')
+
+    def roam(self, ctx):
+        global SERVO_DIRECTION, LAST_KNOWN_LED_POS, LIT_LED, ROAM_CALLS
+# a hot CPU roams less often
+        ROAM_CALLS += 1
+        if ROAM_CALLS % GOVERNOR.level.roam_every:
+            return
+# a side sensor already knows where the heat is; look there
+        if SIDE_BEARING is not None:
+            debug_print('Side sensor heat at '+"%.1f"%SIDE_BEARING+ \
+                        ' degrees')
+            self.move_head(ctx, resolve_new_position(SIDE_BEARING > 0, \
+                ctx.servo_position, int(abs(SIDE_BEARING)/DEGREES_PER_US), \
+                SERVO_TYPE))
+            ctx.roam_count = 0
+            return
+# something warm was seen out of view during the sweep; look there
+        warm = PANORAMA.warmest(PERSON_TEMP_THRESHOLD, WARM_MEMORY, \
+                                time.time())
+        if warm is not None and \
+           abs(warm[0] - ctx.servo_position) > SENSOR_VIEW/DEGREES_PER_US/2:
+            debug_print('Heat seen at '+str(warm[0])+': '+"%.1f"%warm[1])
+            ctx.servo_position = set_servo_to_position(warm[0])
+# let the head settle so the next frame is stitched where it was taken
+            if SENSE_TASK is not None:
+                RUNTIME.defer(SENSE_TASK, \
+                              MEASUREMENT_WAIT_PERIOD*(1+SETTLE_TIME))
+            ctx.roam_count = 0
+            return
+        (ctx.roam_count, ctx.servo_position, SERVO_DIRECTION, \
+         LAST_KNOWN_LED_POS, LIT_LED) = \
+        servo_roam(ctx.roam_count, ctx.servo_position, SERVO_DIRECTION, \
+                   LAST_KNOWN_LED_POS, LIT_LED)
+
+    def move_head(self, ctx, position):
+        ctx.servo_position = move_head(position, ctx.servo_position)
+
+    def waiting(self, ctx):
+        if MONITOR:
+            SCREEN_DISPLAY.fill(name_to_rgb('white'), MESSAGE_AREA)
+            txt = FONT.render("Waiting...", 1, name_to_rgb('blue'))
+            txtpos = txt.get_rect()
+            txtpos.center = MESSAGE_AREA_XY
+            SCREEN_DISPLAY.blit(txt, txtpos)
+# update the screen
+            pygame.display.update()
+
+    def burn_warning(self, ctx, max_temp):
+        global LED_STATE
+        LED_STATE = True
+        set_led(LED_GPIO_PIN, LED_STATE)
+        if MONITOR:
+            SCREEN_DISPLAY.fill(name_to_rgb('red'), MESSAGE_AREA)
+            txt = FONT.render("WARNING! Burn danger!", 1, \
+                              name_to_rgb('yellow'))
+            txtpos = txt.get_rect()
+            txtpos.center = MESSAGE_AREA_XY
+            SCREEN_DISPLAY.blit(txt, txtpos)
+# update the screen
+            pygame.display.update()
+
+        debug_print('\r\n'+"Burn hazard temperature is " \
+                   +"%.1f"%max_temp+" degrees")
+
+        # play this only once, otherwise, its too annoying
+        if (ctx.burn_hazard_cnt == 1):
+            journal(EVENT_BURN, max_temp)
+            LEDS.play(BURN_PATTERN)
+            play_sound(MAX_VOLUME, BURN_FILE_NAME)
+            debug_print('Played Burn warning audio')
+            say_number(TEMPERATURE_PHRASE, round(max_temp))
+
+    def attend(self, ctx, max_temp):
+        global LED_STATE
+        LED_STATE = True
+        set_led(LED_GPIO_PIN, LED_STATE)
+        SEARCH.detected(ctx.servo_position, time.time())
+        debug_print('Person_count: '+str(ctx.p_detect_count)+ \
+                   ' Max: '+"%.1f"%max_temp+ \
+                   ' Servo: '+str(ctx.servo_position)+' CPU: ' \
+                   +str(CPU_TEMP))
+
+# every 20 minutes that a person is detected, have the bot remind
+# the person to get some excersize.
+
+        uptime_now = get_uptime()
+        if (uptime_now - ctx.detected_time_stamp) >= EXERSIZE_TIMEOUT:
+            play_sound(MAX_VOLUME, STRETCH_FILE_NAME)
+            ctx.detected_time_stamp = uptime_now    # reset
+            LEDS.play(EXERCISE_PATTERN)
+
+
+def journal(event, value=0.0, track=0):
+    """
+    Add an event to the journal (see raspbot_journal.py)
+    """
+    if JOURNAL is None:
+        return
+    if PERSON is not None:
+        servo_position = PERSON.servo_position
+    else:
+        servo_position = CTR_SERVO_POSITION
+    JOURNAL.write(event, servo_position, FRAME.max_temp, FRAME.hit_count, \
+                  value, track)
+
+def log_deadline_miss(task, late):
+    debug_print('Task '+task.name+' missed its deadline by %.3fs' % late)
+
+def heartbeat():
+    """
+    Blink the heartbeat LED
+    """
+    global LED_STATE
+    LED_STATE = not LED_STATE
+    set_led(LED_GPIO_PIN, LED_STATE)
+
+def check_events():
+    """
+    Quit on the window being closed, q or esc
+    """
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            crash_msg = '\r\npygame event QUIT'
+            crash_and_burn(crash_msg, pygame, SERVO_HANDLE, \
+                           LOGFILE_HANDLE)
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_q or \
+               event.key == pygame.K_ESCAPE:
+                crash_msg = \
+                '\r\npygame event: keyboard q or esc pressed'
+                crash_and_burn(crash_msg, pygame, \
+                               SERVO_HANDLE, LOGFILE_HANDLE)
+
+def check_cpu_temperature():
+    """
+    Shed load in steps as the CPU gets hotter (see raspbot_thermal.py)
+    """
+    global CPU_TEMP
+    CPU_TEMP = THERMOMETER.read()
+    previous = GOVERNOR.index
+    if not GOVERNOR.update(CPU_TEMP):
+        return
+    level = GOVERNOR.level
+    debug_print('CPU '+"%.1f"%CPU_TEMP+': thermal level '+level.name)
+    if SENSE_TASK is not None:
+        SENSE_TASK.period = MEASUREMENT_WAIT_PERIOD*level.sense_scale
+        SENSE_TASK.deadline = SENSE_TASK.period
+    if GOVERNOR.index > previous:
+        journal(EVENT_CPU, CPU_TEMP, GOVERNOR.index)
+# one warning on the way up rather than one every check
+    if GOVERNOR.index > previous and level.name in CPU_FILE_NAMES:
+        if level.name != 'warm' or CPU_105_ON:
+            play_sound(MAX_VOLUME, CPU_FILE_NAMES[level.name])
+
+def rotate_log():
+    """
+    Write the log file to disk and start it again
+    """
+    global MAIN_LOOP_COUNT, LOGFILE_HANDLE
+    debug_print('\r\nLoop count max reached (' \
+        +str(MAIN_LOOP_COUNT)+' at '+str(datetime.now()))
+    MAIN_LOOP_COUNT = 0      # reset the counter
+    for line in RUNTIME.report():
+        debug_print('Task '+line)
+    for task in RUNTIME.tasks:
+        if task.period is not None:
+            debug_print('Task '+RUNTIME.histogram(task))
+    debug_print('\r\nClosing log file at '+str(datetime.now()))
+    LOGFILE_HANDLE.close()     # for forensic analysis
+
+    LOGFILE_HANDLE = open(LOGFILE_NAME, 'wb')
+    debug_print('\r\nLog file re-opened at ' \
+                +str(datetime.now()))
+    debug_print(LOGFILE_OPEN_STRING)
+    debug_print(LOGFILE_ARGS_STRING)
+    debug_print(LOGFILE_TEMP_STRING)
+    debug_print('person temp threshold = ' \
+               +str(PERSON_TEMP_THRESHOLD))
+# Display the Omron internal temperature
+    debug_print('Servo Type: '+str(SERVO_TYPE))
+    debug_print('Omron sensor: '+OMRON_WATCHDOG.report())
+
+# reinitialize the mixer; for some reason the audio drops out
+# after extended periods of operating time. See if this fixes
+    if BOOT.started('audio'):
+        pygame.mixer.init()
+
+# start roaming again
+    PERSON.no_person_count = 0
+    PERSON.p_detect_count = 0
+    PERSON.roam_count = 0
+
+def show_frame(temperature_array, room_temp):
+    """
+    Draw the temperatures and the room temperature in the IR window
+    """
+    global SCREEN_TEXT
+# create the IR pixels
+    for i in range(0, OMRON_DATA_LIST):
+# This fills each array square with a color that matches the temp
+        SCREEN_DISPLAY.fill(fahrenheit_to_rgb(MAX_TEMP, \
+                    MIN_TEMP, temperature_array[i]), \
+                    QUADRANT[i])
+# Display temp value
+        if temperature_array[i] > PERSON_TEMP_THRESHOLD:
+            SCREEN_TEXT = \
+                FONT.render("%.1f"%temperature_array[i], \
+                            1, name_to_rgb('red'))
+        else:
+            SCREEN_TEXT = \
+                FONT.render("%.1f"%temperature_array[i], \
+                            1, name_to_rgb('navy'))
+        screen_text_pos = SCREEN_TEXT.get_rect()
+        screen_text_pos.center = CENTER[i]
+        SCREEN_DISPLAY.blit(SCREEN_TEXT, screen_text_pos)
+
+# Create an area to display the room temp and messages
+    SCREEN_DISPLAY.fill(fahrenheit_to_rgb(MAX_TEMP, \
+                        MIN_TEMP, room_temp), \
+                        ROOM_TEMP_AREA)
+    SCREEN_TEXT = FONT.render("Room: %.1f"%room_temp, 1, \
+                        name_to_rgb('navy'))
+    screen_text_pos = SCREEN_TEXT.get_rect()
+    screen_text_pos.center = ROOM_TEMP_MSG_XY
+    SCREEN_DISPLAY.blit(SCREEN_TEXT, screen_text_pos)
+
+# update the screen
+    pygame.display.update()
+
+def sense():
+    """
+    Read a frame, show it and step the person detection state machine
+    """
+    global MAIN_LOOP_COUNT, OMRON_READ_COUNT, OMRON_ERROR_COUNT, \
+           FIRST_FRAME_TIME, SIDE_BEARING, FRAME, SENSOR_FAILING
+    MAIN_LOOP_COUNT += 1
+    quiet = GOVERNOR.level.quiet
+    if not quiet:
+        debug_print('\r\n^^^^^^^^^^^^^^^^^^^^\r\n    MAIN_WHILE_LOOP: %d '\
+                    'Pcount: %d Servo: %s CPU: %s Uptime(sec) = %s'\
+                    '\r\n^^^^^^^^^^^^^^^^^^^^' % \
+                    (MAIN_LOOP_COUNT, PERSON.p_detect_count, \
+                     PERSON.servo_position, CPU_TEMP, get_uptime()))
+
+# periododically, write the log file to disk
+    if MAIN_LOOP_COUNT >= LOG_MAX:
+        rotate_log()
+
+# read the raw temperature data into a frame from the pool; FRAME stays
+# the last good one until this one is
+#
+    frame = FRAMES.acquire()
+    if SENSOR_ARRAY:
+        omron_readings = SENSOR_ARRAY.read()
+        (bytes_read, temperatures, room_temp) = omron_readings[0]
+        if bytes_read == OMRON_BUFFER_LENGTH:
+            frame.load(temperatures, room_temp)
+# look for heat outside the head sensor's view
+        SIDE_BEARING = \
+            warmest_bearing(fuse(OMRON_SIDE_SENSORS, omron_readings[1:]), \
+                            PERSON_TEMP_THRESHOLD)
+    else:
+        bytes_read = OMRON_WATCHDOG.read_into(frame)
+    OMRON_READ_COUNT += 1
+
+# Display each element's temperature in F
+#            debug_print('New temperature measurement')
+#            print_temps(frame.temps)
+
+# the watchdog retries and reinitializes the sensor; skip the frame
+# unless it has been failing for too long
+    if bytes_read != OMRON_BUFFER_LENGTH: # sensor problem
+        FRAMES.release(frame)
+        OMRON_ERROR_COUNT += 1
+# once per run of failed reads
+        if not SENSOR_FAILING:
+            journal(EVENT_SENSOR_ERROR, OMRON_ERROR_COUNT)
+        SENSOR_FAILING = True
+        debug_print( \
+            'ERROR: Omron thermal sensor failure! '+ \
+            OMRON_WATCHDOG.report())
+        if OMRON_WATCHDOG.failed():
+            panic()
+        return
+
+    SENSOR_FAILING = False
+    FRAMES.release(FRAME)
+    FRAME = frame
+    frame.timestamp = time.time()
+    frame.servo_position = PERSON.servo_position
+    temperatures = frame.temps
+
+    if FIRST_FRAME_TIME is None:
+        FIRST_FRAME_TIME = time.time()
+        debug_print('First valid frame %.3f seconds after boot' % \
+                    (FIRST_FRAME_TIME - BOOT.t0))
+
+    if CALIBRATION is not None:
+        CALIBRATION.apply(temperatures, temperatures)
+
+    if RECORD:
+        RECORDER.write(frame.timestamp, frame.servo_position, \
+                       frame.ambient, temperatures)
+
+# a hot CPU draws fewer frames
+    if MONITOR and MAIN_LOOP_COUNT % GOVERNOR.level.render_every == 0:
+        show_frame(temperatures, frame.ambient)
+
+# testing panic
+#        panic()
+
+###########################
+# Analyze sensor data
+###########################
+
+    frame.find_hits(DETECTION_PARAMS)
+    hit_array = frame.columns
+
+# the hit LEDs are left alone while an animation is playing
+    if not LEDS.busy():
+        show_hits(hit_array)
+
+    PANORAMA.stitch(frame.servo_position, temperatures, frame.timestamp)
+
+# hit_array[0] is the far left column, the clockwise one
+    if SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE:
+        SEARCH.observe(frame.servo_position, hit_array[::-1], \
+                       frame.timestamp)
+    else:
+        SEARCH.observe(frame.servo_position, hit_array, frame.timestamp)
+
+    if not quiet:
+        debug_print('\r\n-----------------------\r\nhit array: %d%d%d%d'\
+                    '\r\nhit count: %d\r\n-----------------------' % \
+                    (hit_array[0], hit_array[1], hit_array[2], \
+                     hit_array[3], frame.hit_count))
+
+# follow one person when several are in view (see raspbot_tracker.py)
+    TRACKER.update(temperatures, frame.servo_position, frame.timestamp)
+    target = TRACKER.primary()
+    if target is not None and target.misses == 0:
+        target_position = target.position
+    else:
+        target_position = None
+    if not quiet and TRACKER.tracks:
+        debug_print('Tracks: '+' '.join(['%d@%d' % (track.id, \
+                    track.position) for track in TRACKER.tracks]))
+
+    if time.time() >= HEAD_FREE_TIME:
+        PERSON.step(frame.hit_count, hit_array, frame.max_temp, \
+                    target_position, len(TRACKER.visible()))
+
+    greet_or_goodbye(target)
+
+def greet_or_goodbye(target):
+    """
+    Say hello or goodbye when someone has really arrived or left
+    """
+    global ARRIVAL_TIME
+    track_id = None
+    if target is not None:
+        track_id = target.id
+    now = time.time()
+    event = PRESENCE.update(frame_evidence(PERSON.state, target), track_id, \
+                            now)
+    if event == HELLO:
+        ARRIVAL_TIME = now
+        OCCUPANCY.arrive(now)
+        journal(EVENT_HELLO, 0.0, track_id)
+        say_hello()
+    elif event == GOODBYE:
+        OCCUPANCY.leave(now)
+        journal(EVENT_GOODBYE, now - ARRIVAL_TIME, track_id)
+        say_goodbye()
+
+def save_occupancy():
+    """
+    Write the visitor statistics and their summary (raspbot_occupancy.py)
+    """
+    try:
+        OCCUPANCY.save(OCCUPANCY_FILE)
+    except (IOError, OSError) as error:
+        debug_print('Occupancy not saved: '+str(error))
+
+###########################
+# Control socket commands (see raspbot_control.py)
+###########################
+def control_state():
+    """
+    What the robot sees and is doing
+    """
+    return {'time': time.time(), \
+            'frames': OMRON_READ_COUNT, \
+            'state': STATE_NAMES[PERSON.state], \
+            'servo_position': PERSON.servo_position, \
+            'temperatures': [round(t, 1) for t in FRAME.temps], \
+            'room_temp': round(FRAME.ambient, 1), \
+            'hit_count': FRAME.hit_count, \
+            'hit_array': list(FRAME.columns), \
+            'people': len(TRACKER.visible()), \
+            'cpu_temp': round(CPU_TEMP, 1), \
+            'thermal_level': GOVERNOR.level.name, \
+            'muted': MUTED}
+
+def control_set(name, value):
+    """
+    Change a live setting (see raspbot_config.py) until the next restart
+    or config file change
+    """
+    if name in SETTINGS_BY_NAME and SETTINGS_BY_NAME[name].restart:
+        raise ValueError(name+' only changes with a restart')
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass                    # a string setting
+    config = CONFIG.copy(**{name: value})
+    reload_config(config, [name])
+    CONFIG_WATCHER.config = config
+    return getattr(config, name)
+
+def control_roam():
+    """
+    Look where a person is most likely to be next
+    """
+    position = set_servo_to_position( \
+        SEARCH.next_position(PERSON.servo_position, time.time()))
+# without a servo the head stays where it is
+    if SERVO_ENABLED:
+        PERSON.servo_position = position
+    return PERSON.servo_position
+
+def control_center():
+    """
+    Face straight ahead
+    """
+    position = set_servo_to_position(CTR_SERVO_POSITION)
+    if SERVO_ENABLED:
+        PERSON.servo_position = position
+    return PERSON.servo_position
+
+def control_mute(on='on'):
+    """
+    Stop (mute on) or allow (mute off) sounds and speech
+    """
+    global MUTED
+    if on not in ('on', 'off'):
+        raise ValueError('mute on or mute off')
+    MUTED = on == 'on'
+    if MUTED:
+        AUDIO_QUEUE.clear()
+        if BOOT.started('audio') and pygame is not None:
+            pygame.mixer.music.stop()
+    return MUTED
+
+def control_snapshot():
+    """
+    Save the current frame and state (and the IR window, if there is one)
+    """
+    if not os.path.isdir(SNAPSHOT_DIR):
+        os.makedirs(SNAPSHOT_DIR)
+    base = os.path.join(SNAPSHOT_DIR, \
+                        datetime.now().strftime('snapshot-%Y%m%d-%H%M%S'))
+    fp = open(base+'.json', 'w')
+    json.dump(control_state(), fp, indent=1, sort_keys=True)
+    fp.close()
+    saved = [base+'.json']
+    if MONITOR:
+        pygame.image.save(SCREEN_DISPLAY, base+'.png')
+        saved.append(base+'.png')
+    return saved
+
+def control_occupancy():
+    """
+    Visitor statistics (see raspbot_occupancy.py)
+    """
+    return OCCUPANCY.summary()
+
+def control_shutdown():
+    """
+    Stop the control loop; the robot then shuts down cleanly
+    """
+    debug_print('Control socket: shutdown')
+    RUNTIME.stop()
+    return True
+
+CONTROL_COMMANDS = {'state': control_state, \
+                    'occupancy': control_occupancy, \
+                    'set': control_set, \
+                    'roam': control_roam, \
+                    'center': control_center, \
+                    'mute': control_mute, \
+                    'snapshot': control_snapshot, \
+                    'shutdown': control_shutdown}
 
 # Constants
 RASPI_I2C_CHANNEL = 1       # the /dev/i2c device
 OMRON_1 = 0x0a              # 7 bit I2C address of Omron Sensor D6T-44L
 OMRON_BUFFER_LENGTH = 35    # Omron data buffer size
 OMRON_DATA_LIST = 16        # Omron data array - sixteen 16 bit words
-MAX_VOLUME = 1.0            # maximum speaker volume for pygame.mixer
+# Extra Omron sensors for a wider field of view (see raspbot_sensors.py)
+# Every D6T is at 0x0a, so each needs its own bus or I2C mux channel.
+# The head sensor is read along with them; set OMRON_1_MUX_CHANNEL if it
+# is behind the same multiplexer. For example:
+# OMRON_SIDE_SENSORS = [ThermalSensor('left', mux_channel=1, bearing=-44),
+#                       ThermalSensor('right', mux_channel=2, bearing=44)]
+OMRON_SIDE_SENSORS = []
+OMRON_1_MUX_CHANNEL = None
 DEGREE_UNIT = 'F'           # F = Farenheit, C=Celcius
-MEASUREMENT_WAIT_PERIOD = 0.3   # time between Omron measurements
-SERVO_ENABLED = 1   # set this to 1 if the servo motor is wired up
+# Switches, thresholds, timings, sound clips and PID gains are read from
+# CONFIG_FILE and can be changed while the robot runs; the command line
+# flags still work (see raspbot_config.py)
+CONFIG_FILE = "/home/pi/projects_ggg/raspbot/raspbot.json"
+CONFIG_CHECK_PERIOD = 2.0   # seconds between looks at the config file
+# Local control socket (see raspbot_control.py)
+CONTROL_SOCKET = "/home/pi/projects_ggg/raspbot/raspbot.sock"
+CONTROL_PERIOD = 0.1        # seconds between answering control requests
+# Journal of events for visitor statistics (see raspbot_journal.py)
+JOURNAL_FILE = "/home/pi/projects_ggg/raspbot/raspbot.jnl"
+# Visit counts, visit lengths and busy hours (see raspbot_occupancy.py)
+OCCUPANCY_FILE = "/home/pi/projects_ggg/raspbot/occupancy.json"
+OCCUPANCY_SAVE_PERIOD = 300.0   # seconds between saves
+SNAPSHOT_DIR = "/home/pi/projects_ggg/raspbot/snapshots"
+AUDIO_POLL_PERIOD = 0.1     # seconds between checks for the next sound
+CPU_CHECK_PERIOD = 5.0      # seconds between CPU temperature checks
+EVENT_POLL_PERIOD = 0.1     # seconds between pygame event checks
+REALTIME_CPU = None     # CPU for the control loop (None is the last one)
+ISOLATE_PERIOD = 10.0   # seconds between moving new threads off that CPU
 SERVO_GPIO_PIN = 11 # GPIO number (GPIO 11 aka. SCLK)
 LED_GPIO_PIN = 7    # GPIO number that the LED is connected to
                     # (BCM GPIO_04 (Pi Hat) is the same as BOARD pin 7)
                     # See "Raspberry Pi B+ J8 Header" diagram
-DEBUG = 0           # set this to 1 to see debug messages on monitor
 SCREEN_DIMENSIONS = [400, 600]  # setup IR window [0]= width [1]= height
 MIN_TEMP = 0            # minimum expected temperature in Fahrenheit
 MAX_TEMP = 200          # minimum expected temperature in Fahrenheit
-ROAM = 0                # if true, robot will look for a heat signature
-ROAM_MAX = 600          # Max number of times to roam between person
-                        # detections (roughly 0.5 seconds between roams
-LOG_MAX = 1200
-RAND = 0                # Causes random head movement when idle
-BURN_HAZARD_TEMP = 100  # temperature at which a warning is given
-BURN_HAZARD_CNT = 0     # number of times burn hazard detected
 BURN_HAZARD_HIT = 10    # Number used in Hit array to indicate hazard
 TEMPMARGIN = 5          # degrees > than room temp to detect person
-PERSON_TEMP_THRESHOLD = 79  # degrees fahrenheit
-MONITOR = 1             # assume a monitor is attached
 # Servo positions
 # Weirdness factor: Some servo's I used go in the reverse direction
 # from other servos. Therefore, this next constant is used to change the
@@ -609,17 +1357,25 @@ PERSON_TEMP_SUM_THRESHOLD = 3
 DETECT_COUNT_THRESH = 3
 PERSON_HIT_COUNT = 4
 PROBABLE_PERSON_THRESH = 3  # used to determine when to say hello
+POSSIBLE_PERSON_MAX = 10 # after 10 one-hits, move head
 
 # Logfile
 LOGFILE_NAME = "/home/pi/projects_ggg/raspbot/raspbot.log"
-
-import RPi.GPIO as GPIO
-GPIO.setwarnings(False) # turn off warnings about DMA channel in use
-GPIO.setmode(GPIO.BOARD)
-GPIO.setup(SERVO_GPIO_PIN, GPIO.OUT)
-GPIO.setup(LED_GPIO_PIN, GPIO.OUT)
-from RPIO import PWM        # for the servo motor
-PWM.set_loglevel(PWM.LOG_LEVEL_ERRORS) # turn off debug msgs
+# Recorded thermal sessions (-record) for replay with raspbot_sweep.py
+RECORD_DIR = "/home/pi/projects_ggg/raspbot/rec"
+# closed sessions are packed here for collection (see raspbot_export.py)
+EXPORT_DIR = "/home/pi/projects_ggg/raspbot/outbox"
+EXPORT_REMOVE = False   # delete a session once it is packed and checked
+# Per robot sensor and servo calibration (see raspbot_calibration.py)
+CALIBRATION_FILE = "/home/pi/projects_ggg/raspbot/raspbot_cal.json"
+IMPORT_BUDGET = 1.0     # seconds the startup imports should take at most
+# Text to speech clips (see raspbot_tts.py)
+TTS_CACHE_DIR = "/home/pi/projects_ggg/raspbot/tts"
+TTS_CACHE_BYTES = 20*1024*1024
+TTS_BACKEND = 'espeak'  # 'espeak' works offline, 'google' needs CONNECTED
+TTS_VOICE = 'en'
+STRETCH_PHRASE = "Now might be a good time to stand up and stretch"
+TEMPERATURE_PHRASE = "The temperature is %d degrees fahrenheit"
 
 CONNECTED = 0           # true if connected to the internet
 
@@ -629,21 +1385,17 @@ CONNECTED = 0           # true if connected to the internet
 #
 ###############################
 
-# Handle command line arguments
-if "-debug" in sys.argv:
-    DEBUG = 1         # set this to 1 to see debug messages on monitor
-
-if "-noservo" in sys.argv:
-    SERVO_ENABLED = 0         # assume using servo is default
-
-if "-nomonitor" in sys.argv:
-    MONITOR = 0       # assume using servo is default
-
-if "-roam" in sys.argv:
-    ROAM = 1          # set this to 1 to roam looking for a person
-
-if "-rand" in sys.argv:
-    RAND = 1          # set this to 1 to randomize looking for a person
+# Load the config file; command line flags win over it
+DETECTION_PARAMS = None
+TRACKER = None
+PID_CONTROLLER = None
+SENSE_TASK = None
+HEARTBEAT_TASK = None
+(CONFIG, CONFIG_PROBLEM) = load_config(CONFIG_FILE, sys.argv)
+if CONFIG is None:
+    CONFIG = Config()
+    CONFIG.use_flags(sys.argv)
+use_config(CONFIG)
 
 if "-help" in sys.argv:
     print 'IMPORTANT: run as superuser (sudo) to allow DMA access'
@@ -652,106 +1404,94 @@ if "-help" in sys.argv:
     print '-noservo: do not use the servo motor'
     print '-roam:    when no person turn head slowly 180 degrees'
     print '-rand:    when roaming randomize the head movement'
+    print '-record:  record sensor frames to '+RECORD_DIR
+    print '-calibrate: measure the sensor and servo calibration and save it'
+    print '-realtime: SCHED_FIFO, a CPU of its own and a monotonic clock'
+    print 'other settings are in '+CONFIG_FILE
     sys.exit()
 
+# Load this robot's calibration; without one there is a manual head
+# calibration wait at startup
+(CALIBRATION, CALIBRATION_PROBLEM) = \
+    load_calibration(CALIBRATION_FILE, SERVO_TYPE)
+if CALIBRATION is not None:
+    use_calibration(CALIBRATION)
+
 # Initialize variables
 # holds the recently measured temperature
-TEMPERATURE_ARRAY = [0.0]*OMRON_DATA_LIST
 LED_STATE = True
-# keep track of head roams so that we can turn it off
-ROAM_COUNT = 0
 # QUADRANT of the display (x, y, width, height)
-QUADRANT = [Rect]*OMRON_DATA_LIST
+QUADRANT = [None]*OMRON_DATA_LIST
 CENTER = [(0, 0)]*OMRON_DATA_LIST      # center of each QUADRANT
 PX = [0]*4
 PY = [0]*4
 OMRON_ERROR_COUNT = 0
 OMRON_READ_COUNT = 0
-PREVIOUS_HIT_COUNT = 0
-HIT_COUNT = 0
-HIT_ARRAY_TEMP = [0]*OMRON_DATA_LIST
-HIT_ARRAY = [0]*4
-# initialize the servo to face directly forward
-SERVO_POSITION = CTR_SERVO_POSITION
+RECORDER = None
+SENSOR_ARRAY = None
+OMRON_WATCHDOG = None
+SIDE_BEARING = None     # where the side sensors see heat, if anywhere
 # set initial direction
 if SERVO_TYPE == LOW_TO_HIGH_IS_CLOCKWISE:
     SERVO_DIRECTION = SERVO_CUR_DIR_CW
 else:
     SERVO_DIRECTION = SERVO_CUR_DIR_CCW
 
-# Initialize screen
-pygame.init()
-FONT = pygame.font.Font(None, 36)
+BOOT = BootSequencer()
+# LED animations play on their own thread (see raspbot_leds.py)
+OUTPUT = None           # PigpioOutput once the pigpio phase is up
+LEDS = LedAnimator(set_led, LED_ON, LED_OFF)
+ALL_RED_LEDS = [LED0_RED, LED1_RED, LED2_RED, LED3_RED]
+ALL_YEL_LEDS = [LED0_YEL, LED1_YEL, LED2_YEL, LED3_YEL]
+ALL_GRN_LEDS = [LED0_GRN, LED1_GRN, LED2_GRN, LED3_GRN]
+PANIC_PATTERN = blink('panic', [ALL_RED_LEDS], 0.3, 0.3, None, \
+                      PRIORITY_PANIC, LED_ON, LED_OFF)
+BURN_PATTERN = blink('burn', [ALL_RED_LEDS], 0.15, 0.15, 10, \
+                     PRIORITY_WARNING, LED_ON, LED_OFF)
+# the outer and inner LEDs take turns while the head is calibrated
+CALIBRATION_WINDOW = 19.0   # seconds
+CALIBRATE_PATTERN = alternate('calibrate', LED1_COLOR_SET+LED2_COLOR_SET, \
+                              LED0_COLOR_SET+LED3_COLOR_SET, 1.0, \
+                              int(CALIBRATION_WINDOW/2)+1, PRIORITY_STATUS, \
+                              LED_ON, LED_OFF)
+HEAD_FREE_TIME = 0.0    # the state machine may move the head after this
+SERVO_HANDLE = None
+FIRST_FRAME_TIME = None
+MAIN_LOOP_COUNT = 0
+# the control loop tasks (see raspbot_runtime.py)
+if REALTIME:
+    RUNTIME = Runtime(monotonic, time.sleep, log_deadline_miss, sleep_until)
+else:
+    RUNTIME = Runtime(on_miss=log_deadline_miss)
+SERVO_STOP = None       # the pending stop once the head is centered
+AUDIO_QUEUE = deque()   # sounds waiting for the mixer
+MUTED = False           # no sounds while true (control socket mute)
+# sensor frames are reused from a pool (see raspbot_frame.py); FRAME is
+# the last good one
+FRAMES = FramePool()
+FRAME = FRAMES.acquire()
+CONTROL = None          # the control socket server
+EXPORTER = None         # packs recorded sessions in the background
+JOURNAL = None          # greetings, hazards and errors for the record
+# visitor statistics carry on from where the last run left them
+OCCUPANCY = load_occupancy(OCCUPANCY_FILE) or OccupancyStats()
+PERSON = None
+ARRIVAL_TIME = 0.0      # when the person being greeted arrived
+SENSOR_FAILING = False
+CONFIG_WATCHER = None
+GOVERNOR = ThermalGovernor()    # sheds load when the CPU is hot
+# where to look for a person while roaming
+SEARCH = SearchPlanner(MIN_SERVO_POSITION, MAX_SERVO_POSITION, \
+                       ROAMING_GRANULARTY, int(SENSOR_VIEW/DEGREES_PER_US))
+# whether someone is really there, from the state the machine is in
+PRESENCE = PresenceEstimator()
+# what the head has seen in every direction
+PANORAMA = Panorama(MIN_SERVO_POSITION, MAX_SERVO_POSITION, \
+                    ROAMING_GRANULARTY, int(SENSOR_VIEW/DEGREES_PER_US), \
+                    SERVO_TYPE != LOW_TO_HIGH_IS_CLOCKWISE)
+ROAM_CALLS = 0
 
 try:
-# Initialize i2c bus address
-    I2C_BUS = smbus.SMBus(1)
-    time.sleep(0.1)                # Wait
-
-# make some space
-    print ''
-
-    if SERVO_ENABLED:
-# Initialize servo position
-        GPIO.setmode(GPIO.BOARD)
-        GPIO.setup(SERVO_GPIO_PIN, GPIO.OUT)
-        SERVO_HANDLE = PWM.Servo()
-        SERVO_HANDLE.set_servo(SERVO_GPIO_PIN, CTR_SERVO_POSITION)
-        print('')
-    else:
-        print('SERVO is off')
-
-    print ''
-    if DEBUG:
-        print('DEBUG switch is on, initializing Pigpio...')
-
-# intialize pigpio library and socket connection for daemon (pigpiod)
-    PIGPIO_HANDLE = pigpio.pi()              # use defaults
-    PIGPIO_VERSION = PIGPIO_HANDLE.get_pigpio_version()
-
-# initialize LEDs
-    LED_STATE = True
-    GPIO.setup(LED_GPIO_PIN, GPIO.OUT)
-    GPIO.output(LED_GPIO_PIN, LED_STATE)
-    GPIO.setup(LED0_RED, GPIO.OUT)
-    GPIO.output(LED0_RED, LED_OFF)
-    GPIO.setup(LED0_YEL, GPIO.OUT)
-    GPIO.output(LED0_YEL, LED_OFF)
-    GPIO.setup(LED0_GRN, GPIO.OUT)
-    GPIO.output(LED0_GRN, LED_OFF)
-    GPIO.setup(LED1_RED, GPIO.OUT)
-    GPIO.output(LED1_RED, LED_OFF)
-    GPIO.setup(LED1_YEL, GPIO.OUT)
-    GPIO.output(LED1_YEL, LED_OFF)
-    GPIO.setup(LED1_GRN, GPIO.OUT)
-    GPIO.output(LED1_GRN, LED_OFF)
-    GPIO.setup(LED2_RED, GPIO.OUT)
-    GPIO.output(LED2_RED, LED_OFF)
-    GPIO.setup(LED2_YEL, GPIO.OUT)
-    GPIO.output(LED2_YEL, LED_OFF)
-    GPIO.setup(LED2_GRN, GPIO.OUT)
-    GPIO.output(LED2_GRN, LED_OFF)
-    GPIO.setup(LED3_RED, GPIO.OUT)
-    GPIO.output(LED3_RED, LED_OFF)
-    GPIO.setup(LED3_YEL, GPIO.OUT)
-    GPIO.output(LED3_YEL, LED_OFF)
-    GPIO.setup(LED3_GRN, GPIO.OUT)
-    GPIO.output(LED3_GRN, LED_OFF)
-
-# Initialize the selected Omron sensor
-
-    GPIO.output(LED0_GRN, LED_ON)
-    if DEBUG:
-        print('DEBUG switch is on, initializing Omron sensor...')
-
-    (OMRON1_HANDLE, OMRON1_RESULT) = \
-        omron_init(RASPI_I2C_CHANNEL, OMRON_1, PIGPIO_HANDLE, I2C_BUS)
-
-    if OMRON1_HANDLE < 1:
-        GPIO.output(LED0_GRN, LED_OFF)
-        GPIO.output(LED0_RED, LED_ON)
-        panic()
-
 # Open log file
 
     LOGFILE_HANDLE = open(LOGFILE_NAME, 'wb')
@@ -767,101 +1507,107 @@ try:
     print LOGFILE_ARGS_STRING
     LOGFILE_HANDLE.write(LOGFILE_ARGS_STRING)
 
-    CPU_TEMP = getCPUtemperature()
+    THERMOMETER = CPUThermometer()
+    CPU_TEMP = THERMOMETER.read()
     LOGFILE_TEMP_STRING = '\r\nInitial CPU Temperature = '+str(CPU_TEMP)
     print LOGFILE_TEMP_STRING
     LOGFILE_HANDLE.write(LOGFILE_TEMP_STRING)
-        
+
+    try:
+        JOURNAL = JournalWriter(JOURNAL_FILE)
+    except (IOError, OSError) as error:
+        debug_print('No journal: '+str(error))
+    if JOURNAL is not None and JOURNAL.moved is not None:
+        debug_print('Journal was not a journal, moved to '+JOURNAL.moved)
+    journal(EVENT_START, CPU_TEMP)
+
+# Bring up the hardware; independent subsystems start at the same time
+# and the sensor starts as soon as the i2c bus and pigpio are up. The
+# display is only opened with a monitor and the music player comes up
+# in the background, off the path to the first sensor frame.
+    BOOT.add('i2c', boot_i2c)
+    BOOT.add('pigpio', pigpio.pi)           # socket to the pigpiod daemon
+    BOOT.add('output', boot_output, after=('pigpio',))
+    BOOT.add('leds', boot_leds, after=('output',))
+    if SERVO_ENABLED:
+        BOOT.add('servo', boot_servo, after=('output',))
+    BOOT.add('sensor', boot_sensor, after=('i2c', 'pigpio'))
+    BOOT.add('display', boot_display, lazy=not MONITOR, main_thread=True)
+    BOOT.add('audio', boot_audio, background=True)
+    BOOT.run()
+
+    I2C_BUS = BOOT.result('i2c')
+    LEDS.waves = OUTPUT     # patterns are timed by pigpio from now on
+    PIGPIO_HANDLE = BOOT.result('pigpio')
+    PIGPIO_VERSION = PIGPIO_HANDLE.get_pigpio_version()
+    LED_STATE = True
+    if SERVO_ENABLED:
+        SERVO_HANDLE = BOOT.result('servo')
+    else:
+        print('SERVO is off')
+    if MONITOR:
+        (SCREEN_DISPLAY, FONT) = BOOT.result('display')
+    (OMRON1_HANDLE, OMRON1_RESULT, OMRON_FAILED, SENSOR_ARRAY, \
+     OMRON_WATCHDOG) = BOOT.result('sensor')
+
     LOGFILE_HANDLE.write('\r\nPiGPIO version = '+str(PIGPIO_VERSION))
     debug_print('PiGPIO version = '+str(PIGPIO_VERSION))
+    for LINE in BOOT.report():
+        debug_print('Boot: '+LINE)
+    debug_print('Boot: imports took %.3fs' % IMPORT_TIME)
+    if IMPORT_TIME > IMPORT_BUDGET:
+        debug_print('Boot: imports are over the %.3fs budget' % IMPORT_BUDGET)
+    for (MODULE_NAME, SECONDS) in IMPORT_TIMES:
+        debug_print('Boot: import %s took %.3fs' % (MODULE_NAME, SECONDS))
     debug_print('Omron 1 sensor result = '+str(OMRON1_RESULT))
+    for SENSOR in OMRON_FAILED:
+        debug_print('Omron sensor '+SENSOR.name+' failed: '+str(SENSOR.result))
 
-# initialze the music player
-    pygame.mixer.init()
+    if OMRON1_HANDLE < 1:
+        set_led(LED0_GRN, LED_OFF)
+        set_led(LED0_RED, LED_ON)
+        panic()
 
-    if SERVO_ENABLED:
+    if CONFIG_PROBLEM is not None:
+        debug_print('Default settings: '+CONFIG_PROBLEM)
+    if CALIBRATION is None:
+        debug_print('Not calibrated: '+CALIBRATION_PROBLEM)
+
+    if CALIBRATE:
+        CALIBRATION = calibrate_robot()
+        if CALIBRATION is not None:
+            use_calibration(CALIBRATION)
+    elif CALIBRATION is not None:
+        debug_print('Using calibration from '+CALIBRATION_FILE)
+    elif SERVO_ENABLED:
         debug_print('SERVO is on - you have 20 seconds to calibrate the bot head')
-        for g in range(0, 19):
-            debug_print(str(g))
-            if (g % 2):
-                GPIO.output(LED0_RED, LED_ON)
-                GPIO.output(LED0_YEL, LED_ON)
-                GPIO.output(LED0_GRN, LED_ON)
-                GPIO.output(LED3_RED, LED_ON)
-                GPIO.output(LED3_YEL, LED_ON)
-                GPIO.output(LED3_GRN, LED_ON)
-                GPIO.output(LED1_RED, LED_OFF)
-                GPIO.output(LED1_YEL, LED_OFF)
-                GPIO.output(LED1_GRN, LED_OFF)
-                GPIO.output(LED2_RED, LED_OFF)
-                GPIO.output(LED2_YEL, LED_OFF)
-                GPIO.output(LED2_GRN, LED_OFF)
-            else:
-                GPIO.output(LED1_RED, LED_ON)
-                GPIO.output(LED1_YEL, LED_ON)
-                GPIO.output(LED1_GRN, LED_ON)
-                GPIO.output(LED2_RED, LED_ON)
-                GPIO.output(LED2_YEL, LED_ON)
-                GPIO.output(LED2_GRN, LED_ON)
-                GPIO.output(LED0_RED, LED_OFF)
-                GPIO.output(LED0_YEL, LED_OFF)
-                GPIO.output(LED0_GRN, LED_OFF)
-                GPIO.output(LED3_RED, LED_OFF)
-                GPIO.output(LED3_YEL, LED_OFF)
-                GPIO.output(LED3_GRN, LED_OFF)
-            time.sleep(1.0)
+        LEDS.play(CALIBRATE_PATTERN)
+# keep sensing but leave the head alone while it is being calibrated
+        HEAD_FREE_TIME = time.time() + CALIBRATION_WINDOW
 
     debug_print('Looking for a person')
 
-    NO_PERSON_COUNT = 0
-    P_DETECT = False
-
-# Used to lessen the number of repeat "hello" and "goodbye" messages.
-# Once a person is detected, assume they will be there for a short time
-# so this is used to wait a while before saying goodbye
-                            
-    P_DETECT_COUNT = 0
 ################################
 # initialize the PID controller
 ################################
 
 # PID controller is the feedback loop controller for person following
-    PID_CONTROLLER = PID(1.0, 0.1, 0.0)
-# seconds to allow temps to settle once the head has moved
-    SETTLE_TIME = 1.0
+    PID_CONTROLLER = PID(CONFIG.kp, CONFIG.ki, CONFIG.kd)
 # minimum microseconds if PID error is less than this head will stop
     MINIMUM_ERROR_GRANULARITY = 20
 
-    HELLO_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/20150201_zoe-hello1.mp3"
-    AFTER_HELLO_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/girl-sorry.mp3"
-    GOODBYE_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/20150201_chloe-goodbye1.mp3"
-    BADGE_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/badge_file.mp3"
-    BURN_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/girl-warning.mp3"
-    STRETCH_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/stretch.mp3"                      
-    CPU_105_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/girl-105a.mp3"
-    CPU_110_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/girl-110a.mp3"
-    CPU_115_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/girl-115a.mp3"
-    CPU_120_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/girl-120a.mp3"
-    CPU_125_FILE_NAME = \
-        "/home/pi/projects_ggg/raspbot/snd/girl-125a.mp3"
-# the CPU can reach 105 easily, so, normally this is turned off    
-    CPU_105_ON = False
 
+# phrases to have in the TTS cache; burn warnings say the temperature
+# (normally these were made at install time, see raspbot_tts.py)
+    TTS_CACHE = PhraseCache(TTS_CACHE_DIR, TTS_CACHE_BYTES, \
+                            make_backend(TTS_BACKEND, TTS_VOICE))
+    TTS_PHRASES = [STRETCH_PHRASE]+template_fragments(TEMPERATURE_PHRASE)
+    if CONNECTED or TTS_CACHE.backend.offline:
+        TTS_CACHE.prefetch(TTS_PHRASES)
     if CONNECTED:
-        speakSpeechFromText("Now might be a good time to stand up and stretch", "stretch.mp3")
         debug_print("Connected to internet")
         LOGFILE_HANDLE.write('\r\nConnected to the Internet')
-        play_sound(MAX_VOLUME, "stretch.mp3")
+        say(STRETCH_PHRASE)
     else:
         debug_print("Not connected to internet")
         LOGFILE_HANDLE.write('\r\nNOT connected to the Internet')   
@@ -904,26 +1650,43 @@ try:
 #     Using the raw threshold to say hello or goodbye results in false
 #     positives and true negatives.
 #
-    STATE_NOTHING = 0
-    STATE_POSSIBLE = 1
-    STATE_LIKELY = 2
-    STATE_PROBABLE = 3
-    STATE_DETECTED = 4
-    STATE_BURN = 5
-    PERSON_STATE = STATE_NOTHING
-    PREV_PERSON_STATE = STATE_NOTHING
-    POSSIBLE_PERSON_MAX = 10 # after 10 one-hits, move head
-    POSSIBLE_PERSON = 0
-    PROBABLE_PERSON = 0
+# The person detection states (NOTHING, POSSIBLE, LIKELY, PROBABLE,
+#     DETECTED and BURN) are in raspbot_state.py
+#
+    DETECTION_PARAMS = DetectionParams( \
+        person_temp_threshold=PERSON_TEMP_THRESHOLD, \
+        burn_hazard_temp=BURN_HAZARD_TEMP, \
+        burn_hazard_hit=BURN_HAZARD_HIT, \
+        person_hit_count=PERSON_HIT_COUNT, \
+        probable_person_thresh=PROBABLE_PERSON_THRESH, \
+        possible_person_max=POSSIBLE_PERSON_MAX, \
+        servo_type=SERVO_TYPE, \
+        move_dist_close=MOVE_DIST_CLOSE, \
+        move_dist_short=MOVE_DIST_SHORT, \
+        move_dist_medium=MOVE_DIST_MEDIUM, \
+        move_dist_far=MOVE_DIST_FAR)
+# initialize the servo to face directly forward
+    PERSON = PersonContext(DETECTION_PARAMS, Robot(), CTR_SERVO_POSITION)
+# servo travel from the head position to the middle of each sensor
+# column; element column 0 is the far right (counterclockwise) one
+    COLUMN_WIDTH = SENSOR_VIEW/DEGREES_PER_US/4
+    TRACKER = Tracker([resolve_new_position(True, 0, COLUMN_WIDTH*n, \
+                                            SERVO_TYPE) \
+                       for n in (-1.5, -0.5, 0.5, 1.5)], \
+                      PERSON_TEMP_THRESHOLD)
+
+    if RECORD:
+        RECORDER = FrameRecorder(RECORD_DIR)
     EXERSIZE_TIMEOUT = 1200   # seconds between exersize reminders
     EXERSIZE_TIMEOUT_BLINKS = 10    # number of times to blink LEDs
                                     # each blink takes 2 seconds
+    EXERCISE_PATTERN = blink('exercise', [ALL_RED_LEDS, ALL_YEL_LEDS, \
+                                          ALL_GRN_LEDS], 0.3, 0.3, \
+                             EXERSIZE_TIMEOUT_BLINKS, PRIORITY_REMINDER, \
+                             LED_ON, LED_OFF)
     
 # setup the IR color window
     if MONITOR:
-        SCREEN_DISPLAY = pygame.display.set_mode(SCREEN_DIMENSIONS)
-        pygame.display.set_caption('IR temp array')
-
 # initialize the window QUADRANT areas for displaying temperature
         PIXEL_WIDTH = SCREEN_DIMENSIONS[0]/4
         PX = (PIXEL_WIDTH*3, PIXEL_WIDTH*2, PIXEL_WIDTH, 0)
@@ -951,562 +1714,46 @@ try:
                         (SCREEN_DIMENSIONS[1]/12)+SCREEN_DIMENSIONS[0])
 
 #############################
-# Main while loop
+# Control loop tasks
 #############################
-    MAIN_LOOP_COUNT = 0
-    while True:                 # The main loop
-        MAIN_LOOP_COUNT += 1
-        CPU_TEMP = getCPUtemperature()
-        debug_print('\r\n^^^^^^^^^^^^^^^^^^^^\r\n    MAIN_WHILE_LOOP: '\
-                    +str(MAIN_LOOP_COUNT)+' Pcount: ' \
-                    +str(P_DETECT_COUNT)+ \
-                    ' Servo: '+str(SERVO_POSITION)+' CPU: '+ \
-                    str(CPU_TEMP)+' Uptime(sec) = '+str(get_uptime())+ \
-                    '\r\n^^^^^^^^^^^^^^^^^^^^')
-# Check for overtemp
-        if (CPU_TEMP >= 105.0):
-            if CPU_105_ON:
-                play_sound(MAX_VOLUME, CPU_105_FILE_NAME)
-#                    debug_print('Played 105 audio')
-        elif (CPU_TEMP >= 110.0):
-            play_sound(MAX_VOLUME, CPU_110_FILE_NAME)
-#                debug_print('Played 110 audio')
-        elif (CPU_TEMP >= 115.0):
-            play_sound(MAX_VOLUME, CPU_115_FILE_NAME)
-#                debug_print('Played 115 audio')
-        elif (CPU_TEMP >= 120.0):
-            play_sound(MAX_VOLUME, CPU_120_FILE_NAME)
-#                debug_print('Played 120 audio')
-        elif (CPU_TEMP >= 125.0):
-            play_sound(MAX_VOLUME, CPU_125_FILE_NAME)
-#                debug_print('Played 125 audio')
-
-# periododically, write the log file to disk
-        if MAIN_LOOP_COUNT >= LOG_MAX:
-            debug_print('\r\nLoop count max reached (' \
-                +str(MAIN_LOOP_COUNT)+' at '+str(datetime.now()))
-            MAIN_LOOP_COUNT = 0      # reset the counter
-            debug_print('\r\nClosing log file at '+str(datetime.now()))
-            LOGFILE_HANDLE.close       # for forensic analysis
-
-            LOGFILE_HANDLE = open(LOGFILE_NAME, 'wb')
-            debug_print('\r\nLog file re-opened at ' \
-                        +str(datetime.now()))
-            debug_print(LOGFILE_OPEN_STRING)
-            debug_print(LOGFILE_ARGS_STRING)
-            debug_print(LOGFILE_TEMP_STRING)
-            debug_print('person temp threshold = ' \
-                       +str(PERSON_TEMP_THRESHOLD))
-# Display the Omron internal temperature
-            debug_print('Servo Type: '+str(SERVO_TYPE))
-
-# reinitialize the mixer; for some reason the audio drops out
-# after extended periods of operating time. See if this fixes
-            pygame.mixer.init()
-
-# start roaming again            
-            NO_PERSON_COUNT = 0
-            P_DETECT_COUNT  = 0
-            ROAM_COUNT = 0
-
-        if (LED_STATE == False):
-            LED_STATE = True
-#                debug_print('Turning LED on')
-            GPIO.output(LED_GPIO_PIN, LED_STATE)
-        else:
-            LED_STATE = False
-#                debug_print('Turning LED off')
-            GPIO.output(LED_GPIO_PIN, LED_STATE)
-            
-        time.sleep(MEASUREMENT_WAIT_PERIOD)
-
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                CRASH_MSG = '\r\npygame event QUIT'
-                crash_and_burn(CRASH_MSG, pygame, SERVO_HANDLE, \
-                               LOGFILE_HANDLE)
-            if event.type == KEYDOWN:
-                if event.key == K_q or event.key == K_ESCAPE:
-                    CRASH_MSG = \
-                    '\r\npygame event: keyboard q or esc pressed'
-                    crash_and_burn(CRASH_MSG, pygame, \
-                                   SERVO_HANDLE, LOGFILE_HANDLE)
-
-# read the raw temperature data
-# 
-        (BYTES_READ, TEMPERATURE_ARRAY, ROOM_TEMP) = \
-            omron_read(OMRON1_HANDLE, DEGREE_UNIT, \
-            OMRON_BUFFER_LENGTH, PIGPIO_HANDLE)
-        OMRON_READ_COUNT += 1
-     
-# Display each element's temperature in F
-#            debug_print('New temperature measurement')
-#            print_temps(TEMPERATURE_ARRAY)
-
-        if BYTES_READ != OMRON_BUFFER_LENGTH: # sensor problem
-            OMRON_ERROR_COUNT += 1
-            debug_print( \
-                'ERROR: Omron thermal sensor failure! Bytes read: '\
-                +str(BYTES_READ))
-            panic()
-
-        if MONITOR:
-# create the IR pixels
-            for i in range(0, OMRON_DATA_LIST):
-# This fills each array square with a color that matches the temp
-                SCREEN_DISPLAY.fill(fahrenheit_to_rgb(MAX_TEMP, \
-                            MIN_TEMP, TEMPERATURE_ARRAY[i]), \
-                            QUADRANT[i])
-# Display temp value
-                if TEMPERATURE_ARRAY[i] > PERSON_TEMP_THRESHOLD:
-                    SCREEN_TEXT = \
-                        FONT.render("%.1f"%TEMPERATURE_ARRAY[i], \
-                                    1, name_to_rgb('red'))
-                else:
-                    SCREEN_TEXT = \
-                        FONT.render("%.1f"%TEMPERATURE_ARRAY[i], \
-                                    1, name_to_rgb('navy'))
-                SCREEN_TEXT_POS = SCREEN_TEXT.get_rect()
-                SCREEN_TEXT_POS.center = CENTER[i]
-                SCREEN_DISPLAY.blit(SCREEN_TEXT, SCREEN_TEXT_POS)
-
-# Create an area to display the room temp and messages
-            SCREEN_DISPLAY.fill(fahrenheit_to_rgb(MAX_TEMP, \
-                                MIN_TEMP, ROOM_TEMP), \
-                                ROOM_TEMP_AREA)
-            SCREEN_TEXT = FONT.render("Room: %.1f"%ROOM_TEMP, 1, \
-                                name_to_rgb('navy'))
-            SCREEN_TEXT_POS = SCREEN_TEXT.get_rect()
-            SCREEN_TEXT_POS.center = ROOM_TEMP_MSG_XY
-            SCREEN_DISPLAY.blit(SCREEN_TEXT, SCREEN_TEXT_POS)
-
-# update the screen
-            pygame.display.update()
-
-# testing panic
-#        panic()
-        
-###########################
-# Analyze sensor data
-###########################
-
-        PREVIOUS_HIT_COUNT = HIT_COUNT
-        HIT_COUNT = 0
-        HIT_ARRAY = [0, 0, 0, 0]
-        HIT_ARRAY_TEMP = \
-                    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-        # go through each array element to find person "hits"
-        # max hit count is 4 unless there is a burn hazard
-        for element in range(0, OMRON_DATA_LIST):
-            if (TEMPERATURE_ARRAY[element] > \
-                BURN_HAZARD_TEMP):
-                HIT_ARRAY_TEMP[element] = BURN_HAZARD_HIT
-                HIT_COUNT += 1
-                
-            elif (TEMPERATURE_ARRAY[element] > \
-                  PERSON_TEMP_THRESHOLD):
-                HIT_ARRAY_TEMP[element] += 1
-                HIT_COUNT += 1
-
-            else:
-                HIT_ARRAY_TEMP[element] = 0
-                
-        # far left column
-        HIT_ARRAY[0] = HIT_ARRAY_TEMP[12]+HIT_ARRAY_TEMP[13]+ \
-                     HIT_ARRAY_TEMP[14]+HIT_ARRAY_TEMP[15]
-        HIT_ARRAY[1] = HIT_ARRAY_TEMP[8]+HIT_ARRAY_TEMP[9]+ \
-                     HIT_ARRAY_TEMP[10]+HIT_ARRAY_TEMP[11] 
-        HIT_ARRAY[2] = HIT_ARRAY_TEMP[4]+HIT_ARRAY_TEMP[5]+ \
-                     HIT_ARRAY_TEMP[6]+HIT_ARRAY_TEMP[7] 
-        # far right column
-        HIT_ARRAY[3] = HIT_ARRAY_TEMP[0]+HIT_ARRAY_TEMP[1]+ \
-                     HIT_ARRAY_TEMP[2]+HIT_ARRAY_TEMP[3] 
-
-        GPIO.output(LED0_RED, LED_OFF)
-        GPIO.output(LED0_YEL, LED_OFF)
-        GPIO.output(LED0_GRN, LED_OFF)
-        if (HIT_ARRAY[0] == 1):
-            GPIO.output(LED0_YEL, LED_ON)
-        elif (HIT_ARRAY[0] >= 2 and HIT_ARRAY[0] <= 4):
-            GPIO.output(LED0_GRN, LED_ON)
-        elif (HIT_ARRAY[0] > 4):
-            GPIO.output(LED0_RED, LED_ON)
-            
-        GPIO.output(LED1_RED, LED_OFF)
-        GPIO.output(LED1_YEL, LED_OFF)
-        GPIO.output(LED1_GRN, LED_OFF)
-        if (HIT_ARRAY[1] == 1):
-            GPIO.output(LED1_YEL, LED_ON)
-        elif (HIT_ARRAY[1] >= 2 and HIT_ARRAY[1] <= 4):
-            GPIO.output(LED1_GRN, LED_ON)
-        elif (HIT_ARRAY[1] > 4):
-            GPIO.output(LED1_RED, LED_ON)
-            
-        GPIO.output(LED2_RED, LED_OFF)
-        GPIO.output(LED2_YEL, LED_OFF)
-        GPIO.output(LED2_GRN, LED_OFF)
-        if (HIT_ARRAY[2] == 1):
-            GPIO.output(LED2_YEL, LED_ON)
-        elif (HIT_ARRAY[2] >= 2 and HIT_ARRAY[2] <= 4):
-            GPIO.output(LED2_GRN, LED_ON)
-        elif (HIT_ARRAY[2] > 4):
-            GPIO.output(LED2_RED, LED_ON)
-            
-        GPIO.output(LED3_RED, LED_OFF)
-        GPIO.output(LED3_YEL, LED_OFF)
-        GPIO.output(LED3_GRN, LED_OFF)
-        if (HIT_ARRAY[3] == 1):
-            GPIO.output(LED3_YEL, LED_ON)
-        elif (HIT_ARRAY[3] >= 2 and HIT_ARRAY[3] <= 4):
-            GPIO.output(LED3_GRN, LED_ON)
-        elif (HIT_ARRAY[3] > 4):
-            GPIO.output(LED3_RED, LED_ON)
-                             
-        debug_print('\r\n-----------------------\r\nhit array: '+\
-                    str(HIT_ARRAY[0])+str(HIT_ARRAY[1])+ \
-                    str(HIT_ARRAY[2])+str(HIT_ARRAY[3])+ \
-                    '\r\nhit count: '+str(HIT_COUNT)+ \
-                    '\r\n-----------------------')
-
-        if max(TEMPERATURE_ARRAY) > BURN_HAZARD_TEMP:
-            PERSON_STATE = STATE_BURN
-
-###########################
-# Burn Hazard Detected !
-###########################
-        if (PERSON_STATE == STATE_BURN):
-            debug_print('STATE: BURN: Burn Hazard cnt: ' \
-                       +str(BURN_HAZARD_CNT)+' ROAM_COUNT = ' \
-                       +str(ROAM_COUNT))
-            ROAM_COUNT = 0
-            POSSIBLE_PERSON = 0
-            BURN_HAZARD_CNT += 1
-            LED_STATE = True
-            GPIO.output(LED_GPIO_PIN, LED_STATE)
-            if MONITOR:
-                SCREEN_DISPLAY.fill(name_to_rgb('red'), \
-                                    MESSAGE_AREA)
-                SCREEN_TEXT = FONT.render("WARNING! Burn danger!", \
-                                          1, name_to_rgb('yellow'))
-                SCREEN_TEXT_POS = SCREEN_TEXT.get_rect()
-                SCREEN_TEXT_POS.center = MESSAGE_AREA_XY
-                SCREEN_DISPLAY.blit(SCREEN_TEXT, SCREEN_TEXT_POS)
-# update the screen
-                pygame.display.update()
-
-            debug_print('\r\n'+"Burn hazard temperature is " \
-                       +"%.1f"%max(TEMPERATURE_ARRAY)+" degrees")
-            
-            # play this only once, otherwise, its too annoying
-            if (BURN_HAZARD_CNT == 1):
-                play_sound(MAX_VOLUME, BURN_FILE_NAME)
-                debug_print('Played Burn warning audio')
-
-            MOVE_DIST = 0
-            MOVE_CW = True
-            HAZARD_POSITION = 0
-            
-            if (HIT_ARRAY[0] > BURN_HAZARD_HIT and \
-                HIT_ARRAY[1] < BURN_HAZARD_HIT and \
-                HIT_ARRAY[2] < BURN_HAZARD_HIT and \
-                HIT_ARRAY[3] < BURN_HAZARD_HIT):
-                    MOVE_DIST = MOVE_DIST_SHORT
-                    MOVE_CW = True
-
-            elif (HIT_ARRAY[0] < BURN_HAZARD_HIT and \
-                  HIT_ARRAY[1] < BURN_HAZARD_HIT and \
-                  HIT_ARRAY[2] < BURN_HAZARD_HIT and \
-                  HIT_ARRAY[3] > BURN_HAZARD_HIT):
-                      MOVE_DIST = MOVE_DIST_SHORT
-                      MOVE_CW = False
-
-            if (MOVE_DIST > 0):
-                HAZARD_POSITION = \
-                    resolve_new_position(MOVE_CW, \
-                                         SERVO_POSITION, \
-                                         MOVE_DIST)
-                debug_print('hazard_position: Pos: '+ \
-                            str(HAZARD_POSITION))
-                SERVO_POSITION = move_head(HAZARD_POSITION, \
-                                           SERVO_POSITION)
-
-            if max(TEMPERATURE_ARRAY) > BURN_HAZARD_TEMP:
-                PERSON_STATE = STATE_BURN
-            else:
-# Drop back to looking for a person
-                PERSON_STATE = STATE_NOTHING
-
-##                if CONNECTED:
-##                    try:
-##                        speakSpeechFromText("The temperature is "+ \
-##                            "%.1f"%max(TEMPERATURE_ARRAY)+ \
-##                            " degrees fahrenheit", "mtemp.mp3")
-##                        play_sound(MAX_VOLUME, "mtemp.mp3")
-##                    except:
-##                        continue
-
-###########################
-# No Person Detected
-###########################
-# State 0: NOTHING - no heat source in view
-#     Event 0: No change - outcome: continue waiting for a person
-#     Event 1: One or more sensors cross the person threshold
-#
-        elif (PERSON_STATE == STATE_NOTHING):
-            debug_print('STATE: NOTHING: No Person cnt: ' \
-                       +str(NO_PERSON_COUNT)+' ROAM_COUNT = ' \
-                       +str(ROAM_COUNT))
-            NO_PERSON_COUNT += 1
-            P_DETECT_COUNT = 0
-            POSSIBLE_PERSON = 0
-            PROBABLE_PERSON = 0
-            BURN_HAZARD_CNT = 0
-            if MONITOR:
-                SCREEN_DISPLAY.fill(name_to_rgb('white'), \
-                                    MESSAGE_AREA)
-                SCREEN_TEXT = FONT.render("Waiting...", 1, \
-                                   name_to_rgb('blue'))
-                SCREEN_TEXT_POS = SCREEN_TEXT.get_rect()
-                SCREEN_TEXT_POS.center = MESSAGE_AREA_XY
-                SCREEN_DISPLAY.blit(SCREEN_TEXT, SCREEN_TEXT_POS)
-# update the screen
-                pygame.display.update()
-            if (HIT_COUNT == 0 or PREVIOUS_HIT_COUNT == 0):
-                PERSON_STATE = STATE_NOTHING
-            else:
-                PERSON_STATE = STATE_POSSIBLE
-
-            (ROAM_COUNT, SERVO_POSITION, SERVO_DIRECTION, \
-             LAST_KNOWN_LED_POS, LIT_LED) = \
-            servo_roam(ROAM_COUNT, SERVO_POSITION, SERVO_DIRECTION, \
-                       LAST_KNOWN_LED_POS, LIT_LED)
-            
-            PREV_PERSON_STATE = STATE_NOTHING
-                
-###########################
-# Possible Person Detected
-###########################
-# State 1: Possible person in view - one or more sensors had a hit
-#     Event 0: No hits - blip, move to State 0
-#     Event 1: One hit - move head to try to center on the hit
-#     Event 2: More than one hit - state 2
-#
-        elif (PERSON_STATE == STATE_POSSIBLE):
-            BURN_HAZARD_CNT = 0
-            debug_print('STATE: POSSIBLE: Possible Person cnt: ' \
-                       +str(POSSIBLE_PERSON))
-            NO_PERSON_COUNT += 1
-            if (HIT_COUNT == 0 or PREVIOUS_HIT_COUNT == 0):
-                PERSON_STATE = STATE_NOTHING
-            elif (HIT_COUNT == 1 and PREVIOUS_HIT_COUNT >= 1):
-                P_DETECT, PERSON_POSITION = \
-                    person_position_1_hit(HIT_ARRAY, SERVO_POSITION)
-                # stay in possible state
-                if (P_DETECT):
-                    POSSIBLE_PERSON += 1
-                    if (POSSIBLE_PERSON > POSSIBLE_PERSON_MAX):
-                        POSSIBLE_PERSON = 0
-                        SERVO_POSITION = \
-                            move_head(PERSON_POSITION, \
-                                      SERVO_POSITION)
-                        ROAM_COUNT = 0
-                else:
-                    PERSON_STATE = STATE_NOTHING
-            else:
-                PERSON_STATE = STATE_LIKELY
-
-            (ROAM_COUNT, SERVO_POSITION, SERVO_DIRECTION, \
-             LAST_KNOWN_LED_POS, LIT_LED) = \
-            servo_roam(ROAM_COUNT, SERVO_POSITION, SERVO_DIRECTION, \
-                       LAST_KNOWN_LED_POS, LIT_LED)
-            
-            PREV_PERSON_STATE = STATE_POSSIBLE
-            
-###########################
-# Likely Person Detected
-###########################
-# State 2: Likely person in view - more than one sensor had a hit
-#     Event 0: No hits - blip, move to State 1
-#     Event 1: One hit - noise, no change
-#     Event 2: more than one sensor still has a hit, move head, State 3
-#
-        elif (PERSON_STATE == STATE_LIKELY):
-            BURN_HAZARD_CNT = 0
-            debug_print('STATE: LIKELY: No Person cnt: ' \
-                        +str(NO_PERSON_COUNT))
-            POSSIBLE_PERSON = 0
-            NO_PERSON_COUNT += 1
-            if (HIT_COUNT == 0 or PREVIOUS_HIT_COUNT == 0):
-                PERSON_STATE = STATE_NOTHING
-            else:
-                P_DETECT, PERSON_POSITION = \
-                          person_position_2_hit(HIT_ARRAY, \
-                                                SERVO_POSITION)
-                if (not P_DETECT):
-                    PERSON_STATE = STATE_POSSIBLE
-                else:
-                    SERVO_POSITION = move_head(PERSON_POSITION, \
-                                               SERVO_POSITION)
-                    ROAM_COUNT = 0
-                    
-                if (HIT_COUNT > PERSON_HIT_COUNT):
-                    PERSON_STATE = STATE_PROBABLE
-            
-            PREV_PERSON_STATE = STATE_LIKELY
-
-###########################
-# Probable Person Detected
-###########################
-# State 3: Probably a person in view
-#     Event 0: No hits - noise, move to State 2
-#     Event 1: One hit - noise, move to state 2
-#     Event 2: more than one sensor has a hit, move head, say hello
-#
-        elif (PERSON_STATE == STATE_PROBABLE):
-            BURN_HAZARD_CNT = 0
-            POSSIBLE_PERSON = 0
-            debug_print('STATE: PROBABLE: Probable Person cnt: ' \
-                        +str(PROBABLE_PERSON))
-            if (HIT_COUNT == 0 or PREVIOUS_HIT_COUNT == 0):
-                PERSON_STATE = STATE_LIKELY
-            elif (HIT_COUNT == 1 and PREVIOUS_HIT_COUNT >= 1):
-                P_DETECT, PERSON_POSITION = \
-                    person_position_1_hit(HIT_ARRAY, \
-                                          SERVO_POSITION)
-                if (P_DETECT):
-                    SERVO_POSITION = move_head(PERSON_POSITION, \
-                                               SERVO_POSITION)
-                    ROAM_COUNT = 0
-                else:
-                    PERSON_STATE = STATE_LIKELY
-            else:
-                P_DETECT, PERSON_POSITION = \
-                          person_position_2_hit(HIT_ARRAY, \
-                                                SERVO_POSITION)
-                if (P_DETECT):
-                    SERVO_POSITION = move_head(PERSON_POSITION, \
-                                               SERVO_POSITION)
-                    ROAM_COUNT = 0
-                    PROBABLE_PERSON += 1
-                    if (PROBABLE_PERSON > PROBABLE_PERSON_THRESH \
-                        and HIT_COUNT > 5):
-                        say_hello()
-                        detected_time_stamp = get_uptime()
-                        debug_print('Person detected at '+str(detected_time_stamp))
-                        PERSON_STATE = STATE_DETECTED
-                        PROBABLE_PERSON = 0
-                    else:
-                        PERSON_STATE = STATE_PROBABLE
-                else:
-                    PERSON_STATE = STATE_LIKELY
-
-            PREV_PERSON_STATE = STATE_PROBABLE
-
-###########################
-# Person Detected !
-###########################
-# State 4: Person detected
-#     Event 0: No hits - person left, say goodbye, move to state 0
-#     Event 1: One hit - person left, say goodbye, move to state 1
-#     Event 2: more than one sensor, move head to position, stay
-#     
-        elif (PERSON_STATE == STATE_DETECTED):
-            BURN_HAZARD_CNT = 0
-            debug_print('STATE: DETECTED: detect cnt: ' \
-                       +str(P_DETECT_COUNT))
-            ROAM_COUNT = 0
-            NO_PERSON_COUNT = 0
-            POSSIBLE_PERSON = 0
-            LED_STATE = True
-            GPIO.output(LED_GPIO_PIN, LED_STATE)
-            P_DETECT_COUNT += 1
-            CPU_TEMP = getCPUtemperature()
-            debug_print('Person_count: '+str(P_DETECT_COUNT)+ \
-                       ' Max: '+"%.1f"%max(TEMPERATURE_ARRAY)+ \
-                       ' Servo: '+str(SERVO_POSITION)+' CPU: ' \
-                       +str(CPU_TEMP))
-
-# every 20 minutes that a person is detected, have the bot remind
-# the person to get some excersize.
-
-            uptime_now = get_uptime()
-            if (uptime_now - detected_time_stamp) >= EXERSIZE_TIMEOUT:
-                play_sound(MAX_VOLUME, STRETCH_FILE_NAME)
-                detected_time_stamp = uptime_now    # reset
-                for b in range(0, EXERSIZE_TIMEOUT_BLINKS):
-                    GPIO.output(LED0_GRN, LED_OFF)
-                    GPIO.output(LED1_GRN, LED_OFF)
-                    GPIO.output(LED2_GRN, LED_OFF)
-                    GPIO.output(LED3_GRN, LED_OFF)
-                    GPIO.output(LED0_YEL, LED_OFF)
-                    GPIO.output(LED1_YEL, LED_OFF)
-                    GPIO.output(LED2_YEL, LED_OFF)
-                    GPIO.output(LED3_YEL, LED_OFF)
-                    GPIO.output(LED0_RED, LED_ON)
-                    GPIO.output(LED1_RED, LED_ON)
-                    GPIO.output(LED2_RED, LED_ON)
-                    GPIO.output(LED3_RED, LED_ON)
-                    time.sleep(0.3)
-                    GPIO.output(LED0_RED, LED_OFF)
-                    GPIO.output(LED1_RED, LED_OFF)
-                    GPIO.output(LED2_RED, LED_OFF)
-                    GPIO.output(LED3_RED, LED_OFF)
-                    time.sleep(0.3)
-                    GPIO.output(LED0_YEL, LED_ON)
-                    GPIO.output(LED1_YEL, LED_ON)
-                    GPIO.output(LED2_YEL, LED_ON)
-                    GPIO.output(LED3_YEL, LED_ON)
-                    time.sleep(0.3)
-                    GPIO.output(LED0_YEL, LED_OFF)
-                    GPIO.output(LED1_YEL, LED_OFF)
-                    GPIO.output(LED2_YEL, LED_OFF)
-                    GPIO.output(LED3_YEL, LED_OFF)
-                    time.sleep(0.3)
-                    GPIO.output(LED0_GRN, LED_ON)
-                    GPIO.output(LED1_GRN, LED_ON)
-                    GPIO.output(LED2_GRN, LED_ON)
-                    GPIO.output(LED3_GRN, LED_ON)
-                    time.sleep(0.3)
-                    GPIO.output(LED0_GRN, LED_OFF)
-                    GPIO.output(LED1_GRN, LED_OFF)
-                    GPIO.output(LED2_GRN, LED_OFF)
-                    GPIO.output(LED3_GRN, LED_OFF)
-                    time.sleep(0.3)
-
-            if (HIT_COUNT == 0 or PREVIOUS_HIT_COUNT == 0):
-                say_goodbye()
-                PERSON_STATE = STATE_NOTHING
-            elif (HIT_COUNT >= 1 and \
-                  HIT_COUNT <= PERSON_HIT_COUNT ):
-                say_goodbye()
-                PERSON_STATE = STATE_POSSIBLE
-# hit count needs to be above PERSON_HIT_COUNT to validate a person
-            else:
-                P_DETECT, PERSON_POSITION = \
-                          person_position_2_hit(HIT_ARRAY, \
-                                                SERVO_POSITION)
-                if (P_DETECT):
-                    SERVO_POSITION = move_head(PERSON_POSITION, \
-                                               SERVO_POSITION)
-                else:
-                    PERSON_STATE = STATE_LIKELY
-                    say_goodbye()
-
-            PREV_PERSON_STATE = STATE_DETECTED
-
-###########################
-# Invalid state
-###########################
+# The robot's jobs are tasks of one runtime instead of one loop of
+# sleeps (see raspbot_runtime.py); run() only returns by an exception
+    SENSE_TASK = RUNTIME.every('sense', MEASUREMENT_WAIT_PERIOD, sense, \
+                               deadline=MEASUREMENT_WAIT_PERIOD)
+    HEARTBEAT_TASK = RUNTIME.every('heartbeat', MEASUREMENT_WAIT_PERIOD, \
+                                   heartbeat)
+    RUNTIME.every('audio', AUDIO_POLL_PERIOD, play_queued_sound)
+    RUNTIME.every('cpu', CPU_CHECK_PERIOD, check_cpu_temperature)
+    if MONITOR:
+        RUNTIME.every('events', EVENT_POLL_PERIOD, check_events)
+    CONFIG_WATCHER = ConfigWatcher(CONFIG_FILE, CONFIG, reload_config, \
+                                   sys.argv, debug_print)
+    RUNTIME.every('config', CONFIG_CHECK_PERIOD, CONFIG_WATCHER.check)
+    RUNTIME.every('occupancy', OCCUPANCY_SAVE_PERIOD, save_occupancy, \
+                  delay=OCCUPANCY_SAVE_PERIOD)
+    CONTROL = ControlServer(CONTROL_SOCKET, CONTROL_COMMANDS, debug_print)
+    try:
+        CONTROL.start()
+        RUNTIME.every('control', CONTROL_PERIOD, CONTROL.serve)
+    except (socket.error, OSError) as error:
+        debug_print('No control socket: '+str(error))
+        CONTROL = None
+    if RECORD or os.path.isdir(RECORD_DIR):
+        EXPORTER = Exporter(RECORD_DIR, EXPORT_DIR, EXPORT_REMOVE, \
+                            debug_print)
+        EXPORTER.start()
+    if REALTIME:
+        if not set_fifo():
+            debug_print('Real time: no SCHED_FIFO priority (not root?)')
+        if isolate(REALTIME_CPU):
+            RUNTIME.every('affinity', ISOLATE_PERIOD, \
+                          lambda: isolate(REALTIME_CPU))
         else:
-            PERSON_STATE = STATE_NOTHING
-            (ROAM_COUNT, SERVO_POSITION, SERVO_DIRECTION, \
-             LAST_KNOWN_LED_POS, LIT_LED) = \
-            servo_roam(ROAM_COUNT, SERVO_POSITION, SERVO_DIRECTION, \
-                       LAST_KNOWN_LED_POS, LIT_LED)
-                       
-#############################
-# End main while loop
-#############################
+            debug_print('Real time: the control loop shares its CPU')
+    RUNTIME.run()
+# only the control socket's shutdown stops the runtime
+    shut_down('\r\nShut down by the control socket', pygame, SERVO_HANDLE, \
+              LOGFILE_HANDLE)
 
 except KeyboardInterrupt:
     print 'Keyboard Interrupt Exception!'
@@ -1515,11 +1762,13 @@ except KeyboardInterrupt:
 
 except IOError:
     print 'I/O Error Exception!'
-    GPIO.output(LED0_GRN, LED_OFF)
-    GPIO.output(LED0_RED, LED_ON)
+    set_led(LED0_GRN, LED_OFF)
+    set_led(LED0_RED, LED_ON)
     # do not close the logfile here
     # allows the previous logfile to stay intact for a forensic analysis
     debug_print('\r\nI/O Error; quitting')
+    if OMRON_WATCHDOG is not None:
+        debug_print('Omron sensor: '+OMRON_WATCHDOG.report())
     if SERVO_ENABLED:
         SERVO_HANDLE.stop_servo(SERVO_GPIO_PIN)
     panic()
@@ -0,0 +1,189 @@
+"""
+# Boot sequencer for the raspbot
+# GNU GPL V3
+#
+# Bringing up the robot used to be one long serial list: pygame, the
+# I2C bus, the servo, pigpio, the LEDs, the Omron sensor, the mixer.
+# Most of those don't depend on each other, so the sequencer starts each
+# phase as soon as the phases it needs are done, in its own thread.
+# Phases that must run on the main thread (SDL display) run there while
+# the others come up in the background. Background phases are started
+# with the rest but run() doesn't wait for them, so they stay off the
+# path to the first sensor frame. Lazy phases are not started at boot
+# at all; they run the first time something require()s them.
+#
+# Example:
+#     boot = BootSequencer()
+#     boot.add('i2c', open_i2c)
+#     boot.add('pigpio', pigpio.pi)
+#     boot.add('sensor', init_sensor, after=('i2c', 'pigpio'))
+#     boot.add('display', open_window, lazy=not MONITOR, main_thread=True)
+#     boot.add('audio', pygame.mixer.init, background=True)
+#     boot.run()
+#     handle = boot.result('sensor')
+#     for line in boot.report(): print(line)
+#
+# Heavy optional modules (pygame, webcolors, pycurl) are imported when
+# they are first needed with timed_import(), which keeps how long each
+# import took. "python raspbot_boot.py pygame webcolors" measures the
+# import times of modules on this machine.
+
+# Feb 2015
+"""
+import importlib
+import sys
+import threading
+import time
+
+IMPORT_TIMES = []       # (module name, seconds) of each timed_import
+_IMPORT_LOCK = threading.Lock()
+
+def timed_import(name):
+    """
+    Import a module the first time it is needed and keep how long the
+    import took in IMPORT_TIMES
+    """
+    with _IMPORT_LOCK:      # a module being imported is already in sys.modules
+        module = sys.modules.get(name)
+        if module is None:
+            start = time.time()
+            module = importlib.import_module(name)
+            IMPORT_TIMES.append((name, time.time() - start))
+        return module
+
+class BootPhase(object):
+    """
+    One thing to bring up
+    """
+    __slots__ = ('name', 'func', 'after', 'lazy', 'main_thread', \
+                 'background', 'result', 'error', 'start', 'end', 'done', \
+                 'lock')
+
+    def __init__(self, name, func, after, lazy, main_thread, background):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.lazy = lazy
+        self.main_thread = main_thread
+        self.background = background
+        self.result = None
+        self.error = None
+        self.start = None
+        self.end = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+class BootSequencer(object):
+    """
+    Brings up independent subsystems concurrently and times them
+    """
+    def __init__(self):
+        self.phases = {}
+        self.order = []
+        self.t0 = time.time()
+
+    def add(self, name, func, after=(), lazy=False, main_thread=False, \
+            background=False):
+        """
+        Add a phase; func() is called with no arguments and its return
+        value is kept for result(name)
+        """
+        self.phases[name] = BootPhase(name, func, after, lazy, main_thread, \
+                                      background)
+        self.order.append(name)
+
+    def _run_phase(self, phase):
+        with phase.lock:
+            if phase.done.is_set():
+                return
+            try:
+                for name in phase.after:
+                    self.require(name)
+                phase.start = time.time()
+                phase.result = phase.func()
+            except Exception:
+                phase.error = sys.exc_info()
+            phase.end = time.time()
+            phase.done.set()
+
+    def run(self):
+        """
+        Run every phase that isn't lazy and wait for the ones that aren't
+        background phases; the first error from those is raised here
+        """
+        self.t0 = time.time()
+        threads = []
+        for name in self.order:
+            phase = self.phases[name]
+            if phase.lazy or phase.main_thread:
+                continue
+            thread = threading.Thread(target=self._run_phase, args=(phase,), \
+                                      name='boot-'+name)
+            thread.daemon = True
+            thread.start()
+            if not phase.background:
+                threads.append(thread)
+        for name in self.order:
+            phase = self.phases[name]
+            if phase.main_thread and not phase.lazy:
+                self._run_phase(phase)
+        for thread in threads:
+            thread.join()
+        for name in self.order:
+            if not self.phases[name].background:
+                self._raise(self.phases[name])
+
+    def _raise(self, phase):
+        if phase.error is not None:
+            (exc_type, exc_value, exc_tb) = phase.error
+            raise exc_value
+
+    def require(self, name):
+        """
+        Result of a phase, bringing it up now if it is lazy
+        """
+        phase = self.phases[name]
+        if not phase.done.is_set():
+            if phase.lazy:
+                self._run_phase(phase)
+            phase.done.wait()
+        self._raise(phase)
+        return phase.result
+
+    def result(self, name):
+        return self.require(name)
+
+    def started(self, name):
+        """
+        True if the phase has been brought up (lazy phases may not be)
+        """
+        return self.phases[name].done.is_set()
+
+    def report(self):
+        """
+        Lines of per phase boot timings
+        """
+        lines = []
+        for name in self.order:
+            phase = self.phases[name]
+            if phase.start is None:
+                lines.append('%-10s deferred' % name)
+            elif phase.end is None:
+                lines.append('%-10s start %6.3fs running' % \
+                             (name, phase.start - self.t0))
+            else:
+                lines.append('%-10s start %6.3fs took %6.3fs%s' % \
+                             (name, phase.start - self.t0, \
+                              phase.end - phase.start, \
+                              ' FAILED' if phase.error else ''))
+        ended = [self.phases[n].end for n in self.order \
+                 if self.phases[n].end is not None]
+        if ended:
+            lines.append('%-10s %6.3fs' % ('boot', max(ended) - self.t0))
+        return lines
+
+if __name__ == '__main__':
+    for MODULE_NAME in sys.argv[1:]:
+        timed_import(MODULE_NAME)
+    for (MODULE_NAME, SECONDS) in IMPORT_TIMES:
+        print('%-20s %6.3fs' % (MODULE_NAME, SECONDS))
@@ -0,0 +1,194 @@
+"""
+# Calibration store for the raspbot
+# GNU GPL V3
+#
+# Keeps what used to be set by hand every boot in a small JSON file:
+#   - per element gain and offset for the Omron sensor (the lobes are
+#     not symmetrical; adjacent elements were measured 10% apart)
+#   - servo end points and center for this robot's servo
+# raspbot.py loads it at boot and skips the 20 second head calibration
+# wait when a valid calibration exists. "raspbot.py -calibrate" measures
+# a new one:
+#   1. with nothing warm in view, frames are averaged and each element
+#      gets an offset that brings it to the average of all elements
+#   2. with something warm (a hand) held still in front of the robot,
+#      the head is swept and the center is where the heat is centered
+#      between the two middle columns
+# A second, uniformly warm set of frames (e.g. a warm plate covering the
+# sensor) lets pixel_calibration() work out gains as well as offsets.
+
+# Feb 2015
+"""
+import os
+import json
+import time
+
+CALIBRATION_VERSION = 1
+OMRON_DATA_LIST = 16
+SERVO_RANGE = (500, 2500)   # anything outside this is not a servo pulse
+MAX_OFFSET = 20.0           # degrees; more than this is a broken sensor
+GAIN_RANGE = (0.5, 1.5)
+
+class Calibration(object):
+    """
+    One robot's calibration
+    """
+    __slots__ = ('servo_type', 'min_servo', 'max_servo', 'ctr_servo', \
+                 'pixel_gain', 'pixel_offset', 'created')
+
+    def __init__(self, servo_type, min_servo, max_servo, ctr_servo, \
+                 pixel_gain=None, pixel_offset=None, created=None):
+        self.servo_type = servo_type
+        self.min_servo = min_servo
+        self.max_servo = max_servo
+        self.ctr_servo = ctr_servo
+        self.pixel_gain = pixel_gain or [1.0]*OMRON_DATA_LIST
+        self.pixel_offset = pixel_offset or [0.0]*OMRON_DATA_LIST
+        self.created = created or time.time()
+
+    def apply(self, temperatures, out=None):
+        """
+        Calibrated copy of a list of element temperatures, or calibrate
+        them into out (which may be temperatures itself)
+        """
+        gain = self.pixel_gain
+        offset = self.pixel_offset
+        if out is None:
+            return [temperatures[i]*gain[i] + offset[i] \
+                    for i in range(len(temperatures))]
+        for i in range(len(temperatures)):
+            out[i] = temperatures[i]*gain[i] + offset[i]
+        return out
+
+    def problems(self, servo_type=None):
+        """
+        List of reasons this calibration can't be used (empty if valid)
+        """
+        found = []
+        if servo_type is not None and self.servo_type != servo_type:
+            found.append('servo type is '+str(self.servo_type))
+        for (name, value) in (('min_servo', self.min_servo), \
+                              ('max_servo', self.max_servo), \
+                              ('ctr_servo', self.ctr_servo)):
+            if not SERVO_RANGE[0] <= value <= SERVO_RANGE[1]:
+                found.append(name+' out of range: '+str(value))
+        if not min(self.min_servo, self.max_servo) < self.ctr_servo < \
+               max(self.min_servo, self.max_servo):
+            found.append('center is not between the end points')
+        if len(self.pixel_gain) != OMRON_DATA_LIST or \
+           len(self.pixel_offset) != OMRON_DATA_LIST:
+            found.append('wrong number of elements')
+        elif [g for g in self.pixel_gain \
+              if not GAIN_RANGE[0] <= g <= GAIN_RANGE[1]] or \
+             [o for o in self.pixel_offset if abs(o) > MAX_OFFSET]:
+            found.append('element gain or offset out of range')
+        return found
+
+    def to_dict(self):
+        return {'version': CALIBRATION_VERSION, \
+                'servo_type': self.servo_type, \
+                'min_servo': self.min_servo, \
+                'max_servo': self.max_servo, \
+                'ctr_servo': self.ctr_servo, \
+                'pixel_gain': self.pixel_gain, \
+                'pixel_offset': self.pixel_offset, \
+                'created': self.created}
+
+def save_calibration(calibration, path):
+    """
+    Write a calibration file; the old one stays until the new one is
+    completely written
+    """
+    temp_path = path+'.tmp'
+    fp = open(temp_path, 'w')
+    json.dump(calibration.to_dict(), fp, indent=1, sort_keys=True)
+    fp.flush()
+    os.fsync(fp.fileno())
+    fp.close()
+    os.rename(temp_path, path)
+
+def load_calibration(path, servo_type=None):
+    """
+    Returns (calibration, None) or (None, reason it can't be used)
+    """
+    try:
+        fp = open(path)
+        try:
+            data = json.load(fp)
+        finally:
+            fp.close()
+    except IOError:
+        return (None, 'no calibration file '+path)
+    except ValueError:
+        return (None, 'calibration file is corrupt')
+    if not isinstance(data, dict) or \
+       data.get('version') != CALIBRATION_VERSION:
+        return (None, 'calibration file version is not '+ \
+                str(CALIBRATION_VERSION))
+    try:
+        calibration = Calibration(int(data['servo_type']), \
+                                  int(data['min_servo']), \
+                                  int(data['max_servo']), \
+                                  int(data['ctr_servo']), \
+                                  [float(g) for g in data['pixel_gain']], \
+                                  [float(o) for o in data['pixel_offset']], \
+                                  float(data['created']))
+    except (KeyError, TypeError, ValueError):
+        return (None, 'calibration file is missing values')
+    found = calibration.problems(servo_type)
+    if found:
+        return (None, '; '.join(found))
+    return (calibration, None)
+
+def _element_means(frames):
+    count = float(len(frames))
+    return [sum([frame[i] for frame in frames])/count \
+            for i in range(OMRON_DATA_LIST)]
+
+def pixel_calibration(cold_frames, warm_frames=None):
+    """
+    Element (gains, offsets) from frames of a uniform scene
+    With only cold frames the gains are 1 and the offsets bring every
+    element to the average; warm frames of a second uniform scene give
+    a two point (gain and offset) calibration.
+    """
+    cold = _element_means(cold_frames)
+    cold_avg = sum(cold)/len(cold)
+    if not warm_frames:
+        return ([1.0]*OMRON_DATA_LIST, [cold_avg - c for c in cold])
+    warm = _element_means(warm_frames)
+    warm_avg = sum(warm)/len(warm)
+    gains = []
+    offsets = []
+    for i in range(OMRON_DATA_LIST):
+        span = warm[i] - cold[i]
+        gain = (warm_avg - cold_avg)/span if span > 0.5 else 1.0
+        gains.append(gain)
+        offsets.append(cold_avg - gain*cold[i])
+    return (gains, offsets)
+
+def find_center(samples):
+    """
+    Servo position that centers a heat source
+    samples is a list of (servo position, temperatures) from a sweep
+    past a warm object straight in front of the robot. For each sample
+    the heat's balance is (left columns - right columns); the center is
+    where the balance crosses zero with the most heat in view.
+    returns the servo position or None if there was no crossing
+    """
+    balanced = []
+    for (position, temps) in samples:
+        floor = min(temps)
+        left = sum(temps[8:16]) - 8*floor      # hit columns 0 and 1
+        right = sum(temps[0:8]) - 8*floor      # hit columns 2 and 3
+        balanced.append((position, left - right, left + right))
+    balanced.sort()
+    best = None
+    for ((p0, b0, h0), (p1, b1, h1)) in zip(balanced, balanced[1:]):
+        if (b0 <= 0 <= b1 or b1 <= 0 <= b0) and b0 != b1:
+            heat = h0 + h1
+            if best is None or heat > best[0]:
+                best = (heat, p0 + (p1 - p0)*(0 - b0)/float(b1 - b0))
+    if best is None:
+        return None
+    return int(round(best[1]))
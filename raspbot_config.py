@@ -0,0 +1,262 @@
+"""
+# Runtime configuration for the raspbot
+# GNU GPL V3
+#
+# Thresholds, timings, sound clips and PID gains used to be constants in
+# raspbot.py and the switches were command line flags, so every change
+# meant an edit and a restart: 20 seconds or more of boot and head
+# calibration each time. They are now in a small JSON file:
+#     {"version": 1, "person_temp_threshold": 81, "roam": true}
+# A setting left out keeps its default (SETTINGS below). The file is
+# checked as a whole when it is loaded (names, types, ranges and that
+# the thresholds make sense together) and a file with any problem is not
+# used at all.
+#
+# ConfigWatcher looks at the file's modification time and loads it again
+# when it changed. The new Config is handed to the robot between two
+# control loop tasks, so a frame never sees half an update. The hardware
+# switches (restart only) are reported instead of applied. Command line
+# flags still work and win over the file.
+#     (config, problem) = load_config(path, sys.argv)
+#     watcher = ConfigWatcher(path, config, apply, sys.argv)
+#     runtime.every('config', 2.0, watcher.check)
+# Write a new file next to the old one and rename it over, so the
+# watcher never reads a half written file.
+
+# Feb 2015
+"""
+import os
+import json
+
+CONFIG_VERSION = 1
+SOUND_DIR = '/home/pi/projects_ggg/raspbot/snd'
+
+try:
+    STRING_TYPES = (basestring,)
+except NameError:
+    STRING_TYPES = (str,)
+
+class Setting(object):
+    """
+    One configuration value: its type, default and allowed range
+    """
+    __slots__ = ('name', 'kind', 'default', 'low', 'high', 'restart', \
+                 'flag', 'flag_value')
+
+    def __init__(self, name, kind, default, low=None, high=None, \
+                 restart=False, flag=None, flag_value=True):
+        self.name = name
+        self.kind = kind            # bool, int, float or str
+        self.default = default
+        self.low = low
+        self.high = high
+        self.restart = restart      # only takes effect at startup
+        self.flag = flag            # command line flag that sets it
+        self.flag_value = flag_value
+
+    def check(self, value):
+        """
+        The value as this setting's type, or raises ValueError
+        """
+        if self.kind is bool:
+            if value not in (True, False, 0, 1):
+                raise ValueError(self.name+' is not true or false')
+            return bool(value)
+        if self.kind is str:
+            if not isinstance(value, STRING_TYPES):
+                raise ValueError(self.name+' is not a string')
+            return value
+        if isinstance(value, bool) or \
+           not isinstance(value, (int, float)):
+            raise ValueError(self.name+' is not a number')
+# NaN passes every range check and int() of infinity raises OverflowError
+        if value != value or value in (float('inf'), float('-inf')):
+            raise ValueError(self.name+' is not a finite number')
+        if self.kind is int and value != int(value):
+            raise ValueError(self.name+' is not a whole number')
+        value = self.kind(value)
+        if (self.low is not None and value < self.low) or \
+           (self.high is not None and value > self.high):
+            raise ValueError(self.name+' out of range: '+str(value))
+        return value
+
+SETTINGS = [
+    # switches
+    Setting('debug', bool, False, flag='-debug'),
+    Setting('roam', bool, False, flag='-roam'),
+    Setting('rand', bool, False, flag='-rand'),
+    Setting('servo_enabled', bool, True, restart=True, flag='-noservo', \
+            flag_value=False),
+    Setting('monitor', bool, True, restart=True, flag='-nomonitor', \
+            flag_value=False),
+    Setting('record', bool, False, restart=True, flag='-record'),
+    Setting('calibrate', bool, False, restart=True, flag='-calibrate'),
+    Setting('realtime', bool, False, restart=True, flag='-realtime'),
+    # timing (seconds) and counts
+    Setting('measurement_wait_period', float, 0.3, 0.05, 5.0),
+    Setting('settle_time', float, 1.0, 0.0, 10.0),
+    Setting('roam_max', int, 600, 1, 1000000),
+    Setting('log_max', int, 1200, 10, 10000000),
+    # detection (degrees F)
+    Setting('person_temp_threshold', float, 79.0, 50.0, 120.0),
+    Setting('burn_hazard_temp', float, 100.0, 60.0, 250.0),
+    # head following
+    Setting('kp', float, 1.0, 0.0, 10.0),
+    Setting('ki', float, 0.1, 0.0, 10.0),
+    Setting('kd', float, 0.0, 0.0, 10.0),
+    # sound
+    Setting('max_volume', float, 1.0, 0.0, 1.0),
+    Setting('cpu_105_on', bool, False),   # the CPU reaches 105F easily
+    Setting('sound_dir', str, SOUND_DIR),
+    Setting('hello_sound', str, '20150201_zoe-hello1.mp3'),
+    Setting('after_hello_sound', str, 'girl-sorry.mp3'),
+    Setting('goodbye_sound', str, '20150201_chloe-goodbye1.mp3'),
+    Setting('badge_sound', str, 'badge_file.mp3'),
+    Setting('burn_sound', str, 'girl-warning.mp3'),
+    Setting('stretch_sound', str, 'stretch.mp3'),
+    Setting('cpu_105_sound', str, 'girl-105a.mp3'),
+    Setting('cpu_110_sound', str, 'girl-110a.mp3'),
+    Setting('cpu_115_sound', str, 'girl-115a.mp3'),
+    Setting('cpu_120_sound', str, 'girl-120a.mp3'),
+    Setting('cpu_125_sound', str, 'girl-125a.mp3')]
+SETTINGS_BY_NAME = dict([(setting.name, setting) for setting in SETTINGS])
+
+class Config(object):
+    """
+    A complete set of settings
+    """
+    __slots__ = tuple([setting.name for setting in SETTINGS])
+
+    def __init__(self, **kwargs):
+        for setting in SETTINGS:
+            setattr(self, setting.name, setting.default)
+        for (name, value) in kwargs.items():
+            setattr(self, name, value)
+
+    def copy(self, **kwargs):
+        """
+        A copy of this config with some settings changed; raises
+        ValueError if a new value or the result isn't valid
+        """
+        new = Config()
+        for setting in SETTINGS:
+            setattr(new, setting.name, getattr(self, setting.name))
+        for (name, value) in kwargs.items():
+            if name not in SETTINGS_BY_NAME:
+                raise ValueError('unknown setting '+name)
+            setattr(new, name, SETTINGS_BY_NAME[name].check(value))
+        found = new.problems()
+        if found:
+            raise ValueError('; '.join(found))
+        return new
+
+    def use_flags(self, argv):
+        """
+        Let command line flags override the file
+        """
+        for setting in SETTINGS:
+            if setting.flag is not None and setting.flag in argv:
+                setattr(self, setting.name, setting.flag_value)
+
+    def problems(self):
+        """
+        List of reasons the settings can't be used together
+        """
+        found = []
+        if self.burn_hazard_temp <= self.person_temp_threshold:
+            found.append('burn_hazard_temp is not above '+ \
+                         'person_temp_threshold')
+        return found
+
+    def changed(self, other):
+        """
+        Names of the settings that differ in other
+        """
+        return [setting.name for setting in SETTINGS \
+                if getattr(self, setting.name) != \
+                   getattr(other, setting.name)]
+
+    def sound(self, name):
+        """
+        Full path of a sound clip setting, e.g. sound('hello_sound')
+        """
+        return os.path.join(self.sound_dir, getattr(self, name))
+
+def load_config(path, argv=()):
+    """
+    Returns (config, None) or (None, reason the file can't be used)
+    """
+    try:
+        fp = open(path)
+        try:
+            data = json.load(fp)
+        finally:
+            fp.close()
+    except IOError:
+        return (None, 'no config file '+path)
+    except ValueError:
+        return (None, 'config file is not valid JSON')
+    if not isinstance(data, dict) or data.get('version') != CONFIG_VERSION:
+        return (None, 'config file version is not '+str(CONFIG_VERSION))
+    config = Config()
+    found = []
+    for (name, value) in data.items():
+        if name == 'version':
+            continue
+        if name not in SETTINGS_BY_NAME:
+            found.append('unknown setting '+name)
+            continue
+        try:
+            setattr(config, name, SETTINGS_BY_NAME[name].check(value))
+        except ValueError as error:
+            found.append(str(error))
+    config.use_flags(argv)
+    found += config.problems()
+    if found:
+        return (None, '; '.join(sorted(found)))
+    return (config, None)
+
+class ConfigWatcher(object):
+    """
+    Applies changes to the config file to the running robot
+    """
+    def __init__(self, path, config, apply, argv=(), log=None):
+        self.path = path
+        self.config = config        # the settings in use
+        self.apply = apply          # apply(config, names that changed)
+        self.argv = argv
+        self.log = log
+        self.stamp = self._stamp()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def check(self):
+        """
+        Load the file again if it changed; returns the names applied
+        """
+        stamp = self._stamp()
+        if stamp is None or stamp == self.stamp:
+            return []
+        self.stamp = stamp
+        (config, problem) = load_config(self.path, self.argv)
+        if config is None:
+            if self.log:
+                self.log('Config not applied: '+problem)
+            return []
+        changed = self.config.changed(config)
+        restart = [name for name in changed \
+                   if SETTINGS_BY_NAME[name].restart]
+        for name in restart:
+            setattr(config, name, getattr(self.config, name))
+        if restart and self.log:
+            self.log('Config needs a restart for: '+', '.join(restart))
+        live = [name for name in changed if name not in restart]
+        if live:
+            self.config = config
+            self.apply(config, live)
+        return live
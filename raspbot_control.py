@@ -0,0 +1,227 @@
+"""
+# Local control socket for the raspbot
+# GNU GPL V3
+#
+# The only way to talk to a running robot was its pygame window (close
+# it or press q or esc), which needs a monitor. ControlServer listens on
+# a Unix domain socket instead, so tools on the Pi can ask the robot what
+# it sees and tell it what to do without reading its logs.
+#
+# One request per line, one JSON reply per line:
+#     state                             {"ok": true, "result": {...}}
+#     set person_temp_threshold 81      {"ok": true, "result": 81.0}
+#     dance                             {"ok": false, "error": "..."}
+# A connection can send any number of requests.
+#
+# The server thread only does the socket I/O. Each request is queued and
+# answered by serve() on the control loop between two of its tasks, so
+# the robot's state is only ever touched by one thread and a slow or
+# stuck client can't hold up sensing; it only waits for its own reply.
+#     control = ControlServer(path, {'state': get_state, 'set': set_it})
+#     control.start()
+#     runtime.every('control', 0.1, control.serve)
+# A handler gets the words after the command as strings and raises
+# ValueError (or an I/O error) for a request it can't carry out; any
+# other exception is logged and reported to the client as well.
+#
+# From a shell:
+#     python raspbot_control.py [-s socket] command [arguments]
+
+# Feb 2015
+"""
+import os
+import sys
+import json
+import socket
+import getopt
+import threading
+from collections import deque
+
+CONTROL_SOCKET = '/home/pi/projects_ggg/raspbot/raspbot.sock'
+CLIENT_TIMEOUT = 5.0        # seconds a client may take to send a request
+REPLY_TIMEOUT = 5.0         # seconds to wait for the control loop
+ACCEPT_TIMEOUT = 1.0        # seconds between looks at running
+MAX_REQUEST = 1024          # bytes in a request line
+MAX_PENDING = 16            # requests waiting for the control loop
+
+def _error(message):
+    return {'ok': False, 'error': message}
+
+class Request(object):
+    """
+    A request waiting for the control loop to answer it
+    """
+    __slots__ = ('words', 'reply', 'done')
+
+    def __init__(self, words):
+        self.words = words
+        self.reply = None
+        self.done = threading.Event()
+
+class ControlServer(object):
+    """
+    Serves control requests on a Unix domain socket
+    """
+    def __init__(self, path, handlers, log=None):
+        self.path = path
+        self.handlers = handlers    # command -> handler(*arguments)
+        self.log = log
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.sock = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """
+        Listen on the socket and start the server thread
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)    # left over from a crash
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        os.chmod(self.path, 0o660)
+        sock.listen(4)
+        sock.settimeout(ACCEPT_TIMEOUT)
+        self.sock = sock
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='control')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        """
+        Stop serving; a reply being sent is finished first
+        """
+        self.running = False
+        if self.thread is not None and \
+           self.thread is not threading.current_thread():
+            self.thread.join(ACCEPT_TIMEOUT*2)
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _run(self):
+        while self.running:
+            try:
+                (conn, address) = self.sock.accept()
+            except socket.timeout:
+                continue
+            except (socket.error, AttributeError):
+                break               # closed
+            try:
+                self._client(conn)
+            except socket.timeout:
+                pass                # an idle client
+            except socket.error as error:
+                if self.log:
+                    self.log('Control client: '+str(error))
+            conn.close()
+
+    def _client(self, conn):
+        conn.settimeout(CLIENT_TIMEOUT)
+        data = b''
+        while self.running:
+            while b'\n' not in data:
+                if len(data) > MAX_REQUEST:
+                    conn.sendall(_reply_line(_error('request too long')))
+                    return
+                chunk = conn.recv(MAX_REQUEST)
+                if not chunk:
+                    return
+                data += chunk
+            (line, data) = data.split(b'\n', 1)
+            words = line.decode('utf-8', 'replace').split()
+            conn.sendall(_reply_line(self.request(words)))
+
+    def request(self, words):
+        """
+        Queue a request for the control loop and wait for its reply
+        """
+        if not words:
+            return _error('empty request')
+        request = Request(words)
+        with self.lock:
+            if len(self.pending) >= MAX_PENDING:
+                return _error('busy')
+            self.pending.append(request)
+        if not request.done.wait(REPLY_TIMEOUT):
+            return _error('no reply from the control loop')
+        return request.reply
+
+    def serve(self):
+        """
+        Answer the queued requests; runs on the control loop
+        """
+        while True:
+            with self.lock:
+                if not self.pending:
+                    return
+                request = self.pending.popleft()
+            request.reply = self.answer(request.words)
+            request.done.set()
+
+    def answer(self, words):
+        """
+        Run one request's handler; returns the reply
+        """
+        handler = self.handlers.get(words[0])
+        if handler is None:
+            return _error('unknown command '+words[0]+'; commands are '+ \
+                          ' '.join(sorted(self.handlers.keys())))
+        try:
+            result = handler(*words[1:])
+        except (ValueError, TypeError, EnvironmentError) as error:
+            return _error(words[0]+': '+str(error))
+        except Exception as error:  # a bug must not stop the control loop
+            if self.log:
+                self.log('Control '+words[0]+' failed: '+repr(error))
+            return _error(words[0]+' failed: '+repr(error))
+        return {'ok': True, 'result': result}
+
+def _reply_line(reply):
+    return (json.dumps(reply, sort_keys=True)+'\n').encode('utf-8')
+
+def send(path, words, timeout=REPLY_TIMEOUT+CLIENT_TIMEOUT):
+    """
+    Send one request to a robot; returns its reply
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall((' '.join(words)+'\n').encode('utf-8'))
+        data = b''
+        while b'\n' not in data:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        sock.close()
+    return json.loads(data.decode('utf-8'))
+
+def main(argv):
+    (opts, args) = getopt.getopt(argv, 's:')
+    path = CONTROL_SOCKET
+    for (opt, value) in opts:
+        if opt == '-s':
+            path = value
+    if not args:
+        print('usage: raspbot_control.py [-s socket] command [arguments]')
+        return 2
+    try:
+        reply = send(path, args)
+    except (socket.error, ValueError) as error:
+        print('no reply from '+path+': '+str(error))
+        return 2
+    if not reply.get('ok'):
+        print(reply.get('error'))
+        return 1
+    print(json.dumps(reply.get('result'), indent=1, sort_keys=True))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,338 @@
+"""
+# Session exporter for the raspbot
+# GNU GPL V3
+#
+# Recorded sessions (raspbot_record.py) stayed on the SD card at 78
+# bytes a frame until someone copied them off. Exporter packs each
+# closed segment (*.rec) into an outbox directory for the fleet tools
+# to collect:
+#   - each frame is stored as its difference from the frame before,
+#     field by field on the fields' bits, so unpacking gives back
+#     exactly the same bytes. Frames change little from one to the
+#     next, so the differences are mostly zeros and small numbers and
+#     zlib shrinks them to a fraction of the segment's size
+#   - it streams: a segment is read, encoded and written CHUNK_FRAMES
+#     frames at a time, so memory use doesn't grow with the segment
+#   - a packed segment (*.rbz) is written as *.rbz.part and renamed
+#     when it is complete, and manifest.json in the outbox lists every
+#     one with its frame count, sizes and the SHA-256 of the packed
+#     file and of the frames it holds
+#   - after an interruption (power lost, shutdown) the next run removes
+#     the *.part files and carries on with the segments the manifest
+#     doesn't list yet
+#   - it runs on its own thread at idle CPU and I/O priority, so the
+#     control loop doesn't notice it
+# With remove the segment is unpacked again and checked against its
+# SHA-256 before the original is deleted.
+#     exporter = Exporter(record_dir, outbox)
+#     exporter.start()
+# From a shell:
+#     python raspbot_export.py [-o outbox] [-r] record_dir  # pack now
+#     python raspbot_export.py -d packed.rbz session.rec   # unpack
+
+# Feb 2015
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import getopt
+import hashlib
+import threading
+
+from raspbot_record import RECORD_MAGIC, RECORD_SIZE, RECORD_SUFFIX, \
+                           PART_SUFFIX
+from raspbot_realtime import set_background
+
+EXPORT_MAGIC = b'RBTDLT01'
+EXPORT_SUFFIX = '.rbz'
+MANIFEST_NAME = 'manifest.json'
+CHUNK_FRAMES = 256          # frames read, encoded and written at a time
+COMPRESSION = 6             # zlib level
+SCAN_PERIOD = 60.0          # seconds between looks for closed segments
+# a session record's fields (see RECORD_FORMAT) as unsigned integers of
+# the same sizes, and the size of each
+BITS = struct.Struct('<QHI16I')
+MODULI = [2**64, 2**16] + [2**32]*17
+
+def _chunks(fp, size):
+    while True:
+        data = fp.read(size)
+        if not data:
+            return
+        yield data
+
+def pack_segment(source, target, keep_going=None):
+    """
+    Pack a session file into target; returns a dict of its frames,
+    sizes and checksums, or None if keep_going() said to stop
+    A torn last frame is left out.
+    """
+    source_hash = hashlib.sha256()
+    packed_hash = hashlib.sha256()
+    compressor = zlib.compressobj(COMPRESSION)
+    previous = [0]*len(MODULI)
+    frames = 0
+    packed = 0
+    fp = open(source, 'rb')
+    out = open(target, 'wb')
+    try:
+        if fp.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+            raise ValueError('not a raspbot session file: '+source)
+        source_hash.update(RECORD_MAGIC)
+        out.write(EXPORT_MAGIC)
+        packed_hash.update(EXPORT_MAGIC)
+        packed += len(EXPORT_MAGIC)
+        for data in _chunks(fp, CHUNK_FRAMES*RECORD_SIZE):
+            if keep_going is not None and not keep_going():
+                return None
+            whole = len(data) - len(data) % RECORD_SIZE
+            source_hash.update(data[:whole])
+            encoded = []
+            for offset in range(0, whole, RECORD_SIZE):
+                values = BITS.unpack_from(data, offset)
+                encoded.append(BITS.pack(*[(v - p) % m for (v, p, m) \
+                               in zip(values, previous, MODULI)]))
+                previous = values
+            frames += whole//RECORD_SIZE
+            block = compressor.compress(b''.join(encoded))
+            block += b'' if whole == len(data) else compressor.flush()
+            out.write(block)
+            packed_hash.update(block)
+            packed += len(block)
+            if whole != len(data):
+                compressor = None
+                break
+        if compressor is not None:
+            block = compressor.flush()
+            out.write(block)
+            packed_hash.update(block)
+            packed += len(block)
+        out.flush()
+        os.fsync(out.fileno())
+    finally:
+        fp.close()
+        out.close()
+    return {'frames': frames, \
+            'source_bytes': len(RECORD_MAGIC) + frames*RECORD_SIZE, \
+            'packed_bytes': packed, \
+            'source_sha256': source_hash.hexdigest(), \
+            'sha256': packed_hash.hexdigest()}
+
+def unpack_records(path):
+    """
+    Generator of the session file's records (bytes) from a packed file
+    """
+    fp = open(path, 'rb')
+    try:
+        if fp.read(len(EXPORT_MAGIC)) != EXPORT_MAGIC:
+            raise ValueError('not a packed raspbot session: '+path)
+        decompressor = zlib.decompressobj()
+        previous = [0]*len(MODULI)
+        pending = b''
+        for data in _chunks(fp, CHUNK_FRAMES*RECORD_SIZE):
+            pending += decompressor.decompress(data)
+            whole = len(pending) - len(pending) % RECORD_SIZE
+            for offset in range(0, whole, RECORD_SIZE):
+                deltas = BITS.unpack_from(pending, offset)
+                previous = [(d + p) % m for (d, p, m) \
+                            in zip(deltas, previous, MODULI)]
+                yield BITS.pack(*previous)
+            pending = pending[whole:]
+        if pending or decompressor.flush():
+            raise ValueError('packed session is truncated: '+path)
+    finally:
+        fp.close()
+
+def unpack_segment(path, target):
+    """
+    Write the session file a packed file holds; returns its SHA-256
+    """
+    digest = hashlib.sha256(RECORD_MAGIC)
+    out = open(target, 'wb')
+    try:
+        out.write(RECORD_MAGIC)
+        for record in unpack_records(path):
+            out.write(record)
+            digest.update(record)
+    finally:
+        out.close()
+    return digest.hexdigest()
+
+def _unpacked_sha256(path):
+    digest = hashlib.sha256(RECORD_MAGIC)
+    for record in unpack_records(path):
+        digest.update(record)
+    return digest.hexdigest()
+
+class Exporter(object):
+    """
+    Packs closed session segments into an outbox
+    """
+    def __init__(self, source_dir, outbox, remove=False, log=None, \
+                 period=SCAN_PERIOD):
+        self.source_dir = source_dir
+        self.outbox = outbox
+        self.remove = remove        # delete a segment once packed
+        self.log = log
+        self.period = period
+        self.manifest_path = os.path.join(outbox, MANIFEST_NAME)
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def load_manifest(self):
+        """
+        {segment name: entry} of the segments already packed
+        """
+        try:
+            fp = open(self.manifest_path)
+            try:
+                entries = json.load(fp)['segments']
+            finally:
+                fp.close()
+        except (IOError, ValueError, KeyError, TypeError):
+            return {}
+        return dict([(entry['name'], entry) for entry in entries])
+
+    def save_manifest(self, manifest):
+        temp_path = self.manifest_path+'.tmp'
+        fp = open(temp_path, 'w')
+        json.dump({'segments': sorted(manifest.values(), \
+                                      key=lambda entry: entry['name'])}, \
+                  fp, indent=1, sort_keys=True)
+        fp.flush()
+        os.fsync(fp.fileno())
+        fp.close()
+        os.rename(temp_path, self.manifest_path)
+
+    def pending(self, manifest):
+        """
+        Closed segments not packed yet, oldest first
+        """
+        if not os.path.isdir(self.source_dir):
+            return []
+        return sorted([name for name in os.listdir(self.source_dir) \
+                       if name.endswith(RECORD_SUFFIX) and \
+                          name not in manifest])
+
+    def export_one(self, name, manifest):
+        """
+        Pack one segment and add it to the manifest; False if stopped
+        """
+        source = os.path.join(self.source_dir, name)
+        packed_name = name[:-len(RECORD_SUFFIX)]+EXPORT_SUFFIX
+        target = os.path.join(self.outbox, packed_name)
+        started = time.time()
+        try:
+            entry = pack_segment(source, target+PART_SUFFIX, \
+                                 lambda: not self.stopping.is_set())
+            if entry is not None and self.remove and \
+               _unpacked_sha256(target+PART_SUFFIX) != \
+               entry['source_sha256']:
+                raise ValueError('packed segment does not unpack: '+name)
+        except ValueError:
+            os.unlink(target+PART_SUFFIX)
+            raise
+        if entry is None:
+            return False
+        os.rename(target+PART_SUFFIX, target)
+        entry['name'] = name
+        entry['packed'] = packed_name
+        entry['exported'] = time.time()
+        manifest[name] = entry
+        self.save_manifest(manifest)
+        if self.remove:
+            os.unlink(source)
+        if self.log:
+            self.log('Exported %s: %d frames, %d -> %d bytes in %.1fs' % \
+                     (name, entry['frames'], entry['source_bytes'], \
+                      entry['packed_bytes'], time.time() - started))
+        return True
+
+    def run_once(self):
+        """
+        Pack every closed segment not packed yet; returns how many
+        """
+        if not os.path.isdir(self.outbox):
+            os.makedirs(self.outbox)
+        for name in os.listdir(self.outbox):
+            if name.endswith(PART_SUFFIX):
+                os.unlink(os.path.join(self.outbox, name))  # interrupted
+        manifest = self.load_manifest()
+        count = 0
+        for name in self.pending(manifest):
+            if self.stopping.is_set():
+                break
+            try:
+                if not self.export_one(name, manifest):
+                    break
+            except ValueError as error:
+# a broken segment is listed so it isn't tried again
+                manifest[name] = {'name': name, 'error': str(error), \
+                                  'exported': time.time()}
+                self.save_manifest(manifest)
+                if self.log:
+                    self.log('Not exported: '+str(error))
+                continue
+            count += 1
+        return count
+
+    def _run(self):
+        set_background()
+        while not self.stopping.is_set():
+            try:
+                self.run_once()
+            except (IOError, OSError, zlib.error) as error:
+                if self.log:
+                    self.log('Export: '+str(error))
+            self.stopping.wait(self.period)
+
+    def start(self):
+        """
+        Pack segments on a background thread as they are closed
+        """
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name='exporter')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        """
+        Stop after the chunk being packed; it is packed again next time
+        """
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+def print_line(line):
+    print(line)
+
+def main(argv):
+    (opts, args) = getopt.getopt(argv, 'o:rd')
+    outbox = None
+    remove = False
+    decode = False
+    for (opt, value) in opts:
+        if opt == '-o':
+            outbox = value
+        elif opt == '-r':
+            remove = True
+        elif opt == '-d':
+            decode = True
+    if decode and len(args) == 2:
+        print(unpack_segment(args[0], args[1]))
+        return 0
+    if decode or len(args) != 1:
+        print('usage: raspbot_export.py [-o outbox] [-r] record_dir\n'+ \
+              '       raspbot_export.py -d packed.rbz session.rec')
+        return 1
+    if outbox is None:
+        outbox = os.path.join(args[0], 'outbox')
+    exporter = Exporter(args[0], outbox, remove, log=print_line)
+    exporter.run_once()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
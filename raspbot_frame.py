@@ -0,0 +1,130 @@
+"""
+# Reusable sensor frames for the raspbot
+# GNU GPL V3
+#
+# Every pass of the sense loop used to make new lists: the 16
+# temperatures of each read, a 16 element hit list and a four column
+# hit array, plus the tuples they came back in. On a Pi Zero the
+# garbage collector runs often enough to show in the loop times. A
+# ThermalFrame holds one frame's data in arrays made once:
+#     temps     the 16 element temperatures (array('d'))
+#     ambient   the sensor's own (room) temperature
+#     hits      each element's hit value: 0, 1 or the burn hazard value
+#     columns   the four column sums of hits, far left column first,
+#               the same as the hit array of analyze_hits()
+#     hit_count, max_temp, timestamp and servo position
+# FramePool makes its frames up front and hands them out again after
+# they are released, so a running robot makes no new ones.
+#     pool = FramePool()
+#     frame = pool.acquire()
+#     frame.load(temperatures, room_temp)   # or watchdog.read_into(frame)
+#     frame.find_hits(params)
+#     pool.release(frame)
+# Temperatures are kept as doubles like the lists were: as 32 bit floats
+# a reading of 71.8 becomes 71.80000305 and would be over a threshold
+# of 71.8.
+
+# Feb 2015
+"""
+from array import array
+
+ELEMENTS = 16               # D6T-44L elements, 4 columns of 4
+COLUMNS = 4
+ROWS = ELEMENTS//COLUMNS
+POOL_SIZE = 4               # frames made up front
+# (column, its elements) far left column first; made once because range()
+# makes a new list every time on Python 2
+COLUMN_ELEMENTS = tuple([(COLUMNS-1 - column, \
+                          tuple(range(column*ROWS, (column+1)*ROWS))) \
+                         for column in range(COLUMNS)])
+ELEMENT_INDEXES = tuple(range(ELEMENTS))
+
+class ThermalFrame(object):
+    """
+    One sensor frame and what analysis found in it
+    """
+    __slots__ = ('temps', 'ambient', 'hits', 'columns', 'hit_count', \
+                 'max_temp', 'timestamp', 'servo_position')
+
+    def __init__(self):
+        self.temps = array('d', [0.0]*ELEMENTS)
+        self.hits = array('i', [0]*ELEMENTS)
+        self.columns = array('i', [0]*COLUMNS)
+        self.clear()
+
+    def clear(self):
+        self.ambient = 0.0
+        self.hit_count = 0
+        self.max_temp = 0.0
+        self.timestamp = 0.0
+        self.servo_position = 0
+
+    def load(self, temperatures, ambient):
+        """
+        Copy a frame's temperatures in (any sequence of 16)
+        """
+        temps = self.temps
+        for i in ELEMENT_INDEXES:
+            temps[i] = temperatures[i]
+        self.ambient = ambient
+
+    def find_hits(self, params):
+        """
+        Fill in hits, columns, hit_count and max_temp; the same
+        rules as analyze_hits()
+        """
+        burn_temp = params.burn_hazard_temp
+        person_temp = params.person_temp_threshold
+        burn_hit = params.burn_hazard_hit
+        temps = self.temps
+        hits = self.hits
+        columns = self.columns
+        hit_count = 0
+        max_temp = temps[0]
+    # far left column is elements 12-15, far right column is 0-3
+        for (column, elements) in COLUMN_ELEMENTS:
+            total = 0
+            for element in elements:
+                temp = temps[element]
+                if temp > max_temp:
+                    max_temp = temp
+                if temp > burn_temp:
+                    hits[element] = burn_hit
+                    total += burn_hit
+                    hit_count += 1
+                elif temp > person_temp:
+                    hits[element] = 1
+                    total += 1
+                    hit_count += 1
+                else:
+                    hits[element] = 0
+            columns[column] = total
+        self.hit_count = hit_count
+        self.max_temp = max_temp
+        return hit_count
+
+class FramePool(object):
+    """
+    Frames made up front and handed out again once released
+    """
+    def __init__(self, size=POOL_SIZE):
+        self.free = [ThermalFrame() for i in range(size)]
+        self.size = size
+        self.made = size            # more than size means frames leaked
+
+    def acquire(self):
+        """
+        A frame to fill; a new one only if all of them are in use
+        """
+        if self.free:
+            return self.free.pop()
+        self.made += 1
+        return ThermalFrame()
+
+    def release(self, frame):
+        """
+        Hand a frame back; nothing may use it afterwards
+        """
+        if frame is not None and len(self.free) < self.size:
+            frame.clear()
+            self.free.append(frame)
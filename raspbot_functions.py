@@ -1,6 +1,7 @@
 
 from datetime import datetime
-import urllib, pycurl, os           # needed for text to speech
+# urllib and pycurl are only needed for text to speech, so they are
+# imported when speech is first downloaded
 
 # function for celcius to farenheiht conversion
 def c2f (centigrade):
@@ -50,6 +51,7 @@ def fahrenheit_to_rgb(maxVal, minVal, actual):
     return ((intR, intG, intB))
 
 def downloadFile(url, fileName):
+    import pycurl
     fp = open(fileName, "wb")
     curl = pycurl.Curl()
     curl.setopt(pycurl.URL, url)
@@ -59,6 +61,7 @@ def downloadFile(url, fileName):
     fp.close()
 
 def getGoogleSpeechURL(phrase):
+    import urllib
     googleTranslateURL = \
         "http://translate.google.com/translate_tts?tl=en&"
     parameters = {'q': phrase}
@@ -66,7 +69,14 @@ def getGoogleSpeechURL(phrase):
     googleTranslateURL = "%s%s" % (googleTranslateURL,data)
     return googleTranslateURL
 
-def speakSpeechFromText(phrase, output_file_name):
+def speakSpeechFromText(phrase, output_file_name, backend=None):
+    """
+    Make a sound file of a phrase with a speech backend (raspbot_tts.py);
+    without one the phrase is downloaded from Google Translate
+    """
+    if backend is not None:
+        backend.synthesize(phrase, output_file_name)
+        return
     googleSpeechURL = getGoogleSpeechURL(phrase)
     downloadFile(googleSpeechURL, output_file_name)
 #    pygame.mixer.music.load(output_file_name)
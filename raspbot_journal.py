@@ -0,0 +1,302 @@
+"""
+# Event journal for the raspbot
+# GNU GPL V3
+#
+# Greetings, goodbyes, burn hazards, CPU temperature levels and sensor
+# errors were only free text in raspbot.log, which starts again every
+# LOG_MAX frames. They are also appended to a journal file now, an 8
+# byte header followed by fixed size little endian records:
+#     timestamp (double), event type (unsigned char),
+#     hit count (unsigned char), servo position (unsigned short),
+#     max temperature (float), value (float), track id (unsigned short)
+# value depends on the event: seconds the person stayed for a goodbye,
+# the CPU temperature for a CPU level, the error count for a sensor
+# error.
+#
+# A journal whose header was cut short (power lost as it was made) is
+# started again, and a file that isn't a journal is moved aside to
+# journal.<time>.bad so the robot keeps a journal either way.
+#
+# The writer never lets a timestamp go backwards, so the records are in
+# time order and the file is its own time index: a query finds the start
+# of its range by binary search over the records, reading the file
+# through mmap, and only touches the records in the range. Months of
+# events are a few megabytes and a day's count takes milliseconds.
+#     journal = JournalWriter(path)
+#     journal.write(EVENT_HELLO, servo_position, max_temp, hit_count)
+# From a shell:
+#     python raspbot_journal.py [-f journal] [-s start] [-e end]
+#                               [-t type] count|daily|hourly|dwell|list
+# start and end are dates (2015-02-14) or date and time
+# (2015-02-14 09:30); the range includes start and excludes end.
+
+# Feb 2015
+"""
+import os
+import sys
+import mmap
+import time
+import struct
+import getopt
+
+JOURNAL_MAGIC = b'RBTJNL01'
+JOURNAL_FORMAT = '<dBBHffH'
+JOURNAL_RECORD = struct.Struct(JOURNAL_FORMAT)
+JOURNAL_SIZE = JOURNAL_RECORD.size
+JOURNAL_FILE = '/home/pi/projects_ggg/raspbot/raspbot.jnl'
+
+EVENT_START = 1
+EVENT_STOP = 2
+EVENT_HELLO = 3
+EVENT_GOODBYE = 4
+EVENT_BURN = 5
+EVENT_CPU = 6
+EVENT_SENSOR_ERROR = 7
+EVENT_NAMES = {EVENT_START: 'start', EVENT_STOP: 'stop', \
+               EVENT_HELLO: 'hello', EVENT_GOODBYE: 'goodbye', \
+               EVENT_BURN: 'burn', EVENT_CPU: 'cpu', \
+               EVENT_SENSOR_ERROR: 'sensor'}
+EVENT_TYPES = dict([(name, event) for (event, name) in EVENT_NAMES.items()])
+
+class Event(object):
+    """
+    One journal record
+    """
+    __slots__ = ('time', 'event', 'hit_count', 'servo_position', \
+                 'max_temp', 'value', 'track')
+
+    def __init__(self, values):
+        (self.time, self.event, self.hit_count, self.servo_position, \
+         self.max_temp, self.value, self.track) = values
+
+    def name(self):
+        return EVENT_NAMES.get(self.event, str(self.event))
+
+def is_journal(path):
+    """
+    True if the file starts with a journal header
+    """
+    fp = open(path, 'rb')
+    try:
+        return fp.read(len(JOURNAL_MAGIC)) == JOURNAL_MAGIC
+    finally:
+        fp.close()
+
+class JournalWriter(object):
+    """
+    Appends events to a journal file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.last = 0.0
+        self.moved = None           # where a file that wasn't one went
+        size = 0
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+        if size >= len(JOURNAL_MAGIC) and not is_journal(path):
+            self.moved = '%s.%d.bad' % (path, int(time.time()))
+            os.rename(path, self.moved)
+            size = 0
+        if size < len(JOURNAL_MAGIC):
+# new, or only part of the header made it to the card
+            self.handle = open(path, 'wb')
+            self.handle.write(JOURNAL_MAGIC)
+            self.handle.flush()
+            return
+        self.handle = open(path, 'ab')
+        journal = Journal(path)
+        try:
+            count = journal.count()
+            if count:
+                self.last = journal.event(count-1).time
+        finally:
+            journal.close()
+# a torn last record (power lost while writing) is cut off
+        whole = len(JOURNAL_MAGIC) + count*JOURNAL_SIZE
+        if os.path.getsize(path) != whole:
+            self.handle.truncate(whole)
+            self.handle.seek(whole)
+
+    def write(self, event, servo_position, max_temp, hit_count, \
+              value=0.0, track=0, now=None):
+        """
+        Append one event; it is on its way to the card when this returns
+        """
+        if now is None:
+            now = time.time()
+        self.last = max(self.last, now)     # keeps the file sorted
+        self.handle.write(JOURNAL_RECORD.pack(self.last, event, \
+            min(int(hit_count), 255), int(servo_position or 0), \
+            max_temp, value, int(track or 0) & 0xffff))
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+class Journal(object):
+    """
+    Reads a journal file through mmap
+    """
+    def __init__(self, path):
+        self.fp = open(path, 'rb')
+        size = os.fstat(self.fp.fileno()).st_size
+        self.map = None
+        self.records = 0
+        if size < len(JOURNAL_MAGIC):
+            return
+        self.map = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+            self.close()
+            raise ValueError('not a raspbot journal: '+path)
+        self.records = (size - len(JOURNAL_MAGIC))//JOURNAL_SIZE
+
+    def count(self):
+        return self.records
+
+    def _time(self, i):
+        return struct.unpack_from('<d', self.map, \
+                                  len(JOURNAL_MAGIC) + i*JOURNAL_SIZE)[0]
+
+    def event(self, i):
+        return Event(JOURNAL_RECORD.unpack_from(self.map, \
+                                                len(JOURNAL_MAGIC) + \
+                                                i*JOURNAL_SIZE))
+
+    def find(self, when):
+        """
+        Index of the first record at or after when
+        """
+        low = 0
+        high = self.records
+        while low < high:
+            middle = (low + high)//2
+            if self._time(middle) < when:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def events(self, start=None, end=None, types=None):
+        """
+        Generator of the events from start up to end, of the given types
+        """
+        first = 0 if start is None else self.find(start)
+        last = self.records if end is None else self.find(end)
+        for i in range(first, last):
+            event = self.event(i)
+            if types is None or event.event in types:
+                yield event
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.fp.close()
+
+def parse_time(text):
+    """
+    Seconds since the epoch from a local date or date and time
+    """
+    for layout in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(text, layout))
+        except ValueError:
+            pass
+    return float(text)
+
+def counts(events):
+    """
+    {event name: count}
+    """
+    found = {}
+    for event in events:
+        found[event.name()] = found.get(event.name(), 0) + 1
+    return found
+
+def histogram(events, key):
+    """
+    {key(event): count}, e.g. per day with key=day
+    """
+    found = {}
+    for event in events:
+        k = key(event)
+        found[k] = found.get(k, 0) + 1
+    return found
+
+def day(event):
+    return time.strftime('%Y-%m-%d', time.localtime(event.time))
+
+def hour(event):
+    return time.localtime(event.time).tm_hour
+
+def dwell(events):
+    """
+    {day: (visits, mean, median, longest)} in seconds from goodbyes
+    """
+    stays = {}
+    for event in events:
+        if event.event == EVENT_GOODBYE:
+            stays.setdefault(day(event), []).append(event.value)
+    found = {}
+    for (k, values) in stays.items():
+        values.sort()
+        found[k] = (len(values), sum(values)/len(values), \
+                    values[len(values)//2], values[-1])
+    return found
+
+def main(argv):
+    (opts, args) = getopt.getopt(argv, 'f:s:e:t:')
+    path = JOURNAL_FILE
+    start = None
+    end = None
+    types = None
+    for (opt, value) in opts:
+        if opt == '-f':
+            path = value
+        elif opt == '-s':
+            start = parse_time(value)
+        elif opt == '-e':
+            end = parse_time(value)
+        elif opt == '-t':
+            types = set([EVENT_TYPES[name] for name in value.split(',')])
+    if len(args) != 1 or \
+       args[0] not in ('count', 'daily', 'hourly', 'dwell', 'list'):
+        print('usage: raspbot_journal.py [-f journal] [-s start] [-e end] '+ \
+              '[-t '+','.join(sorted(EVENT_TYPES.keys()))+ \
+              '] count|daily|hourly|dwell|list')
+        return 1
+    journal = Journal(path)
+    try:
+        if args[0] == 'dwell':
+            types = set([EVENT_GOODBYE])
+        elif args[0] in ('daily', 'hourly') and types is None:
+            types = set([EVENT_HELLO])  # foot traffic
+        events = journal.events(start, end, types)
+        if args[0] == 'count':
+            for (name, count) in sorted(counts(events).items()):
+                print('%-8s %8d' % (name, count))
+        elif args[0] == 'daily':
+            for (k, count) in sorted(histogram(events, day).items()):
+                print('%s %6d' % (k, count))
+        elif args[0] == 'hourly':
+            found = histogram(events, hour)
+            for k in range(24):
+                print('%02d:00 %6d' % (k, found.get(k, 0)))
+        elif args[0] == 'dwell':
+            print('day        visits    mean  median longest (seconds)')
+            for (k, stats) in sorted(dwell(events).items()):
+                print('%s %6d %7.1f %7.1f %7.1f' % ((k,)+stats))
+        else:
+            for event in events:
+                print('%s %-8s pos %4d max %5.1f hits %2d value %7.1f '\
+                      'track %d' % (time.strftime('%Y-%m-%d %H:%M:%S', \
+                                    time.localtime(event.time)), \
+                                    event.name(), event.servo_position, \
+                                    event.max_temp, event.hit_count, \
+                                    event.value, event.track))
+    finally:
+        journal.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,182 @@
+"""
+# LED animations for the raspbot
+# GNU GPL V3
+#
+# Blinking the LEDs used to be done with time.sleep() in the robot's
+# loop: 18 seconds for the exercise reminder, 19 for the head
+# calibration window and forever in panic(), with no sensing while they
+# ran. LedAnimator plays patterns on its own thread instead and the
+# loop carries on.
+#
+# A pattern is a list of keyframes, each (seconds, {pin: state}), played
+# repeat times (None is forever). Only one pattern plays at a time. A
+# pattern of the same or higher priority preempts the one playing, a
+# lower priority one is refused. When a pattern ends or is preempted
+# its pins are turned off. While busy() the robot leaves the hit LEDs
+# alone. Given waves (raspbot_output.PigpioOutput), patterns are played
+# as pigpio waveforms timed by the hardware; the thread only keeps
+# track of when they end.
+#     leds = LedAnimator(output.write, LED_ON, LED_OFF, output)
+#     leds.play(blink('burn', [[11, 15, 22, 32]], 0.1, 0.1, repeat=10,
+#                     priority=PRIORITY_WARNING))
+
+# Feb 2015
+"""
+import threading
+import time
+
+PRIORITY_STATUS = 0         # e.g. the calibration window
+PRIORITY_REMINDER = 1       # e.g. the exercise reminder
+PRIORITY_WARNING = 2        # e.g. burn hazard
+PRIORITY_PANIC = 3
+
+class Pattern(object):
+    """
+    A keyframe LED animation
+    """
+    __slots__ = ('name', 'frames', 'repeat', 'priority', 'pins')
+
+    def __init__(self, name, frames, repeat=1, priority=PRIORITY_STATUS):
+        self.name = name
+        self.frames = frames
+        self.repeat = repeat
+        self.priority = priority
+        pins = set()
+        for (seconds, states) in frames:
+            pins.update(states.keys())
+        self.pins = sorted(pins)
+
+def blink(name, groups, on_time, off_time, repeat=1, \
+          priority=PRIORITY_STATUS, on=True, off=False):
+    """
+    A pattern that lights each group of pins in turn for on_time and
+    then turns it off for off_time
+    """
+    frames = []
+    for group in groups:
+        frames.append((on_time, dict([(pin, on) for pin in group])))
+        if off_time:
+            frames.append((off_time, dict([(pin, off) for pin in group])))
+    return Pattern(name, frames, repeat, priority)
+
+def alternate(name, first, second, period, repeat=1, \
+              priority=PRIORITY_STATUS, on=True, off=False):
+    """
+    A pattern that swaps between two groups of pins every period seconds
+    """
+    frames = []
+    for (lit, dark) in ((first, second), (second, first)):
+        states = dict([(pin, off) for pin in dark])
+        states.update(dict([(pin, on) for pin in lit]))
+        frames.append((period, states))
+    return Pattern(name, frames, repeat, priority)
+
+class LedAnimator(object):
+    """
+    Plays LED patterns on a thread
+    output(pin, state) sets an LED
+    waves, if given, has play_wave(pattern, on) and stop_wave()
+    """
+    def __init__(self, output, on=True, off=False, waves=None):
+        self.output = output
+        self.waves = waves
+        self.on = on
+        self.off = off
+        self.cond = threading.Condition()
+        self.current = None
+        self.generation = 0     # changes whenever current does
+        self.thread = None
+
+    def play(self, pattern):
+        """
+        Start a pattern; returns False if a higher priority one is playing
+        """
+        with self.cond:
+            if self.current is not None and \
+               pattern.priority < self.current.priority:
+                return False
+            self.current = pattern
+            self.generation += 1
+            self.cond.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, \
+                                               name='led-animator')
+                self.thread.daemon = True
+                self.thread.start()
+        return True
+
+    def stop(self, name=None):
+        """
+        Stop the pattern playing (only if it is called name, if given)
+        """
+        with self.cond:
+            if self.current is not None and \
+               (name is None or self.current.name == name):
+                self.current = None
+                self.generation += 1
+                self.cond.notify()
+
+    def busy(self):
+        return self.current is not None
+
+    def playing(self):
+        """
+        Name of the pattern playing, or None
+        """
+        pattern = self.current
+        if pattern is None:
+            return None
+        return pattern.name
+
+    def _hold(self, seconds, generation):
+        """
+        Wait out a keyframe (forever if seconds is None); False if the
+        pattern was replaced meanwhile
+        """
+        if seconds is None:
+            while self.generation == generation:
+                self.cond.wait()
+            return False
+        deadline = time.time() + seconds
+        while self.generation == generation:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return True
+            self.cond.wait(remaining)
+        return False
+
+    def _play(self, pattern, generation):
+        count = 0
+        while pattern.repeat is None or count < pattern.repeat:
+            for (seconds, states) in pattern.frames:
+                for pin in states:
+                    self.output(pin, states[pin])
+                if not self._hold(seconds, generation):
+                    return
+            count += 1
+
+    def _play_wave(self, pattern, generation):
+        self.waves.play_wave(pattern, self.on)
+        if pattern.repeat is None:
+            self._hold(None, generation)
+        else:
+            self._hold(sum([seconds for (seconds, states) \
+                            in pattern.frames])*pattern.repeat, generation)
+        self.waves.stop_wave()
+
+    def _run(self):
+        with self.cond:
+            while True:
+                while self.current is None:
+                    self.cond.wait()
+                pattern = self.current
+                generation = self.generation
+                if self.waves is not None:
+                    self._play_wave(pattern, generation)
+                else:
+                    self._play(pattern, generation)
+                for pin in pattern.pins:
+                    self.output(pin, self.off)
+                if self.generation == generation:
+                    self.current = None
+                    self.generation += 1
@@ -0,0 +1,231 @@
+"""
+# Occupancy statistics for the raspbot
+# GNU GPL V3
+#
+# The robot knows when someone arrives (hello) and leaves (goodbye) but
+# used to forget it straight away, and visitor numbers meant grepping
+# logs. OccupancyStats keeps them up to date as people come and go, in
+# the same small amount of memory however long the robot runs:
+#   - visits in all and for each of the last DAYS days (a ring of days)
+#   - how long visits last, as counts in fixed DWELL_EDGES bins; the
+#     median and 90th percentile are read off the bins
+#   - for each hour of the day, the visits that started in it and the
+#     seconds someone was there, to give the busy hours
+# save() writes the statistics and a summary of them to a small JSON
+# file, written to the side and renamed over the old one so a reader
+# never sees half of it. The summary is what fleet tools read:
+#     {"visits": 1234, "today": 56, "last_7_days": 301,
+#      "dwell": {"mean": 42.0, "median": 30.0, "p90": 95.0, ...},
+#      "busiest_hour": 12, "hourly_occupancy": [0.0, ...], ...}
+#     stats = load_occupancy(path) or OccupancyStats()
+#     stats.arrive(time.time())
+#     stats.leave(time.time())
+#     stats.save(path)
+
+# Feb 2015
+"""
+import os
+import json
+import time
+import datetime
+
+OCCUPANCY_VERSION = 1
+DAYS = 31                   # days of visit counts kept
+DWELL_EDGES = [0, 5, 10, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600]
+HOURS = 24
+
+def _day_number(when):
+    return datetime.date.fromtimestamp(when).toordinal()
+
+class DwellHistogram(object):
+    """
+    Counts of visit lengths in fixed bins (seconds)
+    """
+    def __init__(self, edges=DWELL_EDGES):
+        self.edges = edges
+        self.counts = [0]*len(edges)    # the last bin has no upper edge
+        self.total = 0.0
+        self.longest = 0.0
+
+    def add(self, seconds):
+        seconds = max(0.0, seconds)
+        i = len(self.edges) - 1
+        while self.edges[i] > seconds:
+            i -= 1
+        self.counts[i] += 1
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+
+    def count(self):
+        return sum(self.counts)
+
+    def mean(self):
+        count = self.count()
+        return self.total/count if count else 0.0
+
+    def quantile(self, q):
+        """
+        Estimated q quantile, spreading each bin's visits evenly over it
+        """
+        count = self.count()
+        if not count:
+            return 0.0
+        wanted = q*count
+        seen = 0
+        for i in range(len(self.counts)):
+            if self.counts[i] and seen + self.counts[i] >= wanted:
+                low = self.edges[i]
+                if i+1 < len(self.edges):
+                    high = min(self.edges[i+1], self.longest)
+                else:
+                    high = self.longest
+                return low + (high - low)*(wanted - seen)/self.counts[i]
+            seen += self.counts[i]
+        return self.longest
+
+class OccupancyStats(object):
+    """
+    Visit counts, visit lengths and busy hours
+    """
+    def __init__(self):
+        self.visits = 0
+        self.day_numbers = [0]*DAYS     # which day each slot is counting
+        self.day_visits = [0]*DAYS
+        self.dwell = DwellHistogram()
+        self.hour_visits = [0]*HOURS
+        self.hour_seconds = [0.0]*HOURS # seconds someone was there
+        self.first_day = None
+        self.last_day = None
+        self.arrived = None             # when the person here arrived
+
+    def _day(self, when):
+        number = _day_number(when)
+        slot = number % DAYS
+        if self.day_numbers[slot] != number:
+            self.day_numbers[slot] = number
+            self.day_visits[slot] = 0
+        if self.first_day is None:
+            self.first_day = number
+        self.last_day = max(self.last_day or number, number)
+        return slot
+
+    def arrive(self, now):
+        """
+        Someone arrived (the robot said hello)
+        """
+        self.arrived = now
+        self.visits += 1
+        self.day_visits[self._day(now)] += 1
+        self.hour_visits[time.localtime(now).tm_hour] += 1
+
+    def leave(self, now):
+        """
+        They left (the robot said goodbye)
+        """
+        if self.arrived is None or now < self.arrived:
+            return
+        self.dwell.add(now - self.arrived)
+        when = self.arrived
+        while when < now:
+            local = time.localtime(when)
+            hour_end = when - local.tm_min*60 - local.tm_sec + 3600
+            until = min(now, hour_end)
+            self.hour_seconds[local.tm_hour] += until - when
+            when = until
+        self._day(now)
+        self.arrived = None
+
+    def visits_since(self, days, now):
+        """
+        Visits in the last days days, today included
+        """
+        today = _day_number(now)
+        return sum([self.day_visits[i] for i in range(DAYS) \
+                    if today - days < self.day_numbers[i] <= today])
+
+    def summary(self, now=None):
+        if now is None:
+            now = time.time()
+        days = 1
+        if self.first_day is not None:
+            days = self.last_day - self.first_day + 1
+        occupancy = [round(seconds/(3600.0*days), 3) \
+                     for seconds in self.hour_seconds]
+        busiest = None
+        if self.visits:
+            busiest = self.hour_visits.index(max(self.hour_visits))
+        return {'updated': now, \
+                'visits': self.visits, \
+                'today': self.visits_since(1, now), \
+                'last_7_days': self.visits_since(7, now), \
+                'last_30_days': self.visits_since(30, now), \
+                'days': days, \
+                'dwell': {'mean': round(self.dwell.mean(), 1), \
+                          'median': round(self.dwell.quantile(0.5), 1), \
+                          'p90': round(self.dwell.quantile(0.9), 1), \
+                          'longest': round(self.dwell.longest, 1), \
+                          'edges': self.dwell.edges, \
+                          'counts': self.dwell.counts}, \
+                'busiest_hour': busiest, \
+                'hourly_visits': self.hour_visits, \
+                'hourly_occupancy': occupancy}
+
+    def to_dict(self):
+        return {'visits': self.visits, \
+                'day_numbers': self.day_numbers, \
+                'day_visits': self.day_visits, \
+                'dwell_counts': self.dwell.counts, \
+                'dwell_total': self.dwell.total, \
+                'dwell_longest': self.dwell.longest, \
+                'hour_visits': self.hour_visits, \
+                'hour_seconds': self.hour_seconds, \
+                'first_day': self.first_day, \
+                'last_day': self.last_day}
+
+    def save(self, path, now=None):
+        """
+        Write the statistics and their summary; the old file stays until
+        the new one is completely written
+        """
+        temp_path = path+'.tmp'
+        fp = open(temp_path, 'w')
+        json.dump({'version': OCCUPANCY_VERSION, \
+                   'summary': self.summary(now), \
+                   'stats': self.to_dict()}, fp, sort_keys=True, \
+                  separators=(',', ':'))
+        fp.flush()
+        os.fsync(fp.fileno())
+        fp.close()
+        os.rename(temp_path, path)
+
+def load_occupancy(path):
+    """
+    Statistics saved by save(), or None if there are none to be had
+    """
+    try:
+        fp = open(path)
+        try:
+            data = json.load(fp)
+        finally:
+            fp.close()
+        if data.get('version') != OCCUPANCY_VERSION:
+            return None
+        saved = data['stats']
+        stats = OccupancyStats()
+        stats.visits = int(saved['visits'])
+        stats.day_numbers = [int(n) for n in saved['day_numbers']]
+        stats.day_visits = [int(n) for n in saved['day_visits']]
+        stats.dwell.counts = [int(n) for n in saved['dwell_counts']]
+        stats.dwell.total = float(saved['dwell_total'])
+        stats.dwell.longest = float(saved['dwell_longest'])
+        stats.hour_visits = [int(n) for n in saved['hour_visits']]
+        stats.hour_seconds = [float(s) for s in saved['hour_seconds']]
+        stats.first_day = saved['first_day']
+        stats.last_day = saved['last_day']
+    except (IOError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if len(stats.day_numbers) != DAYS or len(stats.day_visits) != DAYS or \
+       len(stats.dwell.counts) != len(DWELL_EDGES) or \
+       len(stats.hour_visits) != HOURS or len(stats.hour_seconds) != HOURS:
+        return None
+    return stats
@@ -0,0 +1,166 @@
+"""
+# pigpio output backend for the raspbot
+# GNU GPL V3
+#
+# The robot used three GPIO libraries at once: RPIO.PWM for the servo,
+# RPi.GPIO for the LEDs and pigpio for the sensor. RPIO and pigpio each
+# grab a DMA channel (hence the "DMA channel in use" warnings) and under
+# CPU load the servo jittered. PigpioOutput drives everything through
+# the pigpio daemon that is already running for the sensor: one daemon
+# connection, one DMA channel, and servo pulses and LED patterns timed
+# by the hardware rather than by Python.
+#
+# The control loop doesn't talk to the daemon itself. Every call puts a
+# command on one queue and a worker thread sends them in order, so a
+# frame's dozen LED writes never hold up the loop. A servo command that
+# hasn't been sent yet is replaced by a newer one for the same servo.
+#     output = PigpioOutput(pigpio.pi())
+#     output.setup(11)                  # header pin 11 (BCM GPIO 17)
+#     output.write(11, True)
+#     output.set_servo(11, 1500)        # BCM GPIO 11, like RPIO.PWM
+#     output.play_wave(pattern)         # raspbot_leds.Pattern
+#
+# LED pins are header (BOARD) numbers like the RPi.GPIO code used; servo
+# pins are BCM GPIO numbers like RPIO.PWM used. set_servo and stop_servo
+# have RPIO.PWM.Servo's signatures.
+
+# Feb 2015
+"""
+import threading
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import pigpio
+
+# 40 pin header pin -> BCM GPIO
+BOARD_TO_BCM = {3: 2, 5: 3, 7: 4, 8: 14, 10: 15, 11: 17, 12: 18, 13: 27, \
+                15: 22, 16: 23, 18: 24, 19: 10, 21: 9, 22: 25, 23: 11, \
+                24: 8, 26: 7, 27: 0, 28: 1, 29: 5, 31: 6, 32: 12, 33: 13, \
+                35: 19, 36: 16, 37: 26, 38: 20, 40: 21}
+WAVE_LOOP_MAX = 65535       # most times pigpio can repeat a wave chain
+
+class PigpioOutput(object):
+    """
+    Servo and LED output through one pigpio connection and one queue
+    """
+    def __init__(self, pi, board_pins=True):
+        self.pi = pi
+        self.board_pins = board_pins
+        self.commands = queue.Queue()
+        self.servo_pulses = {}          # gpio -> newest pulse not yet sent
+        self.servos = set()
+        self.lock = threading.Lock()
+        self.wave_id = None
+        self.errors = 0
+        self.worker = threading.Thread(target=self._run, name='output')
+        self.worker.daemon = True
+        self.worker.start()
+
+    def gpio(self, pin):
+        if self.board_pins:
+            return BOARD_TO_BCM[pin]
+        return pin
+
+    # commands from the control loop
+
+    def setup(self, pin):
+        self.commands.put((self._setup, (self.gpio(pin),)))
+
+    def write(self, pin, state):
+        self.commands.put((self._write, (self.gpio(pin), state)))
+
+    def set_servo(self, gpio, pulse_width):
+        with self.lock:
+            queued = gpio in self.servo_pulses
+            self.servos.add(gpio)
+            self.servo_pulses[gpio] = pulse_width
+        if not queued:
+            self.commands.put((self._servo, (gpio,)))
+
+    def stop_servo(self, gpio):
+        self.set_servo(gpio, 0)
+
+    def play_wave(self, pattern, on=True):
+        """
+        Play a raspbot_leds pattern as a pigpio wave; the daemon times
+        the keyframes and repeats it (forever if pattern.repeat is None)
+        """
+        self.commands.put((self._play_wave, (pattern, on)))
+
+    def stop_wave(self):
+        self.commands.put((self._stop_wave, ()))
+
+    def flush(self):
+        """
+        Wait until every command so far has been sent
+        """
+        done = threading.Event()
+        self.commands.put((done.set, ()))
+        done.wait()
+
+    def close(self):
+        """
+        Stop the servos and waves and let the worker finish
+        """
+        with self.lock:
+            gpios = list(self.servos)
+        for gpio in gpios:
+            self.stop_servo(gpio)
+        self.stop_wave()
+        self.commands.put(None)
+        self.worker.join(1.0)
+
+    # the worker
+
+    def _run(self):
+        while True:
+            command = self.commands.get()
+            if command is None:
+                return
+            (function, args) = command
+            try:
+                function(*args)
+            except Exception:       # pigpio.error or a dropped connection
+                self.errors += 1
+
+    def _setup(self, gpio):
+        self.pi.set_mode(gpio, pigpio.OUTPUT)
+
+    def _write(self, gpio, state):
+        self.pi.write(gpio, 1 if state else 0)
+
+    def _servo(self, gpio):
+        with self.lock:
+            pulse_width = self.servo_pulses.pop(gpio)
+        self.pi.set_servo_pulsewidth(gpio, pulse_width)
+
+    def _play_wave(self, pattern, on):
+        self._stop_wave()
+        pulses = []
+        for (seconds, states) in pattern.frames:
+            on_mask = 0
+            off_mask = 0
+            for pin in states:
+                if states[pin] == on:
+                    on_mask |= 1 << self.gpio(pin)
+                else:
+                    off_mask |= 1 << self.gpio(pin)
+            pulses.append(pigpio.pulse(on_mask, off_mask, \
+                                       int(seconds*1000000)))
+        self.pi.wave_add_generic(pulses)
+        self.wave_id = self.pi.wave_create()
+        if pattern.repeat is None:
+            self.pi.wave_send_repeat(self.wave_id)
+        else:
+            count = min(pattern.repeat, WAVE_LOOP_MAX)
+            self.pi.wave_chain([255, 0, self.wave_id, \
+                                255, 1, count & 0xff, count >> 8])
+
+    def _stop_wave(self):
+        if self.wave_id is None:
+            return
+        self.pi.wave_tx_stop()
+        self.pi.wave_delete(self.wave_id)
+        self.wave_id = None
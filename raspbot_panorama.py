@@ -0,0 +1,101 @@
+"""
+# Panoramic thermal map for the raspbot
+# GNU GPL V3
+#
+# Each 4x4 frame from the head sensor covers a different slice of the
+# room as the head moves, and used to be thrown away once its hits were
+# counted. Panorama stitches every frame into a map of the room, one
+# cell per head position bin and sensor row, so the robot can ask where
+# anything warm has been seen anywhere in its sweep and turn straight
+# there.
+#
+# The map is a fixed size (bins x 4 rows) and a frame updates its 16
+# cells and nothing else, so memory is bounded and stitching a frame
+# takes the same time however big the map is. A cell keeps the last
+# temperature seen there and when it was seen.
+#     panorama = Panorama(600, 2300)
+#     panorama.stitch(servo_position, temperatures, time.time())
+#     warm = panorama.warmest(80.0, 10.0, time.time())
+#     if warm is not None:
+#         (position, temperature) = warm
+#
+# Elements are numbered x*4 + y with x the column, 0 being the far
+# right, and y the row. high_is_right says whether the right of the
+# sensor is towards the high servo positions.
+
+# Feb 2015
+"""
+from array import array
+
+ROWS = 4
+COLUMNS = 4
+
+class Panorama(object):
+    """
+    The last temperature seen in every direction the head has looked
+    """
+    def __init__(self, low, high, step=50, view=400, high_is_right=True):
+        if low > high:
+            (low, high) = (high, low)
+        self.low = low
+        self.step = step
+        self.bins = (high - low)//step + 1
+        self.high_is_right = high_is_right
+        # the bin offset of each sensor column from the head position
+        width = float(view)/COLUMNS
+        self.offsets = []
+        for x in range(COLUMNS):
+            offset = (1.5 - x)*width
+            if not high_is_right:
+                offset = -offset
+            self.offsets.append(int(round(offset/step)))
+        self.temps = array('f', [0.0]*(self.bins*ROWS))
+        self.times = array('d', [0.0]*(self.bins*ROWS))  # 0.0 is never
+
+    def index(self, position):
+        """
+        The bin a servo position is in
+        """
+        i = int(round(float(position - self.low)/self.step))
+        return max(0, min(self.bins-1, i))
+
+    def position(self, i):
+        return self.low + i*self.step
+
+    def stitch(self, position, temperatures, now):
+        """
+        Add a frame taken with the head at position
+        """
+        here = self.index(position)
+        for x in range(COLUMNS):
+            i = here + self.offsets[x]
+            if i < 0 or i >= self.bins:
+                continue            # off the end of the head's range
+            for y in range(ROWS):
+                self.temps[i*ROWS+y] = temperatures[x*ROWS+y]
+                self.times[i*ROWS+y] = now
+
+    def warmest(self, threshold, max_age, now):
+        """
+        (servo position, temperature) of the warmest cell over threshold
+        seen in the last max_age seconds, or None
+        """
+        best = None
+        oldest = now - max_age
+        for cell in range(len(self.temps)):
+            temp = self.temps[cell]
+            if temp > threshold and self.times[cell] >= oldest and \
+               (best is None or temp > best[1]):
+                best = (cell//ROWS, temp)
+        if best is None:
+            return None
+        return (self.position(best[0]), best[1])
+
+    def column(self, position):
+        """
+        The temperatures seen (None if never) in the bin at position by
+        row
+        """
+        i = self.index(position)
+        return [self.temps[i*ROWS+y] if self.times[i*ROWS+y] else None \
+                for y in range(ROWS)]
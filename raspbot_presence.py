@@ -0,0 +1,126 @@
+"""
+# Presence estimator for the raspbot's greetings
+# GNU GPL V3
+#
+# The robot said hello whenever the state machine entered DETECTED and
+# goodbye on the first frame with too few hits, so one noisy frame
+# meant a goodbye and a hello again seconds later, two clips each time.
+#
+# PresenceEstimator turns the state machine's per frame verdict into a
+# confidence that someone is there, and only a confirmed change says
+# hello or goodbye:
+#   - each frame the confidence moves towards the evidence (1.0 for
+#     DETECTED, less for the states on the way), fast going up and
+#     slowly coming down
+#   - someone arrives when the confidence reaches ENTER, and leaves when
+#     it drops to EXIT; in between nothing changes (hysteresis)
+#   - nobody arrives before MIN_ABSENT seconds away, nor leaves before
+#     MIN_PRESENT seconds there (dwell times)
+#   - the same tracked person (raspbot_tracker.py) isn't greeted again
+#     until COOLDOWN seconds after they were last seen. Without a track,
+#     a hello that soon after the last goodbye isn't said. A presence
+#     that wasn't greeted isn't said goodbye to either.
+# frame_evidence() gives the evidence the robot (and raspbot_sweep.py)
+# feeds it: STATE_EVIDENCE for the state the machine is in, and at least
+# TRACKED_EVIDENCE while the target is tracked.
+#     presence = PresenceEstimator()
+#     evidence = frame_evidence(ctx.state, tracker.primary())
+#     event = presence.update(evidence, track_id, time.time())
+#     if event == HELLO: ...
+#     elif event == GOODBYE: ...
+
+# Feb 2015
+"""
+from raspbot_state import STATE_LIKELY, STATE_PROBABLE, STATE_DETECTED
+
+HELLO = 'hello'
+GOODBYE = 'goodbye'
+
+ENTER = 0.6                 # confidence at which someone has arrived
+EXIT = 0.25                 # confidence at which they have left
+RISE = 0.5                  # how far confidence moves up to the evidence
+FALL = 0.15                 # and down
+MIN_PRESENT = 5.0           # seconds someone is there at least
+MIN_ABSENT = 3.0            # seconds nobody is there at least
+COOLDOWN = 60.0             # seconds before greeting the same person again
+STATE_EVIDENCE = {STATE_DETECTED: 1.0, STATE_PROBABLE: 0.5, \
+                  STATE_LIKELY: 0.2}
+TRACKED_EVIDENCE = 0.5
+
+def frame_evidence(state, target=None):
+    """
+    Evidence someone is there from the state machine's state and the
+    tracked target (or None)
+    """
+    evidence = STATE_EVIDENCE.get(state, 0.0)
+# a person still tracked keeps someone there through a noisy frame or two
+    if target is not None and target.misses == 0:
+        evidence = max(evidence, TRACKED_EVIDENCE)
+    return evidence
+
+class PresenceEstimator(object):
+    """
+    Decides when a person has really arrived or left
+    """
+    def __init__(self, enter=ENTER, exit=EXIT, rise=RISE, fall=FALL, \
+                 min_present=MIN_PRESENT, min_absent=MIN_ABSENT, \
+                 cooldown=COOLDOWN):
+        self.enter = enter
+        self.exit = exit
+        self.rise = rise
+        self.fall = fall
+        self.min_present = min_present
+        self.min_absent = min_absent
+        self.cooldown = cooldown
+        self.confidence = 0.0
+        self.present = False
+        self.since = None           # when present last changed
+        self.greeted = {}           # track id -> when last greeted
+        self.spoken = False         # the current presence was greeted
+        self.last_goodbye = None
+
+    def update(self, evidence, track_id, now):
+        """
+        Feed one frame's evidence (0.0 to 1.0) that someone is there;
+        returns HELLO, GOODBYE or None
+        """
+        if evidence > self.confidence:
+            self.confidence += self.rise*(evidence - self.confidence)
+        else:
+            self.confidence += self.fall*(evidence - self.confidence)
+        dwell = None
+        if self.since is not None:
+            dwell = now - self.since
+
+        if not self.present:
+            if self.confidence < self.enter or \
+               (dwell is not None and dwell < self.min_absent):
+                return None
+            self.present = True
+            self.since = now
+            self.spoken = self._should_greet(track_id, now)
+            if not self.spoken:
+                return None
+            if track_id is not None:
+                self.greeted[track_id] = now
+            return HELLO
+
+        if self.confidence > self.exit or dwell < self.min_present:
+            if self.spoken and track_id is not None:
+                self.greeted[track_id] = now
+            return None
+        self.present = False
+        self.since = now
+        if not self.spoken:
+            return None
+        self.last_goodbye = now
+        return GOODBYE
+
+    def _should_greet(self, track_id, now):
+        for (number, when) in list(self.greeted.items()):
+            if now - when >= self.cooldown:
+                del self.greeted[number]
+        if track_id is not None:
+            return track_id not in self.greeted
+        return self.last_goodbye is None or \
+               now - self.last_goodbye >= self.cooldown
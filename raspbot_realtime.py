@@ -0,0 +1,188 @@
+"""
+# Real time scheduling helpers for the raspbot
+# GNU GPL V3
+#
+# The robot shares the Pi with other services (pigpiod, the log, the
+# desktop) and the 0.3 second measurement cadence used to drift. The
+# -realtime option runs the control loop tasks (raspbot_runtime.py) on
+# these instead of time.time and time.sleep:
+#   - monotonic() is CLOCK_MONOTONIC, so setting the clock (NTP at boot)
+#     doesn't move the deadlines
+#   - sleep_until() sleeps to an absolute deadline (clock_nanosleep with
+#     TIMER_ABSTIME), so the time spent running tasks doesn't add up
+#   - set_fifo() asks for SCHED_FIFO priority for the control thread
+#     (needs root, as does the rest of the robot). Threads it starts
+#     later go back to normal priority (SCHED_RESET_ON_FORK).
+#   - isolate() pins the control thread to one CPU and every other
+#     thread of the robot (LED animator, pigpio output, text to speech)
+#     to the others. Threads inherit their creator's CPUs, so it is
+#     called again from time to time to move new threads off the
+#     control thread's CPU.
+#   - set_background() puts the calling thread at the lowest CPU
+#     priority and in the idle I/O class, for work like packing up
+#     recorded sessions that can wait for the robot to be idle.
+# Python 2 has none of these, so they are called through ctypes. Where
+# the C library doesn't have them monotonic() and sleep_until() fall
+# back to time.time and time.sleep, and set_fifo() and isolate() return
+# False.
+
+# Feb 2015
+"""
+import ctypes
+import ctypes.util
+import os
+import time
+
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+SCHED_FIFO = 1
+SCHED_RESET_ON_FORK = 0x40000000
+EINTR = 4
+PRIO_PROCESS = 0
+NICE_LOWEST = 19
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+# ioprio_set has no C library wrapper; its system call number by machine
+IOPRIO_SET = {'armv6l': 314, 'armv7l': 314, 'aarch64': 30, \
+              'x86_64': 251, 'i686': 289}
+CPU_SET_WORDS = 1024//(8*ctypes.sizeof(ctypes.c_ulong))
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+class _sched_param(ctypes.Structure):
+    _fields_ = [('sched_priority', ctypes.c_int)]
+
+def _load_libc():
+    for name in ('c', 'rt'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            lib = ctypes.CDLL(path, use_errno=True)
+        except OSError:
+            continue
+        if hasattr(lib, 'clock_gettime'):
+            return lib
+    return None
+
+_LIBC = _load_libc()
+
+def _error():
+    errno = ctypes.get_errno()
+    return OSError(errno, os.strerror(errno))
+
+if _LIBC is not None:
+    def monotonic():
+        """
+        Seconds on CLOCK_MONOTONIC
+        """
+        now = _timespec()
+        if _LIBC.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(now)) != 0:
+            raise _error()
+        return now.tv_sec + now.tv_nsec*1e-9
+
+    def sleep_until(deadline):
+        """
+        Sleep until monotonic() reaches deadline
+        """
+        when = _timespec(int(deadline), int((deadline % 1)*1e9))
+        while True:
+            result = _LIBC.clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, \
+                                           ctypes.byref(when), None)
+            if result != EINTR:
+                return
+else:
+    monotonic = time.time
+
+    def sleep_until(deadline):
+        wait = deadline - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+def set_fifo(priority=None):
+    """
+    Run the calling thread SCHED_FIFO at priority (the highest but one
+    if not given); False if it couldn't be done
+    """
+    if _LIBC is None:
+        return False
+    if priority is None:
+        priority = _LIBC.sched_get_priority_max(SCHED_FIFO) - 1
+    param = _sched_param(priority)
+    if _LIBC.sched_setscheduler(0, SCHED_FIFO | SCHED_RESET_ON_FORK, \
+                                ctypes.byref(param)) != 0:
+        return False
+    return True
+
+def cpu_count():
+    try:
+        return os.sysconf('SC_NPROCESSORS_ONLN')
+    except (ValueError, OSError, AttributeError):
+        return 1
+
+def set_affinity(cpus, tid=0):
+    """
+    Let a thread (the calling one if tid is 0) run only on cpus
+    """
+    mask = (ctypes.c_ulong*CPU_SET_WORDS)()
+    bits = 8*ctypes.sizeof(ctypes.c_ulong)
+    for cpu in cpus:
+        mask[cpu//bits] |= 1 << (cpu % bits)
+    if _LIBC.sched_setaffinity(tid, ctypes.sizeof(mask), \
+                               ctypes.byref(mask)) != 0:
+        raise _error()
+
+def current_tid():
+    """
+    Kernel thread id of the calling thread
+    """
+    try:
+        return int(os.readlink('/proc/thread-self').split('/')[-1])
+    except (OSError, ValueError):
+        return os.getpid()          # right for the main thread
+
+def thread_ids():
+    """
+    Kernel thread ids of every thread in this process
+    """
+    return [int(tid) for tid in os.listdir('/proc/self/task')]
+
+def isolate(cpu=None):
+    """
+    Pin the calling thread to cpu (the last one if not given) and the
+    other threads to the rest; False on a single CPU or without libc
+    """
+    count = cpu_count()
+    if _LIBC is None or count < 2:
+        return False
+    if cpu is None:
+        cpu = count - 1
+    others = [n for n in range(count) if n != cpu]
+    me = current_tid()
+    set_affinity([cpu])
+    for tid in thread_ids():
+        if tid == me:
+            continue
+        try:
+            set_affinity(others, tid)
+        except OSError:
+            pass                    # the thread ended meanwhile
+    return True
+
+def set_background():
+    """
+    Run the calling thread at the lowest CPU priority and, where the
+    kernel allows, in the idle I/O class; False if neither was done
+    """
+    if _LIBC is None:
+        return False
+# on Linux nice is per thread and 0 is the calling one
+    lowered = _LIBC.setpriority(PRIO_PROCESS, 0, NICE_LOWEST) == 0
+    number = IOPRIO_SET.get(os.uname()[4])
+    if number is not None:
+        idle = IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT
+        if _LIBC.syscall(number, IOPRIO_WHO_PROCESS, 0, idle) == 0:
+            lowered = True
+    return lowered
@@ -0,0 +1,100 @@
+"""
+# Thermal session recorder for the raspbot
+# GNU GPL V3
+#
+# Every frame the robot reads can be written to a session file so it
+# can be replayed later (see raspbot_sweep.py). A session file is an
+# 8 byte header followed by fixed size little endian records:
+#     timestamp (double), servo position (unsigned short),
+#     room temperature (float), 16 element temperatures (float)
+# Files are written in segments of SEGMENT_FRAMES frames. A segment
+# being written is named *.rec.part and renamed to *.rec when closed,
+# so anything ending in .rec is complete.
+
+# Feb 2015
+"""
+import os
+import struct
+import time
+
+RECORD_MAGIC = b'RBTREC01'
+RECORD_FORMAT = '<dHf16f'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+RECORD_SUFFIX = '.rec'
+PART_SUFFIX = '.part'
+SEGMENT_FRAMES = 1200       # about six minutes at 0.3 seconds a frame
+
+class FrameRecorder(object):
+    """
+    Appends frames to segmented session files in a directory
+    """
+    def __init__(self, directory, robot_name='raspbot', \
+                 segment_frames=SEGMENT_FRAMES):
+        self.directory = directory
+        self.robot_name = robot_name
+        self.segment_frames = segment_frames
+        self.handle = None
+        self.path = None
+        self.frames = 0
+        self.segments = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def open_segment(self, timestamp):
+        """
+        Start a new segment file
+        """
+        name = '%s-%s-%04d%s' % (self.robot_name, \
+               time.strftime('%Y%m%d-%H%M%S', time.localtime(timestamp)), \
+               self.segments, RECORD_SUFFIX)
+        self.segments += 1
+        self.path = os.path.join(self.directory, name)
+        self.handle = open(self.path+PART_SUFFIX, 'wb')
+        self.handle.write(RECORD_MAGIC)
+        self.frames = 0
+
+    def close_segment(self):
+        """
+        Finish the current segment so it can be picked up
+        """
+        if self.handle is None:
+            return None
+        self.handle.close()
+        self.handle = None
+        os.rename(self.path+PART_SUFFIX, self.path)
+        return self.path
+
+    def write(self, timestamp, servo_position, room_temp, temperatures):
+        """
+        Record one frame
+        """
+        if self.handle is None:
+            self.open_segment(timestamp)
+        self.handle.write(struct.pack(RECORD_FORMAT, timestamp, \
+                                      servo_position or 0, room_temp, \
+                                      *temperatures))
+        self.frames += 1
+        if self.frames >= self.segment_frames:
+            self.close_segment()
+
+    def close(self):
+        self.close_segment()
+
+def read_frames(path):
+    """
+    Generator of (timestamp, servo position, room temp, temperatures)
+    from a session file. A torn last record is ignored.
+    """
+    fp = open(path, 'rb')
+    try:
+        if fp.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+            raise ValueError('not a raspbot session file: '+path)
+        unpack = struct.Struct(RECORD_FORMAT).unpack
+        while True:
+            record = fp.read(RECORD_SIZE)
+            if len(record) < RECORD_SIZE:
+                break
+            values = unpack(record)
+            yield (values[0], values[1], values[2], list(values[3:]))
+    finally:
+        fp.close()
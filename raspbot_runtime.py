@@ -0,0 +1,250 @@
+"""
+# Cooperative control loop runtime for the raspbot
+# GNU GPL V3
+#
+# The robot was one while True loop full of time.sleep(): the time
+# between measurements, the servo settle time, the roam stop delay and a
+# busy wait on the mixer. Every one of them blocked everything else, so
+# the worst case reaction time was the sum of all of them.
+#
+# Runtime runs the robot's jobs as cooperating tasks on one thread:
+#   - periodic tasks are called every period seconds (sensor polling,
+#     the heartbeat LED, the audio queue, pygame events)
+#   - generator tasks yield how many seconds to wait before they go on
+#   - call_later() runs a function once after a delay
+# Nothing sleeps except the runtime itself, between tasks. (asyncio is
+# Python 3 only; the robot runs Python 2, hence generators.)
+#
+# This is the one place loop timing is measured and enforced. For every
+# periodic task the runtime keeps how late each run started (jitter),
+# how long it ran and how often it missed its deadline (didn't finish
+# within deadline seconds of when it was due). A task that falls more
+# than a whole period behind skips the runs it missed rather than
+# running them back to back. How late runs start is also kept as a
+# histogram (LATENESS_BUCKETS) so the tail shows up, not just the max.
+#
+# The clock and sleep are passed in, so with SimulatedClock the same
+# tasks can be run in simulation, instantly:
+#     clock = SimulatedClock()
+#     runtime = Runtime(clock.time, clock.sleep)
+#     runtime.every('sense', 0.3, sense, deadline=0.3)
+#     runtime.spawn('blink', blinker())     # def blinker(): ... yield 0.5
+#     runtime.run(until=60.0)
+#     for line in runtime.report(): print(line)
+#
+# For steadier timing pass raspbot_realtime.monotonic as the clock and
+# its sleep_until, which sleeps to the absolute time a task is due.
+
+# Feb 2015
+"""
+import heapq
+import time
+
+# upper bounds in seconds of the lateness histogram; the last bucket
+# counts everything later than the last bound
+LATENESS_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.3)
+
+class SimulatedClock(object):
+    """
+    A clock whose sleep() just moves time on
+    """
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+class Task(object):
+    """
+    A periodic or generator task and its timing statistics
+    """
+    __slots__ = ('name', 'func', 'generator', 'period', 'deadline', \
+                 'due', 'cancelled', 'runs', 'skipped', 'misses', \
+                 'jitter_total', 'jitter_max', 'run_max', 'lateness')
+
+    def __init__(self, name, func=None, generator=None, period=None, \
+                 deadline=None):
+        self.name = name
+        self.func = func
+        self.generator = generator
+        self.period = period
+        self.deadline = deadline
+        self.due = 0.0
+        self.cancelled = False
+        self.runs = 0
+        self.skipped = 0            # runs dropped after falling behind
+        self.misses = 0             # runs that finished past the deadline
+        self.jitter_total = 0.0
+        self.jitter_max = 0.0
+        self.run_max = 0.0
+        self.lateness = [0]*(len(LATENESS_BUCKETS)+1)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def jitter_mean(self):
+        if not self.runs:
+            return 0.0
+        return self.jitter_total/self.runs
+
+    def record_lateness(self, lateness):
+        bucket = 0
+        while bucket < len(LATENESS_BUCKETS) and \
+              lateness > LATENESS_BUCKETS[bucket]:
+            bucket += 1
+        self.lateness[bucket] += 1
+
+class Runtime(object):
+    """
+    Runs periodic and generator tasks on one thread
+    on_miss(task, late), if given, is called when a task misses its
+    deadline; late is how many seconds past the deadline it finished.
+    sleep_until(when), if given, is used instead of sleep to wait for
+    the clock to reach when.
+    """
+    def __init__(self, clock=time.time, sleep=time.sleep, on_miss=None, \
+                 sleep_until=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.sleep_until = sleep_until
+        self.on_miss = on_miss
+        self.queue = []             # (due, sequence, task)
+        self.sequence = 0
+        self.tasks = []
+        self.running = False
+
+    def now(self):
+        return self.clock()
+
+    def _schedule(self, task, due):
+        task.due = due
+        self.sequence += 1
+        heapq.heappush(self.queue, (due, self.sequence, task))
+
+    def every(self, name, period, func, deadline=None, delay=0.0):
+        """
+        Call func() every period seconds, the first time after delay
+        """
+        task = Task(name, func=func, period=period, deadline=deadline)
+        self.tasks.append(task)
+        self._schedule(task, self.clock() + delay)
+        return task
+
+    def spawn(self, name, generator, delay=0.0):
+        """
+        Run a generator that yields the seconds to wait before resuming
+        """
+        task = Task(name, generator=generator)
+        self.tasks.append(task)
+        self._schedule(task, self.clock() + delay)
+        return task
+
+    def call_later(self, delay, func, name='later'):
+        """
+        Call func() once after delay seconds; cancel() the task returned
+        to stop it
+        """
+        task = Task(name, func=func)
+        self._schedule(task, self.clock() + delay)
+        return task
+
+    def defer(self, task, seconds):
+        """
+        Hold off a periodic task's next run until seconds from now
+        (e.g. sensing while the head settles)
+        """
+        due = self.clock() + seconds
+        if due > task.due:
+            self._schedule(task, due)
+
+    def stop(self):
+        self.running = False
+
+    def _run_task(self, task, now):
+        if task.generator is not None:
+            try:
+                wait = next(task.generator)
+            except StopIteration:
+                return
+            self._schedule(task, now + (wait or 0.0))
+            return
+        if task.period is None:
+            task.func()
+            return
+
+        released = task.due
+        lateness = now - released
+        task.runs += 1
+        task.jitter_total += lateness
+        task.jitter_max = max(task.jitter_max, lateness)
+        task.record_lateness(lateness)
+        task.func()
+        end = self.clock()
+        task.run_max = max(task.run_max, end - now)
+        if task.deadline is not None and end - released > task.deadline:
+            task.misses += 1
+            if self.on_miss is not None:
+                self.on_miss(task, end - released - task.deadline)
+        if task.due != released:
+            return                  # deferred while it ran; already queued
+
+        due = released + task.period
+        if due <= end:
+            behind = int((end - due)/task.period) + 1
+            task.skipped += behind
+            due += behind*task.period
+        self._schedule(task, due)
+
+    def run(self, until=None):
+        """
+        Run tasks until stop() is called, there are none left or the
+        clock reaches until; exceptions from tasks are raised here
+        """
+        self.running = True
+        while self.running and self.queue:
+            (due, sequence, task) = self.queue[0]
+            if until is not None and due > until:
+                if until > self.clock():
+                    self.sleep(until - self.clock())
+                break
+            wait = due - self.clock()
+            if wait > 0:
+                if self.sleep_until is not None:
+                    self.sleep_until(due)
+                else:
+                    self.sleep(wait)
+                continue
+            heapq.heappop(self.queue)
+            if task.cancelled or due != task.due:
+                continue            # cancelled, or deferred and requeued
+            self._run_task(task, self.clock())
+        self.running = False
+
+    def report(self):
+        """
+        Lines of per task timing statistics
+        """
+        lines = []
+        for task in self.tasks:
+            if task.period is None:
+                continue
+            lines.append('%-10s runs %d jitter mean %.1fms max %.1fms ' \
+                         'run max %.1fms misses %d skipped %d' % \
+                         (task.name, task.runs, 1000*task.jitter_mean(), \
+                          1000*task.jitter_max, 1000*task.run_max, \
+                          task.misses, task.skipped))
+        return lines
+
+    def histogram(self, task):
+        """
+        A line of how many of a task's runs started how late
+        """
+        counts = ['<%gms %d' % (1000*bound, count) for (bound, count) \
+                  in zip(LATENESS_BUCKETS, task.lateness)]
+        counts.append('>%gms %d' % (1000*LATENESS_BUCKETS[-1], \
+                                    task.lateness[-1]))
+        return '%-10s lateness %s' % (task.name, ' '.join(counts))
@@ -0,0 +1,121 @@
+"""
+# Person search planner for the raspbot
+# GNU GPL V3
+#
+# Roaming used to sweep the head from limit to limit in 50us steps, a
+# frame at each one, so finding someone who walked in could take the
+# whole 35 step sweep. The sensor sees about 44 degrees at once (about
+# 400us of head travel) so most of those frames looked at what the last
+# one had just seen.
+#
+# SearchPlanner keeps a map of the head's range in step sized bins:
+#   - heat: the hits seen in each bin, fading with HALF_LIFE
+#   - occupancy: frames a person was detected at each bin, also fading
+#   - when each bin was last in view, and how many looks in a row it
+#     has been cold
+# Every frame marks the bins under each of the sensor's four columns as
+# seen, warm or cold. next_position() picks the bin most worth a look:
+# likely ones (heat and occupancy) first, ones not seen for a while
+# before ones just seen cold, and ones that keep looking cold last. A
+# bin that was warm on its last look is worth another one straight
+# away: leaving NOTHING takes hits on two frames in a row. Ties go
+# to the nearest bin, so with an empty map the head jumps about a
+# sensor's width at a time and covers its range in seven frames, and
+# with a history it looks where people usually are first.
+#     planner = SearchPlanner(600, 2300)
+#     planner.observe(position, columns, time.time())   # every frame
+#     planner.detected(position, time.time())           # person found
+#     position = planner.next_position(position, time.time())
+# columns are the hit counts of the sensor columns ordered from the low
+# servo position side to the high side.
+
+# Feb 2015
+"""
+HALF_LIFE = 3600.0          # seconds for heat and occupancy to halve
+REVISIT = 20.0              # seconds before a bin seen is worth a look
+BASE_PRIOR = 1.0            # worth of a bin nothing is known about
+OCCUPANCY_WEIGHT = 4.0      # a detection counts for this many hits
+COLD_MAX = 10               # most cold looks in a row counted
+
+class SearchPlanner(object):
+    """
+    Decides where the head looks next while roaming
+    """
+    def __init__(self, low, high, step=50, view=400, half_life=HALF_LIFE, \
+                 revisit=REVISIT):
+        if low > high:
+            (low, high) = (high, low)
+        self.positions = list(range(low, high+1, step))
+        self.step = step
+        self.view = view            # servo travel the sensor sees at once
+        self.half_life = half_life
+        self.revisit = revisit
+        count = len(self.positions)
+        self.heat = [0.0]*count
+        self.occupancy = [0.0]*count
+        self.decayed = [None]*count # when heat and occupancy were decayed
+        self.seen = [None]*count
+        self.cold = [0]*count
+
+    def index(self, position):
+        """
+        The bin a servo position is in
+        """
+        i = int(round(float(position - self.positions[0])/self.step))
+        return max(0, min(len(self.positions)-1, i))
+
+    def _decay(self, i, now):
+        if self.decayed[i] is not None:
+            factor = 0.5**((now - self.decayed[i])/self.half_life)
+            self.heat[i] *= factor
+            self.occupancy[i] *= factor
+        self.decayed[i] = now
+
+    def observe(self, position, columns, now):
+        """
+        Record what each sensor column saw with the head at position
+        """
+        width = float(self.view)/len(columns)
+        for (column, hits) in enumerate(columns):
+            center = position + (column - (len(columns)-1)/2.0)*width
+            first = self.index(center - width/2)
+            last = self.index(center + width/2)
+            for i in range(first, last+1):
+                self._decay(i, now)
+                self.seen[i] = now
+                if hits:
+                    self.heat[i] += hits
+                    self.cold[i] = 0
+                else:
+                    self.cold[i] = min(self.cold[i]+1, COLD_MAX)
+
+    def detected(self, position, now):
+        """
+        Record a person detected with the head at position
+        """
+        i = self.index(position)
+        self._decay(i, now)
+        self.occupancy[i] += 1
+
+    def score(self, i, now):
+        """
+        How much a look at bin i is worth now
+        """
+        self._decay(i, now)
+        prior = BASE_PRIOR + self.heat[i] + \
+                OCCUPANCY_WEIGHT*self.occupancy[i]
+        if self.seen[i] is not None and self.cold[i]:
+            prior *= min(1.0, (now - self.seen[i])/self.revisit)
+        return prior/(1 + self.cold[i])
+
+    def next_position(self, position, now):
+        """
+        Servo position to look at next
+        """
+        here = self.index(position)
+        best = None
+        for i in range(len(self.positions)):
+            key = (self.score(i, now), -abs(i - here))
+            if best is None or key > best[0]:
+                best = (key, i)
+        return self.positions[best[1]]
@@ -0,0 +1,244 @@
+"""
+# Multiple Omron D6T sensors for the raspbot
+# GNU GPL V3
+#
+# Every D6T-44L answers at the same I2C address (0x0a), so more than one
+# sensor needs either separate I2C buses or an I2C multiplexer such as
+# the TCA9548A (0x70) in front of them. Each sensor is described by a
+# ThermalSensor: which bus, which mux channel (if any), where it points
+# relative to the head and a calibration offset.
+#
+# SensorArray reads all the sensors each frame. Every bus gets a worker
+# thread so sensors on different buses are read at the same time;
+# sensors behind one mux share a bus and are read in turn by that bus's
+# worker. pigpio serializes commands on one connection, so give each bus
+# its own pigpio.pi() in pi_handles for truly concurrent reads.
+#
+# Each sensor is read through a SensorWatchdog (raspbot_watchdog.py), so
+# frames are PEC checked, retried and the sensor reinitialized after
+# repeated failures. A mux is only written when its channel changes, but
+# after any failed transfer it is written again, over the bus the
+# sensor's watchdog has now: a mux that browned out comes back selecting
+# nothing, and a reinit may have opened a new bus.
+#
+# fuse() turns the readings into one wide field of view: a list of
+# (bearing, [four temperatures top to bottom]) columns sorted by bearing,
+# where bearing is degrees clockwise of the head center. With sensors at
+# -44, 0 and +44 degrees the robot sees about 130 degrees at once.
+
+# Feb 2015
+"""
+import threading
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from raspbot_watchdog import SensorWatchdog, OMRON_ADDRESS, \
+                             OMRON_BUFFER_LENGTH
+ELEMENT_PITCH_H = 44.2/4    # degrees between element columns
+TCA9548A_ADDRESS = 0x70
+
+class ThermalSensor(object):
+    """
+    One D6T sensor
+    bearing is degrees clockwise of the head center
+    offset is added to every element, pixel_offsets (16) per element
+    """
+    __slots__ = ('name', 'bus', 'address', 'mux_address', 'mux_channel', \
+                 'bearing', 'offset', 'pixel_offsets', 'handle', 'result', \
+                 'watchdog')
+
+    def __init__(self, name, bus=1, bearing=0.0, mux_channel=None, \
+                 mux_address=TCA9548A_ADDRESS, address=OMRON_ADDRESS, \
+                 offset=0.0, pixel_offsets=None):
+        self.name = name
+        self.bus = bus
+        self.address = address
+        self.mux_address = mux_address
+        self.mux_channel = mux_channel
+        self.bearing = bearing
+        self.offset = offset
+        self.pixel_offsets = pixel_offsets
+        self.handle = None
+        self.result = None
+        self.watchdog = None
+
+    def calibrate(self, temperatures):
+        """
+        Apply this sensor's offsets to a list of temperatures
+        """
+        if self.pixel_offsets:
+            return [t + self.offset + p \
+                    for (t, p) in zip(temperatures, self.pixel_offsets)]
+        if self.offset:
+            return [t + self.offset for t in temperatures]
+        return temperatures
+
+class _BusWorker(threading.Thread):
+    """
+    Reads the sensors on one I2C bus, in order, whenever asked
+    """
+    def __init__(self, array, sensors):
+        threading.Thread.__init__(self, name='omron-bus-%d' % sensors[0].bus)
+        self.daemon = True
+        self.array = array
+        self.sensors = sensors
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+
+    def run(self):
+        while True:
+            if self.requests.get() is None:
+                return
+            readings = []
+            for sensor in self.sensors:
+                try:
+                    readings.append(self.array.read_sensor(sensor))
+                except IOError:
+                    readings.append((0, None, None))
+            self.results.put(readings)
+
+class SensorArray(object):
+    """
+    Several D6T sensors read together
+    """
+    def __init__(self, sensors, pigpio_handle, i2c_buses, \
+                 degree_unit='F', pi_handles=None, connect=None, \
+                 open_bus=None):
+        self.sensors = list(sensors)
+        self.pigpio_handle = pigpio_handle
+        self.i2c_buses = i2c_buses          # {bus number: smbus.SMBus}
+        self.pi_handles = pi_handles or {}  # {bus number: pigpio.pi}
+        self.degree_unit = degree_unit
+        self.connect = connect              # see SensorWatchdog
+        self.open_bus = open_bus
+        self.selected = {}                  # bus -> selected mux channel
+        self.workers = []
+
+    def pi_for(self, sensor):
+        return self.pi_handles.get(sensor.bus, self.pigpio_handle)
+
+    def select(self, sensor):
+        """
+        Point the multiplexer (if any) at this sensor
+        """
+        if sensor.mux_channel is None:
+            return
+        if self.selected.get(sensor.bus) != sensor.mux_channel:
+            i2c_bus = self.i2c_buses[sensor.bus]
+            if sensor.watchdog is not None:
+                i2c_bus = sensor.watchdog.i2c_bus   # reopened by a reinit
+            i2c_bus.write_byte(sensor.mux_address, 1 << sensor.mux_channel)
+            self.selected[sensor.bus] = sensor.mux_channel
+
+    def deselect(self, sensor):
+        """
+        Forget the bus's mux channel so the next select writes it
+        """
+        self.selected.pop(sensor.bus, None)
+
+    def init(self):
+        """
+        Initialize every sensor and start one reader per bus
+        returns the list of sensors that failed to initialize
+        """
+        failed = []
+        by_bus = {}
+        for sensor in self.sensors:
+            sensor.watchdog = SensorWatchdog(self.pi_for(sensor), sensor.bus, \
+                self.i2c_buses[sensor.bus], sensor.address, \
+                self.degree_unit, self.connect, self.open_bus, \
+                self._selector(sensor), self._deselector(sensor))
+            (sensor.handle, sensor.result) = sensor.watchdog.init()
+            if sensor.handle < 1:
+                failed.append(sensor)
+            by_bus.setdefault(sensor.bus, []).append(sensor)
+        for bus in sorted(by_bus.keys()):
+            worker = _BusWorker(self, by_bus[bus])
+            worker.start()
+            self.workers.append(worker)
+        return failed
+
+    def _selector(self, sensor):
+        def select():
+            self.select(sensor)
+        return select
+
+    def _deselector(self, sensor):
+        def deselect():
+            self.deselect(sensor)
+        return deselect
+
+    def read_sensor(self, sensor):
+        """
+        Read one sensor, returns (bytes read, temperatures, room temp)
+        """
+        (bytes_read, temperatures, room_temp) = sensor.watchdog.read()
+        if bytes_read == OMRON_BUFFER_LENGTH:
+            temperatures = sensor.calibrate(temperatures)
+        return (bytes_read, temperatures, room_temp)
+
+    def read(self):
+        """
+        Read every sensor; buses are read concurrently
+        returns a list of (bytes read, temperatures, room temp) in the
+        order the sensors were given
+        """
+        for worker in self.workers:
+            worker.requests.put(True)
+        readings = {}
+        for worker in self.workers:
+            for (sensor, reading) in zip(worker.sensors, \
+                                         worker.results.get()):
+                readings[id(sensor)] = reading
+        return [readings[id(sensor)] for sensor in self.sensors]
+
+    def close(self):
+        for worker in self.workers:
+            worker.requests.put(None)
+        self.workers = []
+
+def fuse(sensors, readings, merge_width=ELEMENT_PITCH_H/2):
+    """
+    One wide view from several sensors
+    returns a list of (bearing, [temperatures top to bottom]) sorted by
+    bearing. Columns from different sensors closer than merge_width
+    degrees are averaged. Failed readings are left out.
+    """
+    columns = []
+    for (sensor, (bytes_read, temperatures, room_temp)) in \
+            zip(sensors, readings):
+        if bytes_read != OMRON_BUFFER_LENGTH:
+            continue
+        # element = x*4+y; x=0 is the far right (counterclockwise) column
+        for x in range(0, 4):
+            columns.append((sensor.bearing + (x - 1.5)*ELEMENT_PITCH_H, \
+                            temperatures[x*4:x*4+4]))
+    columns.sort(key=lambda c: c[0])
+
+    fused = []
+    for (bearing, temps) in columns:
+        if fused and bearing - fused[-1][0] < merge_width:
+            (last_bearing, last_temps, count) = fused[-1]
+            fused[-1] = ((last_bearing*count + bearing)/(count+1), \
+                         [(a*count + b)/(count+1) \
+                          for (a, b) in zip(last_temps, temps)], count+1)
+        else:
+            fused.append((bearing, list(temps), 1))
+    return [(bearing, temps) for (bearing, temps, count) in fused]
+
+def warmest_bearing(columns, threshold, min_hits=2):
+    """
+    Hit weighted bearing of the warm columns in a fused view, or None if
+    fewer than min_hits elements are over threshold
+    """
+    hits = 0
+    total = 0.0
+    for (bearing, temps) in columns:
+        column_hits = len([t for t in temps if t > threshold])
+        hits += column_hits
+        total += column_hits*bearing
+    if hits < min_hits:
+        return None
+    return total/hits
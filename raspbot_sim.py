@@ -0,0 +1,278 @@
+#! /usr/bin/python
+"""
+# Thermal scene simulator for the raspbot
+# GNU GPL V3
+#
+# Renders what the Omron D6T-44L on the robot's head would see for a
+# scripted scene of heat sources (people, coffee cups, candles, light
+# bulbs) placed at bearings and distances around the robot. Frames come
+# back in the same shape omron_read() returns:
+#     (bytes_read, [16 temperatures], room_temperature)
+# so the detection code can be exercised without a person in the room.
+#
+# The sensor model follows the notes in raspbot.py "Analyze sensor data":
+#   - each element sees a lobe, not a square; lobes are modelled as
+#     gaussians so there are dead spots in between adjacent elements
+#   - lobes are not symmetrical; each element gets a fixed gain error
+#     (about 10%) and a small pointing error
+#   - far away objects fill less of a lobe and read cooler
+#   - with nothing in view the elements read a few degrees under room
+#     temperature ("background radiation")
+#
+# Example:
+#     scene = Scenario(room_temp=70.0)
+#     scene.add(person(bearing=20, distance=1.0), start=3.0, stop=30.0)
+#     sensor = SimulatedSensor(scene)
+#     (bytes_read, temps, room) = sensor.read(servo_position)
+#
+# python raspbot_sim.py -bench prints the frame rate on this machine
+
+# Feb 2015
+"""
+import math
+import random
+
+OMRON_BUFFER_LENGTH = 35    # bytes in a good D6T-44L read
+OMRON_DATA_LIST = 16        # sixteen elements
+
+# D6T-44L field of view is 44.2 x 45.7 degrees, four elements each way
+ELEMENT_PITCH_H = 44.2/4
+ELEMENT_PITCH_V = 45.7/4
+# width of a single element lobe, small enough to leave dead spots
+LOBE_SIGMA = 4.5
+LOBE_GAIN_ERROR = 0.10      # measured 10% offset between adjacent lobes
+LOBE_POINTING_ERROR = 1.5   # degrees
+BACKGROUND_OFFSET = 4.0     # empty room reads this much under room temp
+SENSOR_NOISE = 0.3          # degrees F, one sigma
+
+# servo geometry - 600us to 2300us is roughly 180 degrees of head travel
+CTR_SERVO_POSITION = 1500
+DEGREES_PER_US = 180.0/1700
+LOW_TO_HIGH_IS_COUNTERCLOCKWISE = 0
+LOW_TO_HIGH_IS_CLOCKWISE = 1
+
+SQRT2 = math.sqrt(2.0)
+
+def servo_to_bearing(servo_position, servo_type=LOW_TO_HIGH_IS_CLOCKWISE):
+    """
+    Convert a servo pulse width to a head bearing in degrees
+    (clockwise positive, zero is straight ahead)
+    """
+    bearing = (servo_position - CTR_SERVO_POSITION)*DEGREES_PER_US
+    if servo_type == LOW_TO_HIGH_IS_CLOCKWISE:
+        return bearing
+    return -bearing
+
+def bearing_to_servo(bearing, servo_type=LOW_TO_HIGH_IS_CLOCKWISE):
+    """
+    Convert a head bearing in degrees to a servo pulse width
+    """
+    if servo_type != LOW_TO_HIGH_IS_CLOCKWISE:
+        bearing = -bearing
+    return int(round(CTR_SERVO_POSITION + bearing/DEGREES_PER_US))
+
+def _lobe_fraction(lo, hi, center, sigma):
+    """
+    Fraction of a gaussian lobe at center covered by the span lo..hi
+    """
+    return 0.5*(math.erf((hi-center)/(sigma*SQRT2)) - \
+                math.erf((lo-center)/(sigma*SQRT2)))
+
+class HeatSource(object):
+    """
+    Something warm in the room
+    bearing and elevation are in degrees (clockwise and up are positive)
+    distance, width and height are in meters, temperature in F
+    bearing_rate (degrees/second) lets the source walk across the room
+    """
+    __slots__ = ('name', 'bearing', 'distance', 'elevation', 'width', \
+                 'height', 'temperature', 'bearing_rate')
+
+    def __init__(self, name, bearing, distance, temperature, width, \
+                 height, elevation=0.0, bearing_rate=0.0):
+        self.name = name
+        self.bearing = bearing
+        self.distance = distance
+        self.temperature = temperature
+        self.width = width
+        self.height = height
+        self.elevation = elevation
+        self.bearing_rate = bearing_rate
+
+    def span(self, t):
+        """
+        Angular extent at time t: (left, right, bottom, top) in degrees
+        """
+        half_w = math.degrees(math.atan2(self.width/2.0, self.distance))
+        half_h = math.degrees(math.atan2(self.height/2.0, self.distance))
+        center = self.bearing + self.bearing_rate*t
+        return (center-half_w, center+half_w, \
+                self.elevation-half_h, self.elevation+half_h)
+
+# The sensor mainly "sees" faces and hands; clothing shields the rest
+def person(bearing, distance, elevation=0.0, bearing_rate=0.0):
+    """
+    A person's head and shoulders; the average of a warm face and
+    cooler clothing
+    """
+    return HeatSource('person', bearing, distance, 88.0, 0.30, 0.70, \
+                      elevation, bearing_rate)
+
+def coffee_cup(bearing, distance, elevation=-10.0):
+    """
+    A hot cup of coffee; close enough it is a burn hazard
+    """
+    return HeatSource('coffee', bearing, distance, 150.0, 0.08, 0.10, \
+                      elevation)
+
+def candle(bearing, distance, elevation=-5.0):
+    """
+    A candle flame; tiny but very hot
+    """
+    return HeatSource('candle', bearing, distance, 1000.0, 0.01, 0.03, \
+                      elevation)
+
+def light_bulb(bearing, distance, elevation=15.0):
+    """
+    An incandescent light bulb
+    """
+    return HeatSource('bulb', bearing, distance, 220.0, 0.06, 0.08, \
+                      elevation)
+
+class Scenario(object):
+    """
+    A scripted scene: heat sources that come and go over time
+    """
+    def __init__(self, room_temp=70.0, seed=None):
+        self.room_temp = room_temp
+        self.events = []        # (start, stop, source)
+        self.random = random.Random(seed)
+        # fixed per element lobe errors, like a real (imperfect) sensor
+        self.lobe_gain = [1.0 + self.random.uniform(-LOBE_GAIN_ERROR, \
+                                                    LOBE_GAIN_ERROR) \
+                          for i in range(OMRON_DATA_LIST)]
+        self.lobe_center_h = [self.random.uniform(-LOBE_POINTING_ERROR, \
+                                                  LOBE_POINTING_ERROR) \
+                              for i in range(OMRON_DATA_LIST)]
+
+    def add(self, source, start=0.0, stop=None):
+        """
+        Put a heat source in the scene between start and stop seconds
+        """
+        self.events.append((start, stop, source))
+        return source
+
+    def visible(self, t):
+        """
+        List of sources in the scene at time t
+        """
+        return [src for (start, stop, src) in self.events \
+                if start <= t and (stop is None or t < stop)]
+
+    def render(self, t, head_bearing, noise=SENSOR_NOISE):
+        """
+        Temperatures (F) of the sixteen elements at time t with the head
+        pointing at head_bearing, in omron_read element order
+        """
+        background = self.room_temp - BACKGROUND_OFFSET
+        gauss = self.random.gauss
+        temps = [background + gauss(0.0, noise) if noise else background \
+                 for i in range(OMRON_DATA_LIST)]
+        sources = self.visible(t)
+        if not sources:
+            return temps
+
+        gain = self.lobe_gain
+        offset_h = self.lobe_center_h
+        for src in sources:
+            (left, right, bottom, top) = src.span(t)
+            left -= head_bearing
+            right -= head_bearing
+            delta = src.temperature - background
+            # element = x*4+y; x=0 is the far right column of the hit
+            # array, y=0 the top row. hit column 0 is clockwise of center
+            for x in range(0, 4):
+                col_center = (x - 1.5)*ELEMENT_PITCH_H
+                if right < col_center - 4*LOBE_SIGMA - LOBE_POINTING_ERROR \
+                   or left > col_center + 4*LOBE_SIGMA + LOBE_POINTING_ERROR:
+                    continue
+                for y in range(0, 4):
+                    element = x*4+y
+                    row_center = (1.5 - y)*ELEMENT_PITCH_V
+                    v_frac = _lobe_fraction(bottom, top, row_center, \
+                                            LOBE_SIGMA)
+                    if v_frac < 0.001:
+                        continue
+                    h_frac = _lobe_fraction(left, right, \
+                                            col_center+offset_h[element], \
+                                            LOBE_SIGMA)
+                    temps[element] += gain[element]*h_frac*v_frac*delta
+        return temps
+
+class SimulatedSensor(object):
+    """
+    Stand-in for an Omron sensor that reads from a Scenario
+    Each read advances the scene clock by one frame period
+    """
+    def __init__(self, scenario, frame_period=0.3, degree_unit='F', \
+                 servo_type=LOW_TO_HIGH_IS_CLOCKWISE, noise=SENSOR_NOISE):
+        self.scenario = scenario
+        self.frame_period = frame_period
+        self.degree_unit = degree_unit
+        self.servo_type = servo_type
+        self.noise = noise
+        self.time = 0.0
+        self.servo_position = CTR_SERVO_POSITION
+
+    def read(self, servo_position=None):
+        """
+        Returns (bytes_read, temperature list, room temperature)
+        """
+        if servo_position is not None:
+            self.servo_position = servo_position
+        head = servo_to_bearing(self.servo_position, self.servo_type)
+        temps = self.scenario.render(self.time, head, self.noise)
+        room = self.scenario.room_temp
+        self.time += self.frame_period
+        if self.degree_unit == 'C':
+            temps = [(t-32.0)*5.0/9.0 for t in temps]
+            room = (room-32.0)*5.0/9.0
+        # the D6T reports tenths of a degree C
+        temps = [round(t, 1) for t in temps]
+        return (OMRON_BUFFER_LENGTH, temps, round(room, 1))
+
+    def omron_read(self, handle, degree_unit, buffer_length, pigpio_handle):
+        """
+        Same call signature as omron_src.omron_read
+        """
+        return self.read()
+
+def benchmark(frames=20000):
+    """
+    Render frames of a busy scene and return frames per second
+    """
+    import time
+    scene = Scenario(room_temp=70.0, seed=1)
+    scene.add(person(bearing=-30, distance=1.5, bearing_rate=2.0))
+    scene.add(person(bearing=10, distance=0.8))
+    scene.add(coffee_cup(bearing=5, distance=0.5))
+    scene.add(candle(bearing=40, distance=2.0))
+    sensor = SimulatedSensor(scene)
+    start = time.time()
+    position = CTR_SERVO_POSITION
+    for i in range(frames):
+        sensor.read(position)
+        position = 600 + (position + 50 - 600) % 1700
+    return frames/(time.time() - start)
+
+if __name__ == "__main__":
+    import sys
+    if "-bench" in sys.argv:
+        print('%.0f frames per second' % benchmark())
+    else:
+        SCENE = Scenario(room_temp=70.0)
+        SCENE.add(person(bearing=0, distance=1.0))
+        (BYTES_READ, TEMPS, ROOM) = SimulatedSensor(SCENE).read()
+        for ROW in range(0, 4):
+            print(' '.join(['%.1f' % TEMPS[x*4+ROW] for x in (3, 2, 1, 0)]))
+        print('Room: %.1f' % ROOM)
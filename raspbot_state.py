@@ -0,0 +1,650 @@
+"""
+# Person detection state machine for the raspbot
+# GNU GPL V3
+#
+# The detection logic is a table driven state machine. Each state has:
+#   on_enter    - run once when the state is entered
+#   on_exit     - run once when the state is left
+#   on_frame    - run on every sensor frame while in the state
+#   transitions - ordered list of (guard, target, action); the first
+#                 guard that is true fires. A target of None stays put.
+#   after       - run on every frame after the transitions
+# States are numbered and kept in a list so dispatch is a list lookup.
+#
+# All per-robot data lives in a PersonContext (a __slots__ object) and
+# the table itself is shared, so many robots can be simulated in one
+# process. Anything that touches hardware (audio, servo, LEDs, display)
+# goes through the RobotActions object held by the context; raspbot.py
+# provides one for the real robot and the base class does nothing, which
+# is what the simulator uses.
+#
+# Example:
+#     ctx = PersonContext(DetectionParams(), RobotActions())
+#     (hit_count, hit_array) = analyze_hits(temperatures, ctx.params)
+#     ctx.step(hit_count, hit_array, max(temperatures))
+#
+# With more than one person in view the hit patterns can't say where a
+# person is. Given the position of a tracked target (raspbot_tracker.py)
+# and how many people are in view, step() follows the target instead.
+
+# Feb 2015
+"""
+
+STATE_NOTHING = 0
+STATE_POSSIBLE = 1
+STATE_LIKELY = 2
+STATE_PROBABLE = 3
+STATE_DETECTED = 4
+STATE_BURN = 5
+STATE_NAMES = ('NOTHING', 'POSSIBLE', 'LIKELY', 'PROBABLE', 'DETECTED', \
+               'BURN')
+
+LOW_TO_HIGH_IS_COUNTERCLOCKWISE = 0
+LOW_TO_HIGH_IS_CLOCKWISE = 1
+
+class DetectionParams(object):
+    """
+    Detection thresholds; defaults match the constants in raspbot.py
+    """
+    __slots__ = ('person_temp_threshold', 'burn_hazard_temp', \
+                 'burn_hazard_hit', 'person_hit_count', \
+                 'probable_person_thresh', 'possible_person_max', \
+                 'servo_type', 'move_dist_close', 'move_dist_short', \
+                 'move_dist_medium', 'move_dist_far')
+
+    def __init__(self, **kwargs):
+        self.person_temp_threshold = 79     # degrees fahrenheit
+        self.burn_hazard_temp = 100         # temperature for a warning
+        self.burn_hazard_hit = 10           # hit array value for a hazard
+        self.person_hit_count = 4
+        self.probable_person_thresh = 3     # when to say hello
+        self.possible_person_max = 10       # after 10 one-hits, move head
+        self.servo_type = LOW_TO_HIGH_IS_CLOCKWISE
+        self.move_dist_close = 30
+        self.move_dist_short = 100
+        self.move_dist_medium = 170
+        self.move_dist_far = 240
+        for (name, value) in kwargs.items():
+            setattr(self, name, value)
+
+    def copy(self, **kwargs):
+        """
+        A copy of these parameters with some of them changed
+        """
+        new = DetectionParams()
+        for name in self.__slots__:
+            setattr(new, name, getattr(self, name))
+        for (name, value) in kwargs.items():
+            setattr(new, name, value)
+        return new
+
+class RobotActions(object):
+    """
+    What the state machine asks the robot to do. The base class only
+    keeps the servo bookkeeping so it can be used for simulation.
+    """
+    def log(self, message):
+        pass
+
+    def uptime(self):
+        return 0.0
+
+    def greet(self, ctx):
+        pass
+
+    def goodbye(self, ctx):
+        pass
+
+    def roam(self, ctx):
+        ctx.roam_count += 1
+
+    def move_head(self, ctx, position):
+        ctx.servo_position = position
+
+    def waiting(self, ctx):
+        pass
+
+    def burn_warning(self, ctx, max_temp):
+        pass
+
+    def attend(self, ctx, max_temp):
+        pass
+
+def analyze_hits(temperatures, params):
+    """
+    Go through each element to find person "hits"
+    returns (hit count, hit array of the four column sums)
+    max hit count is 4 per column unless there is a burn hazard
+    """
+    burn_temp = params.burn_hazard_temp
+    person_temp = params.person_temp_threshold
+    burn_hit = params.burn_hazard_hit
+    hit_count = 0
+    hit_array_temp = [0]*len(temperatures)
+    for element in range(0, len(temperatures)):
+        if temperatures[element] > burn_temp:
+            hit_array_temp[element] = burn_hit
+            hit_count += 1
+        elif temperatures[element] > person_temp:
+            hit_array_temp[element] = 1
+            hit_count += 1
+
+    # far left column is elements 12-15, far right column is 0-3
+    hit_array = [sum(hit_array_temp[12:16]), sum(hit_array_temp[8:12]), \
+                 sum(hit_array_temp[4:8]), sum(hit_array_temp[0:4])]
+    return (hit_count, hit_array)
+
+def resolve_new_position(move_cw, servo_pos, move_distance, servo_type):
+    """
+    Servo position move_distance away from servo_pos in one direction
+    """
+    if (move_cw):
+        if servo_type == LOW_TO_HIGH_IS_CLOCKWISE:
+            new_position = servo_pos + move_distance
+        else:
+            new_position = servo_pos - move_distance
+    else:
+        if servo_type == LOW_TO_HIGH_IS_CLOCKWISE:
+            new_position = servo_pos - move_distance
+        else:
+            new_position = servo_pos + move_distance
+
+    return new_position
+
+def person_position_1_hit(hit_array_1, s_position, params, log=None):
+    """
+    Detect a persons presence using "greater than one algorithm"
+    returns (TRUE if person detected, approximate person position)
+    """
+    person_det_1 = True
+    person_pos_1 = s_position
+    move_dist_1 = 0
+    move_cw_1 = True
+
+    if (hit_array_1[1] >= 1 and hit_array_1[2] >= 1):
+        # person is centered
+        move_dist_1 = 0
+    elif (hit_array_1[0] == 0 and hit_array_1[1] == 0 and \
+          hit_array_1[2] == 0 and hit_array_1[3] >= 1):
+        move_dist_1 = params.move_dist_far
+        move_cw_1 = False
+    elif (hit_array_1[0] == 0 and hit_array_1[1] == 0 and \
+          hit_array_1[2] >= 1 and hit_array_1[3] == 0):
+        move_dist_1 = params.move_dist_short
+        move_cw_1 = False
+    elif (hit_array_1[0] == 0 and hit_array_1[1] >= 1 and \
+          hit_array_1[2] == 0 and hit_array_1[3] == 0):
+        move_dist_1 = params.move_dist_short
+        move_cw_1 = True
+    elif (hit_array_1[0] >= 1 and hit_array_1[1] == 0 and \
+          hit_array_1[2] == 0 and hit_array_1[3] == 0):
+        move_dist_1 = params.move_dist_far
+        move_cw_1 = True
+    elif (hit_array_1[0] == 0 and hit_array_1[1] == 0 and \
+          hit_array_1[2] >= 1 and hit_array_1[3] >= 1):
+        move_dist_1 = params.move_dist_medium
+        move_cw_1 = False
+    elif (hit_array_1[0] >= 1 and hit_array_1[1] >= 1 and \
+          hit_array_1[2] == 0 and hit_array_1[3] == 0):
+        move_dist_1 = params.move_dist_medium
+        move_cw_1 = True
+    elif (hit_array_1[0] == 0 and hit_array_1[1] >= 1 and \
+          hit_array_1[2] >= 1 and hit_array_1[3] >= 1):
+        move_dist_1 = params.move_dist_close
+        move_cw_1 = False
+    elif (hit_array_1[0] >= 1 and hit_array_1[1] >= 1 and \
+          hit_array_1[2] >= 1 and hit_array_1[3] == 0):
+        move_dist_1 = params.move_dist_close
+        move_cw_1 = True
+    else:
+        # no person detected
+        person_det_1 = False
+
+    if (move_dist_1 > 0):
+        person_pos_1 = resolve_new_position(move_cw_1, s_position, \
+                                            move_dist_1, params.servo_type)
+
+    if log:
+        log('person_position_1: Pos: '+str(person_pos_1)+ \
+            ' Det: '+str(person_det_1))
+
+    return (person_det_1, person_pos_1)
+
+def person_position_2_hit(hit_array_2, s_position, params, log=None):
+    """
+    Detect a persons presence using the "greater than two algorithm"
+    returns (TRUE if person detected, approximate person position)
+    """
+    person_det_2 = True
+    person_pos_2 = s_position
+    move_dist_2 = 0
+    move_cw_2 = True
+
+# First, look for > two hits in a single column
+    if (hit_array_2[1] >= 2 and hit_array_2[2] >= 2):
+        # person already in center
+        move_dist_2 = 0
+    elif (hit_array_2[0] >= 2 and hit_array_2[1] <= 1 and \
+          hit_array_2[2] <= 1 and hit_array_2[3] <= 1):
+        move_dist_2 = params.move_dist_far
+        move_cw_2 = True
+# Sometimes a stationary person can show up 0200 and 0020 alternatively
+# without moving causing the robot to oscillate
+##    elif (hit_array_2[0] <= 1 and hit_array_2[1] >= 2 and \
+##          hit_array_2[2] <= 1 and hit_array_2[3] <= 1):
+##        move_dist_2 = MOVE_DIST_SHORT
+##        move_cw_2 = True
+##    elif (hit_array_2[0] <= 1 and hit_array_2[1] <= 1 and \
+##          hit_array_2[2] >= 2 and hit_array_2[3] <= 1):
+##        move_dist_2 = MOVE_DIST_SHORT
+##        move_cw_2 = False
+    elif (hit_array_2[0] <= 1 and hit_array_2[1] <= 1 and \
+          hit_array_2[2] <= 1 and hit_array_2[3] >= 2):
+        move_dist_2 = params.move_dist_far
+        move_cw_2 = False
+    elif (hit_array_2[0] >= 2 and hit_array_2[1] >= 2 and \
+          hit_array_2[2] <= 1 and hit_array_2[3] <= 1):
+        move_dist_2 = params.move_dist_close
+        move_cw_2 = True
+    elif (hit_array_2[0] <= 1 and hit_array_2[1] <= 1 and \
+          hit_array_2[2] >= 2 and hit_array_2[3] >= 2):
+        move_dist_2 = params.move_dist_close
+        move_cw_2 = False
+    else:
+        # no person detected
+        person_det_2 = False
+
+    if (move_dist_2 > 0):
+        person_pos_2 = resolve_new_position(move_cw_2, s_position, \
+                                            move_dist_2, params.servo_type)
+
+    if log:
+        log('person_position_2: Pos: '+str(person_pos_2)+ \
+            ' Det: '+str(person_det_2))
+
+    return (person_det_2, person_pos_2)
+
+class State(object):
+    """
+    One row of the state table
+    """
+    __slots__ = ('number', 'name', 'on_enter', 'on_exit', 'on_frame', \
+                 'transitions', 'after')
+
+    def __init__(self, number, transitions, on_enter=None, on_exit=None, \
+                 on_frame=None, after=None):
+        self.number = number
+        self.name = STATE_NAMES[number]
+        self.transitions = tuple(transitions)
+        self.on_enter = on_enter
+        self.on_exit = on_exit
+        self.on_frame = on_frame
+        self.after = after
+
+class StateMachine(object):
+    """
+    Table driven state machine
+    preempt transitions are checked before the current state runs;
+    an unknown state falls back to initial and runs fallback
+    """
+    def __init__(self, states, initial, preempt=(), fallback=None):
+        self.states = [None]*(max([s.number for s in states])+1)
+        for state in states:
+            self.states[state.number] = state
+        self.initial = initial
+        self.preempt = tuple(preempt)
+        self.fallback = fallback
+
+    def change(self, ctx, frame, target):
+        """
+        Move ctx to the target state running exit and entry actions
+        """
+        if target == ctx.state:
+            return
+        old = self.states[ctx.state]
+        if old.on_exit:
+            old.on_exit(ctx, frame)
+        ctx.state = target
+        new = self.states[target]
+        if new.on_enter:
+            new.on_enter(ctx, frame)
+
+    def step(self, ctx, frame):
+        """
+        Run one frame through the machine, returns the new state
+        """
+        for (guard, target, action) in self.preempt:
+            if guard(ctx, frame):
+                if action:
+                    action(ctx, frame)
+                self.change(ctx, frame, target)
+                break
+
+        number = ctx.state
+        if number < 0 or number >= len(self.states) or \
+           self.states[number] is None:
+            ctx.state = self.initial
+            if self.fallback:
+                self.fallback(ctx, frame)
+            return ctx.state
+
+        state = self.states[number]
+        if state.on_frame:
+            state.on_frame(ctx, frame)
+        for (guard, target, action) in state.transitions:
+            if guard is None or guard(ctx, frame):
+                if action:
+                    action(ctx, frame)
+                if target is not None:
+                    self.change(ctx, frame, target)
+                break
+        if state.after:
+            state.after(ctx, frame)
+        ctx.prev_state = number
+        return ctx.state
+
+class HitFrame(object):
+    """
+    One analyzed sensor frame as seen by the state machine
+    Person positions are worked out at most once per frame
+    target is the tracked person's servo position (or None) and targets
+    how many tracked people are in view
+    """
+    __slots__ = ('hit_array', 'max_temp', 'located_1', 'located_2', \
+                 'target', 'targets')
+
+    def __init__(self, hit_array, max_temp, target=None, targets=0):
+        self.reset(hit_array, max_temp, target, targets)
+
+    def reset(self, hit_array, max_temp, target=None, targets=0):
+        """
+        Reuse this object for the next frame
+        """
+        self.hit_array = hit_array
+        self.max_temp = max_temp
+        self.located_1 = None
+        self.located_2 = None
+        self.target = target
+        self.targets = targets
+
+class PersonContext(object):
+    """
+    Everything one robot's person detection needs to remember
+    """
+    __slots__ = ('params', 'robot', 'state', 'prev_state', 'hit_count', \
+                 'prev_hit_count', 'possible_person', 'probable_person', \
+                 'p_detect_count', 'no_person_count', 'roam_count', \
+                 'burn_hazard_cnt', 'servo_position', \
+                 'detected_time_stamp', 'frame')
+
+    def __init__(self, params, robot, servo_position=1500):
+        self.params = params
+        self.robot = robot
+        self.state = STATE_NOTHING
+        self.prev_state = STATE_NOTHING
+        self.hit_count = 0
+        self.prev_hit_count = 0
+        self.possible_person = 0
+        self.probable_person = 0
+        self.p_detect_count = 0
+        self.no_person_count = 0
+        self.roam_count = 0
+        self.burn_hazard_cnt = 0
+        self.servo_position = servo_position
+        self.detected_time_stamp = 0.0
+        self.frame = HitFrame(None, 0.0)    # reused by every step
+
+    def step(self, hit_count, hit_array, max_temp, target=None, targets=0):
+        """
+        Feed one analyzed frame to the person state machine
+        """
+        self.prev_hit_count = self.hit_count
+        self.hit_count = hit_count
+        self.frame.reset(hit_array, max_temp, target, targets)
+        return PERSON_MACHINE.step(self, self.frame)
+
+###########################
+# Guards
+###########################
+def _burning(ctx, frame):
+    return frame.max_temp > ctx.params.burn_hazard_temp
+
+def _no_hits(ctx, frame):
+    return ctx.hit_count == 0 or ctx.prev_hit_count == 0
+
+def _one_hit(ctx, frame):
+    return ctx.hit_count == 1 and ctx.prev_hit_count >= 1
+
+def _many_hits(ctx, frame):
+    return ctx.hit_count > ctx.params.person_hit_count
+
+def _few_hits(ctx, frame):
+    return ctx.hit_count >= 1 and \
+           ctx.hit_count <= ctx.params.person_hit_count
+
+def _tracked(ctx, frame, located):
+    """
+    The tracked target wins when several people are in view or when the
+    hit pattern matched nobody
+    """
+    if frame.target is not None and (frame.targets > 1 or not located[0]):
+        ctx.robot.log('Tracked target: Pos: '+str(int(frame.target))+ \
+                      ' of '+str(frame.targets))
+        return (True, int(round(frame.target)))
+    return located
+
+def _locate_1(ctx, frame):
+    if frame.located_1 is None:
+        frame.located_1 = _tracked(ctx, frame, \
+            person_position_1_hit(frame.hit_array, ctx.servo_position, \
+                                  ctx.params, ctx.robot.log))
+    return frame.located_1
+
+def _locate_2(ctx, frame):
+    if frame.located_2 is None:
+        frame.located_2 = _tracked(ctx, frame, \
+            person_position_2_hit(frame.hit_array, ctx.servo_position, \
+                                  ctx.params, ctx.robot.log))
+    return frame.located_2
+
+def _located_1(ctx, frame):
+    return _one_hit(ctx, frame) and _locate_1(ctx, frame)[0]
+
+def _located_2(ctx, frame):
+    return _locate_2(ctx, frame)[0]
+
+def _located_2_many(ctx, frame):
+    return _located_2(ctx, frame) and _many_hits(ctx, frame)
+
+def _ready_to_greet(ctx, frame):
+    return _located_2(ctx, frame) and \
+           ctx.probable_person+1 > ctx.params.probable_person_thresh and \
+           ctx.hit_count > 5
+
+###########################
+# Actions
+###########################
+def _roam(ctx, frame):
+    ctx.robot.roam(ctx)
+
+def _goodbye(ctx, frame):
+    ctx.robot.goodbye(ctx)
+
+def _track_1(ctx, frame):
+    ctx.robot.move_head(ctx, frame.located_1[1])
+    ctx.roam_count = 0
+
+def _track_2(ctx, frame):
+    ctx.robot.move_head(ctx, frame.located_2[1])
+    ctx.roam_count = 0
+
+def _track_probable(ctx, frame):
+    _track_2(ctx, frame)
+    ctx.probable_person += 1
+
+def _count_possible(ctx, frame):
+    ctx.possible_person += 1
+    if (ctx.possible_person > ctx.params.possible_person_max):
+        ctx.possible_person = 0
+        _track_1(ctx, frame)
+
+def _follow(ctx, frame):
+    ctx.robot.move_head(ctx, frame.located_2[1])
+
+###########################
+# Burn Hazard Detected !
+###########################
+def _burn_frame(ctx, frame):
+    robot = ctx.robot
+    params = ctx.params
+    robot.log('STATE: BURN: Burn Hazard cnt: '+str(ctx.burn_hazard_cnt)+ \
+              ' ROAM_COUNT = '+str(ctx.roam_count))
+    ctx.roam_count = 0
+    ctx.possible_person = 0
+    ctx.burn_hazard_cnt += 1
+    robot.burn_warning(ctx, frame.max_temp)
+
+    hit_array = frame.hit_array
+    burn_hit = params.burn_hazard_hit
+    move_dist = 0
+    move_cw = True
+    if (hit_array[0] > burn_hit and hit_array[1] < burn_hit and \
+        hit_array[2] < burn_hit and hit_array[3] < burn_hit):
+        move_dist = params.move_dist_short
+        move_cw = True
+    elif (hit_array[0] < burn_hit and hit_array[1] < burn_hit and \
+          hit_array[2] < burn_hit and hit_array[3] > burn_hit):
+        move_dist = params.move_dist_short
+        move_cw = False
+
+    if (move_dist > 0):
+        hazard_position = resolve_new_position(move_cw, \
+                                               ctx.servo_position, \
+                                               move_dist, params.servo_type)
+        robot.log('hazard_position: Pos: '+str(hazard_position))
+        robot.move_head(ctx, hazard_position)
+
+###########################
+# No Person Detected
+###########################
+# State 0: NOTHING - no heat source in view
+#     Event 0: No change - outcome: continue waiting for a person
+#     Event 1: One or more sensors cross the person threshold
+#
+def _nothing_frame(ctx, frame):
+    ctx.robot.log('STATE: NOTHING: No Person cnt: '+ \
+                  str(ctx.no_person_count)+' ROAM_COUNT = '+ \
+                  str(ctx.roam_count))
+    ctx.no_person_count += 1
+    ctx.p_detect_count = 0
+    ctx.possible_person = 0
+    ctx.probable_person = 0
+    ctx.burn_hazard_cnt = 0
+    ctx.robot.waiting(ctx)
+
+###########################
+# Possible Person Detected
+###########################
+# State 1: Possible person in view - one or more sensors had a hit
+#     Event 0: No hits - blip, move to State 0
+#     Event 1: One hit - move head to try to center on the hit
+#     Event 2: More than one hit - state 2
+#
+def _possible_frame(ctx, frame):
+    ctx.burn_hazard_cnt = 0
+    ctx.robot.log('STATE: POSSIBLE: Possible Person cnt: '+ \
+                  str(ctx.possible_person))
+    ctx.no_person_count += 1
+
+###########################
+# Likely Person Detected
+###########################
+# State 2: Likely person in view - more than one sensor had a hit
+#     Event 0: No hits - blip, move to State 1
+#     Event 1: One hit - noise, no change
+#     Event 2: more than one sensor still has a hit, move head, State 3
+#
+def _likely_frame(ctx, frame):
+    ctx.burn_hazard_cnt = 0
+    ctx.robot.log('STATE: LIKELY: No Person cnt: '+ \
+                  str(ctx.no_person_count))
+    ctx.possible_person = 0
+    ctx.no_person_count += 1
+
+###########################
+# Probable Person Detected
+###########################
+# State 3: Probably a person in view
+#     Event 0: No hits - noise, move to State 2
+#     Event 1: One hit - noise, move to state 2
+#     Event 2: more than one sensor has a hit, move head, say hello
+#
+def _probable_frame(ctx, frame):
+    ctx.burn_hazard_cnt = 0
+    ctx.possible_person = 0
+    ctx.robot.log('STATE: PROBABLE: Probable Person cnt: '+ \
+                  str(ctx.probable_person))
+
+###########################
+# Person Detected !
+###########################
+# State 4: Person detected
+#     Event 0: No hits - person left, say goodbye, move to state 0
+#     Event 1: One hit - person left, say goodbye, move to state 1
+#     Event 2: more than one sensor, move head to position, stay
+#
+def _detected_enter(ctx, frame):
+    robot = ctx.robot
+    robot.greet(ctx)
+    ctx.detected_time_stamp = robot.uptime()
+    robot.log('Person detected at '+str(ctx.detected_time_stamp))
+    ctx.probable_person = 0
+
+def _detected_frame(ctx, frame):
+    ctx.burn_hazard_cnt = 0
+    ctx.robot.log('STATE: DETECTED: detect cnt: '+str(ctx.p_detect_count))
+    ctx.roam_count = 0
+    ctx.no_person_count = 0
+    ctx.possible_person = 0
+    ctx.p_detect_count += 1
+    ctx.robot.attend(ctx, frame.max_temp)
+
+PERSON_MACHINE = StateMachine(
+    [State(STATE_NOTHING,
+           [(_no_hits, None, None),
+            (None, STATE_POSSIBLE, None)],
+           on_frame=_nothing_frame, after=_roam),
+     State(STATE_POSSIBLE,
+           [(_no_hits, STATE_NOTHING, None),
+            (_located_1, None, _count_possible),
+            (_one_hit, STATE_NOTHING, None),
+            (None, STATE_LIKELY, None)],
+           on_frame=_possible_frame, after=_roam),
+     State(STATE_LIKELY,
+           [(_no_hits, STATE_NOTHING, None),
+            (_located_2_many, STATE_PROBABLE, _track_2),
+            (_located_2, None, _track_2),
+            (_many_hits, STATE_PROBABLE, None),
+            (None, STATE_POSSIBLE, None)],
+           on_frame=_likely_frame),
+     State(STATE_PROBABLE,
+           [(_no_hits, STATE_LIKELY, None),
+            (_located_1, None, _track_1),
+            (_one_hit, STATE_LIKELY, None),
+            (_ready_to_greet, STATE_DETECTED, _track_2),
+            (_located_2, None, _track_probable),
+            (None, STATE_LIKELY, None)],
+           on_frame=_probable_frame),
+     State(STATE_DETECTED,
+           [(_no_hits, STATE_NOTHING, _goodbye),
+            (_few_hits, STATE_POSSIBLE, _goodbye),
+            (_located_2, None, _follow),
+            (None, STATE_LIKELY, _goodbye)],
+           on_enter=_detected_enter, on_frame=_detected_frame),
+     State(STATE_BURN,
+           [(_burning, None, None),
+            (None, STATE_NOTHING, None)],
+           on_frame=_burn_frame)],
+    STATE_NOTHING,
+    preempt=[(_burning, STATE_BURN, None)],
+    fallback=_roam)
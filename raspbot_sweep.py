@@ -0,0 +1,461 @@
+#! /usr/bin/python
+"""
+# Detection parameter sweep for the raspbot
+# GNU GPL V3
+#
+# Replays recorded sessions (raspbot_record.py) and simulated sessions
+# (raspbot_sim.py) through the person detection state machine for every
+# combination of a parameter grid, spread over a process pool with one
+# worker per core. Each frame goes through what sense() in raspbot.py
+# does with it: the panorama and search planner, the tracker, the state
+# machine and then the presence estimator (raspbot_presence.py), which
+# alone says hello and goodbye, with the same evidence from the state
+# and the tracked target as the robot. Each parameter set is scored on:
+#   latency - seconds from a person arriving to the robot saying hello
+#   missed  - visits that never got a hello
+#   false   - hellos when nobody was there
+#   flaps   - goodbyes while the person was still there
+#
+# Recorded sessions are replayed open loop: the frames are what they
+# were, so the servo position is taken from the recording. Simulated
+# sessions are closed loop: head moves (and so the PID gains) change
+# what the sensor sees next. A simulated robot roams like the real one,
+# looking where its SearchPlanner (raspbot_search.py) says and turning
+# to heat its Panorama (raspbot_panorama.py) remembers. Clips are
+# queued for the audio task (see play_sound() in raspbot.py) and take
+# no time from the loop.
+# Recordings have no ground truth, so a person is taken to be present
+# when PRESENT_PIXELS elements are TEMPMARGIN over room temperature for
+# PRESENT_FRAMES frames in a row (and gone after ABSENT_FRAMES).
+#
+# Usage:
+#   python raspbot_sweep.py [-g grid.json] [-w workers] [-n top] session...
+# where a session is a .rec file, a directory of .rec files, or
+# sim:SEED:SECONDS for a randomly scripted simulated session.
+# grid.json maps DetectionParams names (and kp, ki, kd for the PID, and
+# the PRESENCE_PARAMS names for the presence estimator) to lists of
+# values, e.g. {"person_temp_threshold": [77, 79, 81],
+#               "presence_enter": [0.5, 0.6], "min_present": [3, 5]}
+
+# Feb 2015
+"""
+import sys
+import os
+import getopt
+import json
+import random
+import itertools
+import multiprocessing
+
+from pid import PID
+from raspbot_state import PersonContext, DetectionParams, RobotActions, \
+                          analyze_hits, resolve_new_position, \
+                          LOW_TO_HIGH_IS_CLOCKWISE
+from raspbot_record import read_frames, RECORD_SUFFIX
+from raspbot_tracker import Tracker
+from raspbot_search import SearchPlanner
+from raspbot_panorama import Panorama
+from raspbot_presence import PresenceEstimator, frame_evidence, HELLO, \
+                             GOODBYE
+import raspbot_sim
+
+FRAME_PERIOD = 0.3          # MEASUREMENT_WAIT_PERIOD in raspbot.py
+SETTLE_PERIOD = 0.3         # MEASUREMENT_WAIT_PERIOD*SETTLE_TIME
+MINIMUM_ERROR_GRANULARITY = 20
+MINIMUM_SERVO_GRANULARITY = 10
+ROAMING_GRANULARTY = 50
+ROAM_MAX = 600
+TEMPMARGIN = 5
+PRESENT_PIXELS = 2
+PRESENT_FRAMES = 3
+ABSENT_FRAMES = 10
+MIN_VISIT = 5.0             # seconds; shorter visits can't be missed
+SLACK = 1.0                 # seconds of slop around a visit
+MISS_COST = 30.0            # score cost of a missed visit (seconds)
+FALSE_COST = 10.0
+FLAP_COST = 10.0
+SENSOR_VIEW = 44.2          # degrees the D6T-44L sees across
+SENSOR_WIDTH = int(SENSOR_VIEW/raspbot_sim.DEGREES_PER_US)   # in servo us
+WARM_MEMORY = 10.0          # seconds heat seen elsewhere is looked for
+# grid names of the PresenceEstimator settings
+PRESENCE_PARAMS = {'presence_enter': 'enter', 'presence_exit': 'exit', \
+                   'presence_rise': 'rise', 'presence_fall': 'fall', \
+                   'min_present': 'min_present', 'min_absent': 'min_absent', \
+                   'greet_cooldown': 'cooldown'}
+
+DEFAULT_GRID = {
+    'person_temp_threshold': [77, 79, 81],
+    'person_hit_count': [3, 4, 5],
+    'probable_person_thresh': [2, 3, 4],
+    'possible_person_max': [5, 10],
+    'kp': [0.5, 1.0],
+    'presence_enter': [0.5, 0.6, 0.7],
+}
+DEFAULT_GAINS = {'kp': 1.0, 'ki': 0.1, 'kd': 0.0}
+
+def clamp_servo(position):
+    """
+    Same bounds and 10us rounding as set_servo_to_position
+    """
+    position = min(max(position, 600), 2300)
+    return int((position+MINIMUM_SERVO_GRANULARITY//2)// \
+               MINIMUM_SERVO_GRANULARITY)*MINIMUM_SERVO_GRANULARITY
+
+class SimRobot(RobotActions):
+    """
+    A robot with no hardware; keeps a clock and an event list
+    """
+    def __init__(self, gains, sensor=None, roam=True, \
+                 servo_type=LOW_TO_HIGH_IS_CLOCKWISE):
+        self.pid = PID(gains['kp'], gains['ki'], gains['kd'])
+        self.sensor = sensor
+        self.roaming = roam
+        self.clock = 0.0
+        self.events = []        # (time, HELLO or GOODBYE)
+        self.search = SearchPlanner(600, 2300, ROAMING_GRANULARTY, \
+                                    SENSOR_WIDTH)
+        self.panorama = Panorama(600, 2300, ROAMING_GRANULARTY, \
+                                 SENSOR_WIDTH, \
+                                 servo_type != LOW_TO_HIGH_IS_CLOCKWISE)
+
+    def uptime(self):
+        return self.clock
+
+    def _busy(self, seconds):
+        if self.sensor is not None:
+            self.sensor.time += seconds
+            self.clock = self.sensor.time
+
+    def say_hello(self):
+        self.events.append((self.clock, HELLO))
+
+    def say_goodbye(self):
+        self.events.append((self.clock, GOODBYE))
+
+    def attend(self, ctx, max_temp):
+        self.search.detected(ctx.servo_position, self.clock)
+
+    def move_head(self, ctx, position):
+        servo_pos = ctx.servo_position
+        self.pid.setPoint(position)
+        pid_error = self.pid.update(servo_pos)
+        if abs(pid_error) > MINIMUM_ERROR_GRANULARITY:
+            if ctx.params.servo_type == LOW_TO_HIGH_IS_CLOCKWISE:
+                servo_pos += pid_error
+            else:
+                servo_pos -= pid_error
+        ctx.servo_position = clamp_servo(servo_pos)
+        self._busy(SETTLE_PERIOD)
+
+    def roam(self, ctx):
+        if not self.roaming:
+            ctx.roam_count += 1
+            return
+# the same choices as Robot.roam() and servo_roam() in raspbot.py
+        warm = self.panorama.warmest(ctx.params.person_temp_threshold, \
+                                     WARM_MEMORY, self.clock)
+        if warm is not None and \
+           abs(warm[0] - ctx.servo_position) > \
+           SENSOR_VIEW/raspbot_sim.DEGREES_PER_US/2:
+            ctx.servo_position = clamp_servo(warm[0])
+            ctx.roam_count = 0
+            self._busy(SETTLE_PERIOD)
+            return
+        ctx.roam_count += 1
+        if ctx.roam_count <= ROAM_MAX:
+            ctx.servo_position = clamp_servo( \
+                self.search.next_position(ctx.servo_position, self.clock))
+        else:
+            ctx.servo_position = 1500
+            if ctx.roam_count >= ROAM_MAX*20:
+                ctx.roam_count = 0
+
+def label_presence(frames):
+    """
+    Best guess at when someone was in view of a recording
+    returns a list of (start, end) times
+    """
+    visits = []
+    start = None
+    warm = 0
+    cold = 0
+    last = 0.0
+    for (timestamp, servo, room, temps) in frames:
+        last = timestamp
+        threshold = room + TEMPMARGIN
+        if len([t for t in temps if t > threshold]) >= PRESENT_PIXELS:
+            warm += 1
+            cold = 0
+            if start is None and warm >= PRESENT_FRAMES:
+                start = timestamp - (PRESENT_FRAMES-1)*FRAME_PERIOD
+        else:
+            warm = 0
+            cold += 1
+            if start is not None and cold >= ABSENT_FRAMES:
+                visits.append((start, timestamp - \
+                               (ABSENT_FRAMES-1)*FRAME_PERIOD))
+                start = None
+    if start is not None:
+        visits.append((start, last))
+    return visits
+
+def simulated_session(seed, seconds):
+    """
+    A randomly scripted scene: visitors, passers by and the odd coffee
+    returns (scenario, list of (start, end) visits)
+    """
+    rnd = random.Random(seed)
+    scene = raspbot_sim.Scenario(room_temp=rnd.uniform(66.0, 74.0), \
+                                 seed=seed)
+    visits = []
+    t = rnd.uniform(5.0, 30.0)
+    while t < seconds:
+        if rnd.random() < 0.2:
+            # someone walking past
+            stay = rnd.uniform(3.0, 8.0)
+            rate = rnd.choice((-1, 1))*rnd.uniform(8.0, 15.0)
+            scene.add(raspbot_sim.person(-rate*stay/2 - rate*t, \
+                                         rnd.uniform(0.8, 2.0), \
+                                         bearing_rate=rate), \
+                      start=t, stop=t+stay)
+        else:
+            stay = rnd.uniform(20.0, 300.0)
+            scene.add(raspbot_sim.person(rnd.uniform(-60.0, 60.0), \
+                                         rnd.uniform(0.4, 1.2)), \
+                      start=t, stop=t+stay)
+            if rnd.random() < 0.2:
+                scene.add(raspbot_sim.coffee_cup(rnd.uniform(-60.0, 60.0), \
+                                                 rnd.uniform(0.3, 1.0)), \
+                          start=t, stop=t+stay)
+        visits.append((t, t+stay))
+        t += stay + rnd.uniform(10.0, 120.0)
+    return (scene, visits)
+
+def score_events(events, visits):
+    """
+    Score hello/goodbye events against visits
+    """
+    stats = {'visits': 0, 'greeted': 0, 'latency': 0.0, 'missed': 0, \
+             'false': 0, 'flaps': 0, 'hellos': 0, 'goodbyes': 0}
+    greeted = [False]*len(visits)
+    for (t, event) in events:
+        inside = [i for i in range(len(visits)) \
+                  if visits[i][0]-SLACK <= t <= visits[i][1]+SLACK]
+        if event == HELLO:
+            stats['hellos'] += 1
+            if not inside:
+                stats['false'] += 1
+            for i in inside:
+                if not greeted[i]:
+                    greeted[i] = True
+                    stats['greeted'] += 1
+                    stats['latency'] += max(0.0, t - visits[i][0])
+                    break
+        else:
+            stats['goodbyes'] += 1
+            for i in inside:
+                if t < visits[i][1] - 3*SLACK:
+                    stats['flaps'] += 1
+                    break
+    for i in range(len(visits)):
+        if visits[i][1] - visits[i][0] >= MIN_VISIT:
+            stats['visits'] += 1
+            if not greeted[i]:
+                stats['missed'] += 1
+    return stats
+
+_SESSION_CACHE = {}
+
+def load_session(spec):
+    """
+    Frames and visits of a recorded session, cached per worker process
+    """
+    if spec not in _SESSION_CACHE:
+        frames = list(read_frames(spec))
+        _SESSION_CACHE[spec] = (frames, label_presence(frames))
+    return _SESSION_CACHE[spec]
+
+def split_params(param_set):
+    """
+    (DetectionParams, PID gains, PresenceEstimator arguments) from a
+    flat parameter dictionary
+    """
+    gains = dict(DEFAULT_GAINS)
+    detection = {}
+    presence = {}
+    for (name, value) in param_set.items():
+        if name in gains:
+            gains[name] = value
+        elif name in PRESENCE_PARAMS:
+            presence[PRESENCE_PARAMS[name]] = value
+        else:
+            detection[name] = value
+    return (DetectionParams(**detection), gains, presence)
+
+def make_tracker(params):
+    """
+    A Tracker with the same column offsets as the robot's
+    """
+    column_width = SENSOR_VIEW/raspbot_sim.DEGREES_PER_US/4
+# element column 0 is the far right (counterclockwise) one
+    return Tracker([resolve_new_position(True, 0, column_width*n, \
+                                         params.servo_type) \
+                    for n in (-1.5, -0.5, 0.5, 1.5)], \
+                   params.person_temp_threshold)
+
+def sense_frame(ctx, tracker, presence, temps):
+    """
+    What sense() and greet_or_goodbye() in raspbot.py do with a frame
+    """
+    robot = ctx.robot
+    (hit_count, hit_array) = analyze_hits(temps, ctx.params)
+    robot.panorama.stitch(ctx.servo_position, temps, robot.clock)
+    if ctx.params.servo_type == LOW_TO_HIGH_IS_CLOCKWISE:
+        robot.search.observe(ctx.servo_position, hit_array[::-1], \
+                             robot.clock)
+    else:
+        robot.search.observe(ctx.servo_position, hit_array, robot.clock)
+    tracker.update(temps, ctx.servo_position, robot.clock)
+    target = tracker.primary()
+    target_position = None
+    track_id = None
+    if target is not None:
+        track_id = target.id
+        if target.misses == 0:
+            target_position = target.position
+    ctx.step(hit_count, hit_array, max(temps), target_position, \
+             len(tracker.visible()))
+    event = presence.update(frame_evidence(ctx.state, target), track_id, \
+                            robot.clock)
+    if event == HELLO:
+        robot.say_hello()
+    elif event == GOODBYE:
+        robot.say_goodbye()
+
+def run_session(param_set, spec):
+    """
+    Replay one session with one parameter set, returns score stats
+    """
+    (params, gains, presence_args) = split_params(param_set)
+    tracker = make_tracker(params)
+    presence = PresenceEstimator(**presence_args)
+    if spec.startswith('sim:'):
+        fields = spec.split(':')
+        seed = int(fields[1])
+        seconds = float(fields[2]) if len(fields) > 2 else 3600.0
+        (scene, visits) = simulated_session(seed, seconds)
+        sensor = raspbot_sim.SimulatedSensor(scene, FRAME_PERIOD, \
+                                             servo_type=params.servo_type)
+        robot = SimRobot(gains, sensor, servo_type=params.servo_type)
+        ctx = PersonContext(params, robot)
+        while sensor.time < seconds:
+            robot.clock = sensor.time
+            (bytes_read, temps, room) = sensor.read(ctx.servo_position)
+            sense_frame(ctx, tracker, presence, temps)
+    else:
+        (frames, visits) = load_session(spec)
+        robot = SimRobot(gains, roam=False, servo_type=params.servo_type)
+        ctx = PersonContext(params, robot)
+        for (timestamp, servo, room, temps) in frames:
+            robot.clock = timestamp
+            if servo:
+                ctx.servo_position = servo
+            sense_frame(ctx, tracker, presence, temps)
+    return score_events(robot.events, visits)
+
+def evaluate(job):
+    """
+    Pool worker: job is (parameter set index, parameter set, session)
+    """
+    (index, param_set, spec) = job
+    return (index, run_session(param_set, spec))
+
+def expand_grid(grid):
+    """
+    Every combination of a {name: [values]} grid as a list of dicts
+    """
+    names = sorted(grid.keys())
+    return [dict(zip(names, values)) \
+            for values in itertools.product(*[grid[n] for n in names])]
+
+def cost(stats):
+    """
+    Lower is better: average seconds to hello plus penalties per visit
+    """
+    visits = max(stats['visits'], 1)
+    return (stats['latency'] + MISS_COST*stats['missed'] + \
+            FALSE_COST*stats['false'] + FLAP_COST*stats['flaps'])/visits
+
+def sweep(grid, sessions, workers=None):
+    """
+    Score every parameter set on every session
+    returns a list of (cost, parameter set, totals) best first
+    """
+    param_sets = expand_grid(grid)
+    jobs = [(i, param_sets[i], spec) for i in range(len(param_sets)) \
+            for spec in sessions]
+    totals = [None]*len(param_sets)
+    if workers == 1:
+        results = map(evaluate, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers)
+        chunk = max(1, len(jobs)//(4*(workers or \
+                                      multiprocessing.cpu_count())))
+        results = pool.imap_unordered(evaluate, jobs, chunk)
+    for (index, stats) in results:
+        if totals[index] is None:
+            totals[index] = stats
+        else:
+            for name in stats:
+                totals[index][name] += stats[name]
+    if pool is not None:
+        pool.close()
+        pool.join()
+    ranked = [(cost(totals[i]), param_sets[i], totals[i]) \
+              for i in range(len(param_sets))]
+    ranked.sort(key=lambda r: r[0])
+    return ranked
+
+def find_sessions(args):
+    """
+    Expand directories into the .rec files in them
+    """
+    sessions = []
+    for arg in args:
+        if os.path.isdir(arg):
+            sessions.extend(sorted([os.path.join(arg, f) \
+                                    for f in os.listdir(arg) \
+                                    if f.endswith(RECORD_SUFFIX)]))
+        else:
+            sessions.append(arg)
+    return sessions
+
+def main(argv):
+    (opts, args) = getopt.getopt(argv, 'g:w:n:')
+    grid = DEFAULT_GRID
+    workers = None
+    top = 10
+    for (opt, value) in opts:
+        if opt == '-g':
+            grid = json.load(open(value))
+        elif opt == '-w':
+            workers = int(value)
+        elif opt == '-n':
+            top = int(value)
+    sessions = find_sessions(args)
+    if not sessions:
+        print('usage: raspbot_sweep.py [-g grid.json] [-w workers] '+ \
+              '[-n top] session...')
+        return 1
+    ranked = sweep(grid, sessions, workers)
+    for (score, param_set, stats) in ranked[:top]:
+        greeted = max(stats['greeted'], 1)
+        print('%7.2f  latency %5.1fs  missed %3d  false %3d  flaps %3d  %s' \
+              % (score, stats['latency']/greeted, stats['missed'], \
+                 stats['false'], stats['flaps'], json.dumps(param_set, \
+                                                            sort_keys=True)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,100 @@
+"""
+# CPU thermal governor for the raspbot
+# GNU GPL V3
+#
+# Robots in enclosures overheat in summer. All the robot used to do
+# about it was play a warning clip every loop, which only added load
+# (and the clips past 105F were never reached). The governor sheds load
+# in steps instead as the CPU gets hotter:
+#     warm    105F  nothing yet (a clip, if CPU_105_ON)
+#     render  110F  the IR window is drawn every other frame
+#     sample  115F  and the sensor is read half as often
+#     quiet   120F  and the per frame log messages are left out
+#     roam    125F  and the head roams a quarter as often
+# A level is left only when the CPU is HYSTERESIS degrees below it, so
+# the robot doesn't flip between two levels.
+#
+# CPUThermometer keeps the thermal zone file open and reads it from the
+# start each time rather than opening and parsing it on every check.
+#     thermometer = CPUThermometer()
+#     governor = ThermalGovernor()
+#     if governor.update(thermometer.read()):
+#         print(governor.level.name)
+
+# Feb 2015
+"""
+import os
+
+THERMAL_ZONE = '/sys/class/thermal/thermal_zone0/temp'
+HYSTERESIS = 2.0            # degrees F
+
+class ThermalLevel(object):
+    """
+    How much load to shed from temp (degrees F) up
+    """
+    __slots__ = ('name', 'temp', 'render_every', 'sense_scale', 'quiet', \
+                 'roam_every')
+
+    def __init__(self, name, temp, render_every=1, sense_scale=1, \
+                 quiet=False, roam_every=1):
+        self.name = name
+        self.temp = temp
+        self.render_every = render_every    # draw every nth frame
+        self.sense_scale = sense_scale      # times the measurement period
+        self.quiet = quiet                  # leave out per frame messages
+        self.roam_every = roam_every        # roam on every nth idle frame
+
+THERMAL_LEVELS = [
+    ThermalLevel('normal', None),
+    ThermalLevel('warm', 105.0),
+    ThermalLevel('render', 110.0, render_every=2),
+    ThermalLevel('sample', 115.0, render_every=2, sense_scale=2),
+    ThermalLevel('quiet', 120.0, render_every=2, sense_scale=2, quiet=True),
+    ThermalLevel('roam', 125.0, render_every=2, sense_scale=2, quiet=True, \
+                 roam_every=4)]
+
+class CPUThermometer(object):
+    """
+    Reads the CPU temperature in degrees F from a thermal zone file
+    """
+    def __init__(self, path=THERMAL_ZONE):
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        if hasattr(os, 'pread'):
+            data = os.pread(self.fd, 16, 0)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            data = os.read(self.fd, 16)
+        return 9.0*(int(data)/1000.0)/5.0 + 32
+
+    def close(self):
+        os.close(self.fd)
+
+class ThermalGovernor(object):
+    """
+    Picks the thermal level for the CPU temperature
+    """
+    def __init__(self, levels=THERMAL_LEVELS, hysteresis=HYSTERESIS):
+        self.levels = levels
+        self.hysteresis = hysteresis
+        self.index = 0
+        self.level = levels[0]
+        self.temp = None
+
+    def update(self, temp):
+        """
+        Move to the level for temp; True if the level changed
+        """
+        self.temp = temp
+        index = self.index
+        while index+1 < len(self.levels) and \
+              temp >= self.levels[index+1].temp:
+            index += 1
+        while index > 0 and temp < self.levels[index].temp - self.hysteresis:
+            index -= 1
+        if index == self.index:
+            return False
+        self.index = index
+        self.level = self.levels[index]
+        return True
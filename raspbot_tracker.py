@@ -0,0 +1,188 @@
+"""
+# Multi person tracker for the raspbot
+# GNU GPL V3
+#
+# The hit patterns in raspbot_state.py assume one heat source. Two
+# people in view make patterns like 1001 that match none of them, the
+# robot decides nobody is there, says goodbye and then hello again.
+#
+# Tracker finds the blobs of warm elements in each frame (elements over
+# the person threshold that touch up, down, left or right), places each
+# at a servo position from its column and the head position, and
+# matches them to the tracks of the frames before: nearest pairs first,
+# no further apart than GATE. A blob nothing matches starts a new track,
+# a track nothing matches for MAX_MISSES frames is dropped. With at most
+# a handful of blobs greedy nearest pairs gives the same answer as an
+# optimal assignment and costs next to nothing, even on a Pi Zero.
+#
+# One track is the primary target, the one the head follows. It stays
+# primary while it is tracked; when it is lost the longest tracked
+# person in view takes over.
+#     tracker = Tracker(offsets)
+#     tracker.update(temperatures, servo_position, time.time())
+#     target = tracker.primary()
+#     if target is not None and target.misses == 0:
+#         move_head(target.position)
+#
+# offsets are the servo travel from the head position to each sensor
+# column, column 0 (the far right) first. Elements are numbered x*4 + y
+# with x the column and y the row.
+
+# Feb 2015
+"""
+ROWS = 4
+COLUMNS = 4
+GATE = 150                  # furthest a person moves between frames (us)
+MAX_MISSES = 3              # frames a track lives on without a blob
+CONFIRM = 2                 # frames a track needs to be a target
+SMOOTHING = 0.5             # weight of a new blob in a track's position
+
+class Blob(object):
+    """
+    A group of touching warm elements in one frame
+    """
+    __slots__ = ('column', 'size', 'peak', 'position')
+
+    def __init__(self, column, size, peak):
+        self.column = column        # warmth weighted column, 0.0 to 3.0
+        self.size = size
+        self.peak = peak
+        self.position = None
+
+class Track(object):
+    """
+    One person followed from frame to frame
+    """
+    __slots__ = ('id', 'position', 'size', 'peak', 'hits', 'misses', \
+                 'first_seen', 'last_seen')
+
+    def __init__(self, number, blob, now):
+        self.id = number
+        self.position = blob.position
+        self.size = blob.size
+        self.peak = blob.peak
+        self.hits = 1
+        self.misses = 0
+        self.first_seen = now
+        self.last_seen = now
+
+    def update(self, blob, now):
+        self.position += SMOOTHING*(blob.position - self.position)
+        self.size = blob.size
+        self.peak = blob.peak
+        self.hits += 1
+        self.misses = 0
+        self.last_seen = now
+
+def find_blobs(temperatures, threshold):
+    """
+    Blobs of touching elements warmer than threshold
+    """
+    seen = [False]*(ROWS*COLUMNS)
+    blobs = []
+    for start in range(ROWS*COLUMNS):
+        if seen[start] or temperatures[start] <= threshold:
+            continue
+        seen[start] = True
+        stack = [start]
+        weight = 0.0
+        column_sum = 0.0
+        size = 0
+        peak = temperatures[start]
+        while stack:
+            element = stack.pop()
+            temp = temperatures[element]
+            excess = temp - threshold
+            weight += excess
+            column_sum += excess*(element//ROWS)
+            size += 1
+            peak = max(peak, temp)
+            (x, y) = divmod(element, ROWS)
+            for (nx, ny) in ((x-1, y), (x+1, y), (x, y-1), (x, y+1)):
+                if 0 <= nx < COLUMNS and 0 <= ny < ROWS:
+                    near = nx*ROWS + ny
+                    if not seen[near] and temperatures[near] > threshold:
+                        seen[near] = True
+                        stack.append(near)
+        blobs.append(Blob(column_sum/weight, size, peak))
+    return blobs
+
+class Tracker(object):
+    """
+    Follows every person in view and picks the one to look at
+    """
+    def __init__(self, offsets, threshold=79.0, gate=GATE, \
+                 max_misses=MAX_MISSES, confirm=CONFIRM):
+        self.offsets = offsets
+        self.threshold = threshold
+        self.gate = gate
+        self.max_misses = max_misses
+        self.confirm = confirm
+        self.tracks = []
+        self.next_id = 1
+        self.target = None
+
+    def column_offset(self, column):
+        """
+        Servo travel to a (fractional) column, between the column offsets
+        """
+        left = min(int(column), COLUMNS-2)
+        fraction = column - left
+        return self.offsets[left] + \
+               fraction*(self.offsets[left+1] - self.offsets[left])
+
+    def update(self, temperatures, position, now):
+        """
+        Add a frame taken with the head at position; returns the blobs
+        """
+        blobs = find_blobs(temperatures, self.threshold)
+        for blob in blobs:
+            blob.position = position + self.column_offset(blob.column)
+
+        pairs = []
+        for track in self.tracks:
+            for blob in blobs:
+                distance = abs(track.position - blob.position)
+                if distance <= self.gate:
+                    pairs.append((distance, track.id, track, blob))
+        pairs.sort(key=lambda pair: (pair[0], pair[1]))
+        matched_tracks = set()
+        matched_blobs = set()
+        for (distance, number, track, blob) in pairs:
+            if number in matched_tracks or id(blob) in matched_blobs:
+                continue
+            track.update(blob, now)
+            matched_tracks.add(number)
+            matched_blobs.add(id(blob))
+
+        for track in self.tracks:
+            if track.id not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks \
+                       if track.misses <= self.max_misses]
+        for blob in blobs:
+            if id(blob) not in matched_blobs:
+                self.tracks.append(Track(self.next_id, blob, now))
+                self.next_id += 1
+        return blobs
+
+    def visible(self):
+        """
+        Confirmed tracks seen in the last frame
+        """
+        return [track for track in self.tracks \
+                if track.misses == 0 and track.hits >= self.confirm]
+
+    def primary(self):
+        """
+        The track the head should follow, or None
+        """
+        if self.target is not None and self.target in self.tracks:
+            return self.target
+        candidates = self.visible()
+        if not candidates:
+            self.target = None
+            return None
+        self.target = max(candidates, key=lambda track: (track.hits, \
+                                                         -track.id))
+        return self.target
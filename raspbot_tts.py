@@ -0,0 +1,517 @@
+#! /usr/bin/python
+"""
+# Text to speech for the raspbot
+# GNU GPL V3
+#
+# Spoken phrases are made once by a speech backend and kept in a cache
+# directory. The file name is the SHA-1 of the backend, voice and phrase,
+# so the same phrase is always the same file and different phrases never
+# overwrite each other. When the cache grows over its size cap the least
+# recently played clips are removed first (playing a clip touches its
+# mtime).
+#
+# Backends:
+#   google - downloads MP3s from the Google Translate TTS URL through a
+#            small pool of reusable pycurl handles; needs the Internet
+#   espeak - synthesizes WAVs locally with espeak; works offline
+# A background thread makes phrases handed to prefetch(); nothing in the
+# robot's loop waits for the network or the synthesizer:
+#     cache = PhraseCache('/home/pi/projects_ggg/raspbot/tts', \
+#                         backend=make_backend('espeak'))
+#     cache.prefetch(['Hello', 'The temperature is'])
+#     ...
+#     path = cache.get('Hello')     # None until it has been made
+#
+# Phrases with a number in them ("The temperature is 101 degrees") are
+# not synthesized per call. The words around the number and the number
+# words (one, twenty, hundred...) are cached as fragments, and compose()
+# joins their audio in memory into one WAV. This only works with WAV
+# backends; with MP3s compose() returns None.
+#
+# Pre-synthesize a phrase bank (one phrase per line, %d for a number)
+# and all the number words at install time with:
+#   python raspbot_tts.py [-d cache_dir] [-b espeak] phrases.txt
+
+# Feb 2015
+"""
+import sys
+import os
+import getopt
+import hashlib
+import subprocess
+import threading
+import wave
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from raspbot_functions import getGoogleSpeechURL
+
+PART_SUFFIX = '.part'
+CLIP_SUFFIXES = ('.mp3', '.wav')
+CACHE_DIR = '/home/pi/projects_ggg/raspbot/tts'
+CACHE_BYTES = 20*1024*1024  # about 2000 short phrases
+POOL_SIZE = 2               # pycurl handles kept open
+DOWNLOAD_TIMEOUT = 10       # seconds
+SILENCE_LEVEL = 500         # 16 bit samples quieter than this are silence
+FRAGMENT_GAP = 0.06         # seconds of silence between joined fragments
+
+ONES = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', \
+        'eight', 'nine', 'ten', 'eleven', 'twelve', 'thirteen', \
+        'fourteen', 'fifteen', 'sixteen', 'seventeen', 'eighteen', \
+        'nineteen']
+TENS = ['', '', 'twenty', 'thirty', 'forty', 'fifty', 'sixty', \
+        'seventy', 'eighty', 'ninety']
+NUMBER_WORDS = ONES+TENS[2:]+['hundred', 'thousand', 'minus']
+
+def phrase_key(phrase, voice='en'):
+    """
+    Cache key of a phrase; whitespace and case don't change the key
+    """
+    text = voice+'\n'+' '.join(phrase.lower().split())
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def number_words(number):
+    """
+    Words for a whole number, e.g. 101 -> ['one', 'hundred', 'one']
+    """
+    number = int(number)
+    if number < 0:
+        return ['minus']+number_words(-number)
+    if number >= 1000:
+        words = number_words(number // 1000)+['thousand']
+        if number % 1000:
+            words += number_words(number % 1000)
+        return words
+    words = []
+    if number >= 100:
+        words += [ONES[number // 100], 'hundred']
+        number %= 100
+        if not number:
+            return words
+    if number >= 20:
+        words.append(TENS[number // 10])
+        if number % 10:
+            words.append(ONES[number % 10])
+    else:
+        words.append(ONES[number])
+    return words
+
+def phrase_parts(template, number):
+    """
+    Fragments of a phrase with one number in it
+    phrase_parts('It is %d degrees', 21) -> ['It is', 'twenty', 'one',
+    'degrees']
+    """
+    (before, after) = template.split('%d', 1)
+    parts = [before.strip()] if before.strip() else []
+    parts += number_words(number)
+    if after.strip():
+        parts.append(after.strip())
+    return parts
+
+def template_fragments(template):
+    """
+    Fragments to cache so any number can be said with a template
+    """
+    return [part.strip() for part in template.split('%d', 1) \
+            if part.strip()]+NUMBER_WORDS
+
+class CurlPool(object):
+    """
+    A few pycurl handles shared by the threads that download
+    """
+    def __init__(self, size=POOL_SIZE, timeout=DOWNLOAD_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.handles = queue.Queue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        An idle handle, a new one if the pool isn't full, otherwise wait
+        """
+        try:
+            return self.handles.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                import pycurl
+                return pycurl.Curl()
+        return self.handles.get()
+
+    def release(self, curl):
+        self.handles.put(curl)
+
+    def download(self, url, path):
+        """
+        Fetch url into path; raises IOError if the download failed
+        """
+        try:
+            import pycurl
+        except ImportError:
+            raise IOError('download failed: pycurl is not installed')
+        curl = self.acquire()
+        try:
+            fp = open(path, 'wb')
+            try:
+                curl.setopt(pycurl.URL, url)
+                curl.setopt(pycurl.WRITEDATA, fp)
+                curl.setopt(pycurl.FOLLOWLOCATION, 1)
+                curl.setopt(pycurl.TIMEOUT, self.timeout)
+                curl.perform()
+                status = curl.getinfo(pycurl.RESPONSE_CODE)
+            finally:
+                fp.close()
+        except pycurl.error as error:
+            raise IOError('download failed: '+str(error))
+        finally:
+            self.release(curl)
+        if status != 200:
+            raise IOError('download failed: HTTP '+str(status))
+
+    def close(self):
+        while True:
+            try:
+                self.handles.get_nowait().close()
+            except queue.Empty:
+                return
+
+class SpeechBackend(object):
+    """
+    Makes a sound clip of a phrase
+    offline is True if the backend doesn't need the Internet
+    """
+    name = 'none'
+    suffix = '.wav'
+    offline = True
+
+    def __init__(self, voice='en'):
+        self.voice = voice
+
+    def synthesize(self, phrase, path):
+        """
+        Write a clip of the phrase to path; raises IOError on failure
+        """
+        raise IOError('no speech backend')
+
+    def close(self):
+        pass
+
+class GoogleBackend(SpeechBackend):
+    """
+    MP3s from the Google Translate TTS URL
+    """
+    name = 'google'
+    suffix = '.mp3'
+    offline = False
+
+    def __init__(self, voice='en', url_for=getGoogleSpeechURL, pool=None):
+        SpeechBackend.__init__(self, voice)
+        self.url_for = url_for
+        self.pool = pool or CurlPool()
+
+    def synthesize(self, phrase, path):
+        self.pool.download(self.url_for(phrase), path)
+
+    def close(self):
+        self.pool.close()
+
+class EspeakBackend(SpeechBackend):
+    """
+    WAVs from the espeak synthesizer (sudo apt-get install espeak)
+    """
+    name = 'espeak'
+
+    def __init__(self, voice='en', speed=150, command='espeak'):
+        SpeechBackend.__init__(self, voice)
+        self.speed = speed
+        self.command = command
+
+    def synthesize(self, phrase, path):
+        try:
+            result = subprocess.call([self.command, '-v', self.voice, \
+                                      '-s', str(self.speed), '-w', path, \
+                                      phrase])
+        except OSError as error:
+            raise IOError(self.command+' failed: '+str(error))
+        if result != 0 or not os.path.exists(path):
+            raise IOError(self.command+' failed: exit status '+str(result))
+
+BACKENDS = {'google': GoogleBackend, 'espeak': EspeakBackend}
+
+def make_backend(name, voice='en'):
+    """
+    A speech backend by name (see BACKENDS)
+    """
+    return BACKENDS[name](voice)
+
+def _trim_silence(params, frames):
+    """
+    frames without the leading and trailing silence (16 bit audio only)
+    """
+    (channels, width, rate) = params
+    if width != 2:
+        return frames
+    step = channels*width
+    samples = bytearray(frames)
+
+    def loud(i):
+        sample = samples[i] | (samples[i+1] << 8)
+        if sample >= 0x8000:
+            sample -= 0x10000
+        return abs(sample) >= SILENCE_LEVEL
+
+    start = 0
+    while start < len(samples) and not loud(start):
+        start += step
+    end = len(samples) - step
+    while end > start and not loud(end):
+        end -= step
+    return frames[start:end+step]
+
+class PhraseCache(object):
+    """
+    Spoken phrases on disk, made on demand or in the background
+    """
+    def __init__(self, directory, max_bytes=CACHE_BYTES, backend=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backend = backend or GoogleBackend()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.requests = queue.Queue()
+        self.worker = None
+        self.fragments = {}         # phrase -> (params, frames) in memory
+        self.fetched = 0
+        self.failed = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path_for(self, phrase, suffix=None):
+        key = phrase_key(phrase, self.backend.name+'/'+self.backend.voice)
+        return os.path.join(self.directory, \
+                            key+(suffix or self.backend.suffix))
+
+    def get(self, phrase):
+        """
+        Path of the cached clip for a phrase, or None if not cached
+        """
+        path = self.path_for(phrase)
+        try:
+            os.utime(path, None)    # most recently used
+        except OSError:
+            return None
+        return path
+
+    def fetch(self, phrase):
+        """
+        Path of the clip for a phrase, making it if needed
+        raises IOError if it isn't cached and can't be made
+        """
+        path = self.get(phrase)
+        if path is not None:
+            return path
+        path = self.path_for(phrase)
+        part_path = '%s.%d%s' % (path, threading.current_thread().ident, \
+                                 PART_SUFFIX)
+        try:
+            self.backend.synthesize(phrase, part_path)
+            os.rename(part_path, path)
+        except (IOError, OSError):
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        self.fetched += 1
+        self.evict()
+        return path
+
+    def fragment(self, phrase):
+        """
+        (params, frames) of a cached WAV clip, kept in memory
+        None if the clip isn't cached or isn't a WAV
+        """
+        if phrase in self.fragments:
+            return self.fragments[phrase]
+        if self.backend.suffix != '.wav':
+            return None
+        path = self.get(phrase)
+        if path is None:
+            return None
+        try:
+            clip = wave.open(path, 'rb')
+            try:
+                params = clip.getparams()[:3]
+                frames = clip.readframes(clip.getnframes())
+            finally:
+                clip.close()
+        except (IOError, EOFError, wave.Error):
+            return None
+        self.fragments[phrase] = (params, _trim_silence(params, frames))
+        return self.fragments[phrase]
+
+    def compose(self, parts):
+        """
+        Path of a WAV clip of the parts spoken one after another, joined
+        from the cached fragments; None if any fragment isn't ready (the
+        missing ones are prefetched so they will be next time)
+        """
+        text = ' '.join(parts)
+        path = self.path_for(text, '.wav')
+        if os.path.exists(path):
+            return path
+        fragments = [self.fragment(part) for part in parts]
+        missing = [part for (part, fragment) in zip(parts, fragments) \
+                   if fragment is None]
+        if missing:
+            if self.backend.suffix == '.wav':
+                self.prefetch(missing)
+            return None
+        params = fragments[0][0]
+        if [fragment for fragment in fragments if fragment[0] != params]:
+            return None
+        (channels, width, rate) = params
+        gap = b'\0'*(int(rate*FRAGMENT_GAP)*channels*width)
+        part_path = '%s.%d%s' % (path, threading.current_thread().ident, \
+                                 PART_SUFFIX)
+        clip = wave.open(part_path, 'wb')
+        try:
+            clip.setnchannels(channels)
+            clip.setsampwidth(width)
+            clip.setframerate(rate)
+            clip.writeframes(gap.join([frames for (p, frames) in fragments]))
+        finally:
+            clip.close()
+        os.rename(part_path, path)
+        return path
+
+    def size(self):
+        """
+        (number of clips, bytes) in the cache
+        """
+        clips = self._clips()
+        return (len(clips), sum([size for (mtime, size, path) in clips]))
+
+    def _clips(self):
+        clips = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(CLIP_SUFFIXES):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            clips.append((stat.st_mtime, stat.st_size, path))
+        return clips
+
+    def evict(self):
+        """
+        Remove the least recently used clips until under the size cap
+        """
+        with self.lock:
+            clips = self._clips()
+            total = sum([size for (mtime, size, path) in clips])
+            clips.sort()
+            for (mtime, size, path) in clips[:-1]:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+    def prefetch(self, phrases):
+        """
+        Make the phrases that aren't cached in the background
+        """
+        for phrase in phrases:
+            with self.lock:
+                if phrase in self.pending:
+                    continue
+                if os.path.exists(self.path_for(phrase)):
+                    continue
+                self.pending.add(phrase)
+            self.requests.put(phrase)
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._work, \
+                                           name='tts-prefetch')
+            self.worker.daemon = True
+            self.worker.start()
+
+    def _work(self):
+        while True:
+            phrase = self.requests.get()
+            if phrase is None:
+                return
+            try:
+                self.fetch(phrase)
+            except (IOError, OSError):
+                self.failed += 1
+            with self.lock:
+                self.pending.discard(phrase)
+
+    def close(self):
+        if self.worker is not None:
+            self.requests.put(None)
+            self.worker = None
+        self.backend.close()
+
+def presynthesize(cache, phrases):
+    """
+    Make every phrase (and the fragments of %d templates) now
+    returns the phrases that failed
+    """
+    wanted = []
+    for phrase in phrases:
+        if '%d' in phrase:
+            wanted += template_fragments(phrase)
+        else:
+            wanted.append(phrase)
+    failed = []
+    for phrase in wanted:
+        if phrase in failed:
+            continue
+        try:
+            cache.fetch(phrase)
+        except (IOError, OSError) as error:
+            print(phrase+': '+str(error))
+            failed.append(phrase)
+    return failed
+
+def main(argv):
+    (opts, args) = getopt.getopt(argv, 'd:b:v:')
+    directory = CACHE_DIR
+    backend = 'espeak'
+    voice = 'en'
+    for (opt, value) in opts:
+        if opt == '-d':
+            directory = value
+        elif opt == '-b':
+            backend = value
+        elif opt == '-v':
+            voice = value
+    if not args or backend not in BACKENDS:
+        print('usage: raspbot_tts.py [-d cache_dir] [-b '+ \
+              '|'.join(sorted(BACKENDS.keys()))+'] [-v voice] phrases.txt')
+        return 1
+    phrases = []
+    for name in args:
+        for line in open(name):
+            if line.strip() and not line.startswith('#'):
+                phrases.append(line.strip())
+    cache = PhraseCache(directory, backend=make_backend(backend, voice))
+    failed = presynthesize(cache, phrases)
+    (clips, size) = cache.size()
+    print('%d clips, %d bytes in %s; %d failed' % \
+          (clips, size, directory, len(failed)))
+    cache.close()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
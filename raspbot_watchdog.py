@@ -0,0 +1,277 @@
+"""
+# Omron D6T sensor watchdog for the raspbot
+# GNU GPL V3
+#
+# A single bad I2C transfer used to send the robot into panic(), which
+# blinks the red LEDs until someone power cycles it. SensorWatchdog sits
+# between the robot and the sensor and keeps it running through glitches:
+#   - every frame is read raw and its PEC byte (the SMBus CRC-8 the D6T
+#     appends) is checked, so a corrupt frame is never used
+#   - a failed read is retried a few times with a short backoff
+#   - after REINIT_FRAMES failed frames in a row the pigpio I2C handle is
+#     closed and the sensor initialized again; the SMBus (and the pigpio
+#     connection, if the daemon went away) are reopened as well. Reinits
+#     back off from REINIT_DELAY up to REINIT_DELAY_MAX seconds.
+#   - only when frames have been failing for ESCALATE_SECONDS despite
+#     reinits does failed() say so, and the robot gives up
+# Counts of retries, PEC errors, short reads, I/O errors and reinits are
+# kept for the log; report() sums them up.
+#
+# A D6T-44L frame is 35 bytes: PTAT (the sensor's own temperature), the
+# 16 elements (little endian, tenths of a degree C) and the PEC.
+# read_into(frame) parses straight into a ThermalFrame (raspbot_frame.py)
+# instead of making a new list and tuple for every frame.
+
+# Feb 2015
+"""
+import time
+
+from omron_src import omron_init    # contains omron functions
+
+OMRON_ADDRESS = 0x0a        # 7 bit I2C address of the D6T-44L
+OMRON_COMMAND = 0x4c        # start a measurement and read it
+OMRON_BUFFER_LENGTH = 35
+RETRIES = 3                 # extra tries for one frame
+RETRY_DELAY = 0.005         # seconds before the first retry, then doubled
+REINIT_FRAMES = 3           # failed frames in a row before a reinit
+REINIT_DELAY = 1.0          # seconds between reinits, doubled each time
+REINIT_DELAY_MAX = 30.0
+ESCALATE_SECONDS = 120.0    # seconds of failed frames before giving up
+
+class FrameError(IOError):
+    """
+    A frame came back short or failed its PEC check
+    """
+    pass
+
+def _crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for bit in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ 0x07) & 0xff
+            else:
+                crc = (crc << 1) & 0xff
+        table.append(crc)
+    return table
+
+CRC8_TABLE = _crc8_table()
+
+def crc8(data, crc=0):
+    """
+    SMBus CRC-8 (polynomial x^8 + x^2 + x + 1) of a sequence of bytes
+    """
+    for byte in bytearray(data):
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+def d6t_pec(data, address=OMRON_ADDRESS):
+    """
+    The PEC the D6T should have sent with the 34 data bytes of a frame
+    It covers the write address, the command, the read address and data.
+    """
+    crc = CRC8_TABLE[CRC8_TABLE[CRC8_TABLE[address << 1] ^ \
+                                OMRON_COMMAND] ^ ((address << 1) | 1)]
+    if not isinstance(data, bytearray):
+        data = bytearray(data)
+    for i in range(OMRON_BUFFER_LENGTH-1):
+        crc = CRC8_TABLE[crc ^ data[i]]
+    return crc
+
+def _d6t_value(data, i, degree_unit):
+    value = data[i] | (data[i+1] << 8)
+    if value >= 0x8000:
+        value -= 0x10000
+    celsius = value/10.0
+    if degree_unit == 'F':
+        return round(9.0*celsius/5.0 + 32, 1)
+    return celsius
+
+def parse_d6t(data, degree_unit='F', out=None):
+    """
+    (16 element temperatures, sensor temperature) of a raw frame
+    With out (a list or array of 16) the temperatures are written into
+    it and only the sensor temperature is returned.
+    """
+    if not isinstance(data, bytearray):
+        data = bytearray(data)
+    if out is None:
+        out = [0.0]*((OMRON_BUFFER_LENGTH-3)//2)
+        return (out, parse_d6t(data, degree_unit, out))
+    for i in range(len(out)):
+        out[i] = _d6t_value(data, 2*i + 2, degree_unit)
+    return _d6t_value(data, 0, degree_unit)
+
+class SensorWatchdog(object):
+    """
+    Reads a D6T through glitches, reinitializing it when needed
+    connect() makes a new pigpio connection and open_bus(bus) a new
+    SMBus; without them only the I2C handle is reopened.
+    select() points a multiplexer at the sensor before every transfer;
+    deselect() is called after a failed one and before a reinit, as the
+    multiplexer may have been reset and must be pointed again.
+    """
+    def __init__(self, pi, bus, i2c_bus, address=OMRON_ADDRESS, \
+                 degree_unit='F', connect=None, open_bus=None, select=None, \
+                 deselect=None):
+        self.pi = pi
+        self.bus = bus
+        self.i2c_bus = i2c_bus
+        self.address = address
+        self.degree_unit = degree_unit
+        self.connect = connect
+        self.open_bus = open_bus
+        self.select = select         # points a multiplexer at the sensor
+        self.deselect = deselect
+        self.handle = None
+        self.result = None
+        self.frames = 0
+        self.failed_frames = 0
+        self.retries = 0
+        self.pec_errors = 0
+        self.short_reads = 0
+        self.io_errors = 0
+        self.reinits = 0
+        self.failing_since = None
+        self.failures_in_a_row = 0
+        self.next_reinit = 0.0
+        self.reinit_delay = REINIT_DELAY
+
+    def init(self):
+        """
+        Initialize the sensor; returns (handle, result) like omron_init
+        """
+        if self.select is not None:
+            self.select()
+        (self.handle, self.result) = \
+            omron_init(self.bus, self.address, self.pi, self.i2c_bus)
+        return (self.handle, self.result)
+
+    def read_frame(self):
+        """
+        One raw frame; raises FrameError if it is short or corrupt
+        """
+        if self.select is not None:
+            self.select()
+        self.pi.i2c_write_device(self.handle, [OMRON_COMMAND])
+        (count, data) = self.pi.i2c_read_device(self.handle, \
+                                                OMRON_BUFFER_LENGTH)
+        if count != OMRON_BUFFER_LENGTH:
+            self.short_reads += 1
+            raise FrameError('short read: '+str(count))
+        if not isinstance(data, bytearray):
+            data = bytearray(data)
+        if d6t_pec(data, self.address) != data[-1]:
+            self.pec_errors += 1
+            raise FrameError('PEC mismatch')
+        return data
+
+    def read(self):
+        """
+        (bytes read, temperatures, sensor temperature) like omron_read;
+        bytes read is 0 if the frame couldn't be read
+        """
+        data = self.read_data()
+        if data is None:
+            return (0, None, None)
+        (temperatures, room_temp) = parse_d6t(data, self.degree_unit)
+        return (OMRON_BUFFER_LENGTH, temperatures, room_temp)
+
+    def read_into(self, frame):
+        """
+        Read into frame's temps and ambient (raspbot_frame.py); returns
+        the bytes read, 0 if the frame couldn't be read
+        """
+        data = self.read_data()
+        if data is None:
+            return 0
+        frame.ambient = parse_d6t(data, self.degree_unit, frame.temps)
+        return OMRON_BUFFER_LENGTH
+
+    def read_data(self):
+        """
+        One checked raw frame, or None if it couldn't be read
+        """
+        self.frames += 1
+        delay = RETRY_DELAY
+        for attempt in range(RETRIES+1):
+            if attempt:
+                self.retries += 1
+                time.sleep(delay)
+                delay *= 2
+            try:
+                data = self.read_frame()
+            except FrameError:
+                self._deselect()
+                continue
+            except Exception:       # IOError, or pigpio.error from pigpio
+                self.io_errors += 1
+                self._deselect()
+                continue
+            self.failing_since = None
+            self.failures_in_a_row = 0
+            self.reinit_delay = REINIT_DELAY
+            return data
+
+        self.failed_frames += 1
+        self.failures_in_a_row += 1
+        now = time.time()
+        if self.failing_since is None:
+            self.failing_since = now
+        if self.failures_in_a_row >= REINIT_FRAMES and \
+           now >= self.next_reinit:
+            self.reinit()
+            self.next_reinit = now + self.reinit_delay
+            self.reinit_delay = min(self.reinit_delay*2, REINIT_DELAY_MAX)
+        return None
+
+    def _deselect(self):
+        if self.deselect is not None:
+            self.deselect()
+
+    def reinit(self):
+        """
+        Reopen everything between the robot and the sensor
+        """
+        self.reinits += 1
+        self._deselect()
+        try:
+            self.pi.i2c_close(self.handle)
+        except Exception:
+            pass
+        try:
+            if self.connect is not None and \
+               not getattr(self.pi, 'connected', True):
+                self.pi = self.connect()
+            if self.open_bus is not None:
+                try:
+                    self.i2c_bus.close()
+                except Exception:
+                    pass
+                self.i2c_bus = self.open_bus(self.bus)
+            self.init()
+        except Exception:
+            self.handle = None
+
+    def failed(self):
+        """
+        True when the sensor has been failing for too long to carry on
+        """
+        return self.failing_since is not None and \
+               time.time() - self.failing_since >= ESCALATE_SECONDS
+
+    def error_rate(self):
+        """
+        Fraction of frames that couldn't be read
+        """
+        if not self.frames:
+            return 0.0
+        return float(self.failed_frames)/self.frames
+
+    def report(self):
+        return 'frames %d failed %d (%.2f%%) retries %d pec %d short %d ' \
+               'io %d reinits %d' % (self.frames, self.failed_frames, \
+                                     100.0*self.error_rate(), self.retries, \
+                                     self.pec_errors, self.short_reads, \
+                                     self.io_errors, self.reinits)